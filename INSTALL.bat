@@ -1,3 +1,4 @@
 @echo off
 pip install bleak
-pip install pywin32
\ No newline at end of file
+pip install pywin32
+pip install cryptography
\ No newline at end of file
@@ -0,0 +1,436 @@
+"""
+Microbenchmarks for the hot paths of the script.
+Usage: python src/benchmark.py [name ...]  (all by default, see --help)
+Names: crypto, batch, parse, state, loop, buffer, schedule, match, compile, output, reload, ipc
+"""
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import timeit
+
+from cryptor import AES, BACKENDS, FastAES, GanCube, Cryptor
+from packet_schema import GEN2, GEN4
+
+
+MAC = 'AB:12:CD:34:EF:56'
+
+
+
+###########################        Crypto        ###########################
+def _reference_decrypt(cube: GanCube, enc: list[int]) -> list[int]:
+  # GanCube.decrypt as it was written on top of the list-based AES
+  aes, iv = AES(list(cube.key)), list(cube.iv)
+  block = aes.decrypt(enc[4:])
+  dec = [block[i] ^ iv[i] for i in range(16)]
+  block = aes.decrypt(enc[:4] + dec[:12])
+  return [block[i] ^ iv[i] for i in range(16)] + dec[12:]
+
+
+def _installed_backends() -> list[str]:
+  names = []
+  for name, factory in BACKENDS.items():
+    try:
+      factory(bytes(16), bytes(16))
+    except ImportError:
+      continue
+    names.append(name)
+  return names
+
+
+def bench_crypto(number: int = 20000) -> None:
+  cube = GanCube(MAC)
+  packet = os.urandom(20)
+  as_list = list(packet)
+  cryptor = Cryptor(MAC)
+
+  old = timeit.timeit(lambda: _reference_decrypt(cube, as_list), number=number // 10) * 10
+  new = timeit.timeit(lambda: cryptor.decrypt(packet), number=number)
+  print(f'crypto: AES decrypt         {old / number * 1e6:8.2f} us/packet')
+  print(f'crypto: Cryptor decrypt     {new / number * 1e6:8.2f} us/packet  (x{old / new:.1f}, {cryptor.backend})')
+
+  for name in _installed_backends():
+    backend = Cryptor(MAC, name)
+    cost = timeit.timeit(lambda: backend.decrypt(packet), number=number) / number
+    print(f'crypto: backend {name:13} {cost * 1e6:8.2f} us/packet')
+
+
+
+def bench_batch(count: int = 20000) -> None:
+  cryptor = Cryptor(MAC)
+  stream = os.urandom(20 * count)
+
+  try:
+    batch = cryptor.decrypt_batch(stream)
+  except ImportError:
+    print('batch: numpy is not installed, skipping')
+    return
+
+  single = timeit.timeit(lambda: [cryptor.decrypt(stream[i:i + 20]) for i in range(0, len(stream), 20)], number=1)
+  batched = timeit.timeit(lambda: cryptor.decrypt_batch(stream), number=1)
+  print(f'batch: decrypt       {single / count * 1e6:8.2f} us/packet ({cryptor.backend})')
+  print(f'batch: decrypt_batch {batched / count * 1e6:8.2f} us/packet  (x{single / batched:.1f})')
+
+
+
+###########################        Parsing       ###########################
+def _bit_string_move_gen4(data: bytes) -> str:
+  # The parser as it was written on top of a '0101...' string
+  array = ''.join(format(byte, '08b') for byte in data)
+  direction = array[64:66][1] == '1'
+  face = [1, 5, 3, 0, 4, 2][array[66:72].find('1')]
+  return ('BRDFUL'[face] + ' \''[direction]).replace(' ', '')
+
+
+def _bit_string_moves_gen2(data: bytes, count: int = 7) -> list[str | None]:
+  array = ''.join(format(byte, '08b') for byte in data)
+  ret = []
+  for i in range(count):
+    face = int(array[12 + 5 * i: 16 + 5 * i], 2)
+    direction = int(array[16 + 5 * i], 2)
+    ret.append(('URFDLB'[face] + ' \''[direction]).replace(' ', '') if face <= 5 else None)
+  return ret
+
+
+def bench_parse(number: int = 20000) -> None:
+  data = bytes.fromhex('01000000000000000220') + bytes(10)
+  old = timeit.timeit(lambda: _bit_string_move_gen4(data), number=number)
+  new = timeit.timeit(lambda: GEN4.move(data), number=number)
+  print(f'parse: Gen4 move  bit-string {old / number * 1e6:6.2f} us/packet, extractor {new / number * 1e6:6.2f} us/packet  (x{old / new:.1f})')
+
+  data = os.urandom(20)
+  old = timeit.timeit(lambda: _bit_string_moves_gen2(data), number=number)
+  new = timeit.timeit(lambda: [move(data) for move in GEN2.moves], number=number)
+  print(f'parse: Gen2 moves bit-string {old / number * 1e6:6.2f} us/packet, extractor {new / number * 1e6:6.2f} us/packet  (x{old / new:.1f})')
+
+
+
+###########################      Cube state      ###########################
+def bench_state(number: int = 100000) -> None:
+  from cube_state import CubeState
+  from move_buffer import TURN_NAMES
+
+  cube = CubeState()
+  cost = timeit.timeit(lambda: [cube.apply(move) for move in TURN_NAMES], number=number // len(TURN_NAMES))
+  print(f'state: CubeState.apply {cost / (number // len(TURN_NAMES) * len(TURN_NAMES)) * 1e6:5.2f} us/move')
+
+
+
+###########################     Key emulator     ###########################
+def _measure_loop(max_wait: float | None, spin: float, idle: float, presses: int) -> tuple[float, list[float]]:
+  """
+  Runs key_emulator.run against a sender in this thread. Keys are recorded instead of pressed
+  ret: CPU load while idle, latencies from send to keypress
+  """
+  import key_emulator
+  from bind_compiler import compile_binds
+  from key_output import RecordingOutput
+  from transport import DEFAULT_TRANSPORT, make_reader, make_sender
+
+  pressed = threading.Event()
+  class SignalingOutput(RecordingOutput):
+    def send(self, events: list[tuple[int, bool]]) -> None:
+      super().send(events)
+      if events[0][1]:
+        pressed.set()
+  output = SignalingOutput(log=False)
+
+  address = os.path.join(tempfile.gettempdir(), 'cube_bench.sock') if DEFAULT_TRANSPORT == 'unix' else '\\\\.\\pipe\\TurnsBench'
+  sender, reader = make_sender(DEFAULT_TRANSPORT, address), make_reader(DEFAULT_TRANSPORT, address)
+  binds, constants = compile_binds({('R',): [['a']]}), {'delete_mode': 'flush', 'idle_time': 10}
+  def loop() -> None:
+    reader.connect()
+    key_emulator.run(reader, binds, constants, output, max_wait, spin=spin)
+  thread = threading.Thread(target=loop, daemon=True)
+  thread.start()
+  sender.connect()
+
+  sender.send(['U'], 'BNCH')  # The emulator of the cube is created, the buffer will go idle in 10 s
+  time.sleep(0.1 + spin)
+  wall, cpu = time.perf_counter(), time.process_time()
+  time.sleep(idle)
+  load = (time.process_time() - cpu) / (time.perf_counter() - wall)
+
+  latencies = []
+  for _ in range(presses):
+    pressed.clear()
+    sent_at = time.perf_counter()
+    sender.send(['R'], 'BNCH')
+    pressed.wait(1.0)
+    latencies.append(output.events[-1][0] - sent_at)
+    time.sleep(0.15)  # Until the key is released
+
+  sender.close()
+  thread.join(1.0)
+  return load, latencies
+
+
+def bench_loop(idle: float = 2.0, presses: int = 50) -> None:
+  logging.disable(logging.CRITICAL)  # The emulator logs every move
+  from key_emulator import SPIN
+
+  for name, max_wait, spin in ('busy-poll', 0.0, 0.0), ('event-driven', None, 0.0), (f'spin {SPIN} s', None, SPIN):
+    load, latencies = _measure_loop(max_wait, spin, idle, presses)
+    latencies.sort()
+    print(f'loop: {name:12} idle CPU {load:6.1%}, move to keypress p50 {latencies[len(latencies) // 2] * 1e6:7.1f} us, '
+          f'max {latencies[-1] * 1e6:7.1f} us')
+  logging.disable(logging.NOTSET)
+
+
+
+def _reference_trim(buffer: list[str]) -> None:
+  # key_emulator.trim_buffer as it was written before MoveBuffer
+  while len(buffer) > 1 and buffer[-1][0] == buffer[-2][0]:
+    n1 = buffer[-1][1:]
+    n1 = 3 if n1 == '\'' else int(n1) if n1 != '' else 1
+    n2 = buffer[-2][1:]
+    n2 = 3 if n2 == '\'' else int(n2) if n2 != '' else 1
+    del buffer[-1]
+    sm = (n1 + n2) % 4
+    if sm == 0:   del buffer[-1]
+    elif sm == 1: buffer[-1] = buffer[-1][0]
+    elif sm == 2: buffer[-1] = buffer[-1][0] + '2'
+    else:         buffer[-1] = buffer[-1][0] + '\''
+  if len(buffer) > 100:
+    del buffer[:-100]
+    _reference_trim(buffer)
+
+
+def _linear_match(formulas: list[tuple[str]], turns: list[str]) -> tuple[str] | None:
+  # KeyEmulator._recognize as it was written before FormulaTrie
+  for formula in formulas:
+    if len(formula) <= len(turns) and turns[-len(formula):] == list(formula):
+      return formula
+  return None
+
+
+def bench_buffer(count: int = 100000) -> None:
+  import random
+  from move_buffer import MOVE_CODES, TURN_NAMES, MoveBuffer
+
+  moves = random.Random(0).choices(TURN_NAMES, k=count)
+  new = MoveBuffer(count)
+  for move in moves:
+    new.push(MOVE_CODES[move])
+  print(f'buffer: MoveBuffer reduces {count} moves to {len(new)}')
+
+  def run_old() -> None:
+    buffer = []
+    for move in moves:
+      buffer.append(move)
+      _reference_trim(buffer)
+  def run_new() -> None:
+    buffer, codes = MoveBuffer(100), MOVE_CODES
+    for move in moves:
+      buffer.push(codes[move])
+  old = timeit.timeit(run_old, number=1)
+  new = timeit.timeit(run_new, number=1)
+  print(f'buffer: list + trim_buffer {old / count * 1e6:5.2f} us/move, MoveBuffer {new / count * 1e6:5.2f} us/move  (x{old / new:.1f})')
+
+
+def _reference_press_keys(schedule: list[tuple[float, bool, int]], pressed: list[int]) -> list[tuple[float, bool, int]]:
+  # KeyEmulator.press_keys as it was written before the heap, without sending input
+  t = time.time()
+  for scheduled_to, is_to_press, key in [task for task in schedule if task[0] <= t]:
+    if not is_to_press and key not in pressed:
+      continue
+    if is_to_press and key in pressed:
+      continue
+    if is_to_press:
+      pressed.append(key)
+    else:
+      pressed.remove(key)
+  return [task for task in schedule if task[0] > t]
+
+
+def bench_schedule(holds: int = 1000, number: int = 2000) -> None:
+  import key_emulator
+  from bind_compiler import compile_binds
+  from key_output import RecordingOutput
+
+  # Long holds in flight (like W+10.0s), the loop wakes up for taps in between
+  emulator = key_emulator.KeyEmulator(compile_binds({}).for_cube(''), {'delete_mode': 'flush', 'idle_time': 10}, output=RecordingOutput(log=False))
+  emulator._create_task(tuple((10.0, (0x41 + i % 26,)) for i in range(holds)))
+  schedule = [(t, is_to_press, key) for t, _, is_to_press, key in emulator.schedule]
+  pressed = []
+  schedule = _reference_press_keys(schedule, pressed)
+  emulator.press_keys()
+
+  old = timeit.timeit(lambda: _reference_press_keys(schedule, pressed), number=number)
+  new = timeit.timeit(emulator.press_keys, number=number)
+  print(f'schedule: {len(schedule)} events pending, list {old / number * 1e6:7.2f} us/wakeup, heap {new / number * 1e6:5.2f} us/wakeup  (x{old / new:.1f})')
+
+
+def bench_match(binds: int = 2000, number: int = 2000) -> None:
+  import random
+  from bind_matcher import CompiledTrie, FormulaTrie
+  from move_buffer import MOVE_CODES, MOVE_NAMES, TURN_NAMES, MoveBuffer
+
+  def buffer(moves: list[str]) -> MoveBuffer:
+    ret = MoveBuffer(100)
+    for move in moves:
+      ret.push(MOVE_CODES[move])
+    return ret
+
+  rnd = random.Random(0)
+  trie = FormulaTrie(tuple(rnd.choices(TURN_NAMES, k=rnd.randint(2, 8))) for _ in range(binds))
+  formulas = [tuple(MOVE_NAMES[code] for code in codes) for codes in trie.codes.values()]  # Canonical, without the ones that can't be recognized
+  buffers = [buffer(rnd.choices(TURN_NAMES, k=20)) for _ in range(number)]
+  lists = [turns.names() for turns in buffers]
+
+  for count in 10, 100, len(formulas):
+    subset = formulas[:count]
+    trie = CompiledTrie.from_trie(FormulaTrie(subset))
+    old = timeit.timeit(lambda: [_linear_match(subset, turns) for turns in lists], number=1)
+    new = timeit.timeit(lambda: [trie.match(turns) for turns in buffers], number=1)
+    print(f'match: {count:5} binds  linear {old / number * 1e6:7.2f} us/move, trie {new / number * 1e6:5.2f} us/move  (x{old / new:.1f})')
+
+
+
+def bench_compile(binds: int = 100000) -> None:
+  import random
+  import shutil
+  from bind_compiler import load_binds
+  from move_buffer import TURN_NAMES
+
+  rnd = random.Random(0)
+  keys = ['W+10.0s', 'ctrl+S', 'space', 'lmb', 'alt+tab', 'F5']
+  lines = [f'{" ".join(rnd.choices(TURN_NAMES, k=rnd.randint(4, 10)))} - {rnd.choice(keys)}' for _ in range(binds)]
+  directory = tempfile.mkdtemp()
+  path, cache_dir = os.path.join(directory, 'binds.txt'), os.path.join(directory, 'cache')
+  with open(path, 'w') as file:
+    file.write('\n'.join(lines))
+
+  logging.disable(logging.WARNING)  # Random formulas shadow each other a lot
+  try:
+    start = time.perf_counter()
+    load_binds(path, cache_dir=None)
+    cold = time.perf_counter() - start
+    load_binds(path, cache_dir)  # Fills the cache
+    start = time.perf_counter()
+    compiled, _ = load_binds(path, cache_dir)
+    warm = time.perf_counter() - start
+  finally:
+    logging.disable(logging.NOTSET)
+    shutil.rmtree(directory)
+  print(f'compile: {compiled.count} binds  parse and compile {cold * 1e3:7.1f} ms, from the cache {warm * 1e3:5.1f} ms  (x{cold / warm:.0f})')
+
+
+
+def bench_output(moves: int = 20000) -> None:
+  from bind_compiler import compile_binds
+  from key_emulator import BindDispatcher
+  from key_output import RecordingOutput
+
+  logging.disable(logging.CRITICAL)  # The dispatcher logs every move
+  output = RecordingOutput(log=False)
+  dispatcher = BindDispatcher(compile_binds({('R',): [['ctrl', 'shift', 'S']]}), {'delete_mode': 'flush', 'idle_time': 0}, output)
+  latencies = []
+  for _ in range(moves):
+    start = time.perf_counter()
+    dispatcher.handle_moves('BNCH', ['R'])
+    dispatcher.press_keys()
+    latencies.append(output.events[-1][0] - start)
+    dispatcher.emulators['BNCH'].schedule.clear()  # Releases would overlap the next press
+    dispatcher.pressed.clear()
+  logging.disable(logging.NOTSET)
+
+  latencies.sort()
+  print(f'output: ctrl+shift+S x{moves}  {output.batches} batches of {len(output.events) // output.batches} keys (a call per key before), '
+        f'move to keypress p50 {latencies[len(latencies) // 2] * 1e6:5.1f} us, max {latencies[-1] * 1e6:6.1f} us')
+
+
+def bench_reload(number: int = 2000) -> None:
+  from bind_compiler import load_binds
+  from key_emulator import BindDispatcher
+  from key_output import RecordingOutput
+
+  path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'binds.txt')
+  logging.disable(logging.CRITICAL)
+  start = time.perf_counter()
+  binds, constants = load_binds(path, cache_dir=None)
+  compile_time = time.perf_counter() - start
+
+  dispatcher = BindDispatcher(binds, constants, RecordingOutput(log=False))
+  for cube_id in ('CB01', 'CB02', 'CB03', 'CB04'):
+    dispatcher.handle_moves(cube_id, ['R2'])
+  swap = timeit.timeit(lambda: dispatcher.reload(binds, constants), number=number)
+  logging.disable(logging.NOTSET)
+  print(f'reload: binds.txt ({binds.count} binds) compiled in {compile_time * 1e3:.2f} ms, '
+        f'swapped for 4 cubes in {swap / number * 1e6:.1f} us (a restart reconnects the cube in 5-10 s)')
+
+
+
+###########################     Transports      ###########################
+def _ipc_reader(transport: str, address, options: dict) -> None:
+  # Runs in a separate interpreter, like key_emulator.py. Frames carry time.perf_counter()
+  # of the sender (a system-wide clock). Prints the latencies as JSON
+  from transport import make_reader
+
+  reader = make_reader(transport, address, **options)
+  reader.connect()
+  latencies = []
+  while (frames := reader.read(None)) is not False:
+    now = time.perf_counter()
+    latencies += [now - frame.timestamp for frame in frames or ()]
+  reader.close()
+  print(json.dumps(latencies))
+
+
+def bench_ipc(count: int = 2000, interval: float = 0.001) -> None:
+  from transport import DEFAULT_ADDRESSES, DEFAULT_TRANSPORT, make_sender
+
+  runs = [
+    (DEFAULT_TRANSPORT, DEFAULT_ADDRESSES[DEFAULT_TRANSPORT] + '_bench', {}),
+    ('mp', ('localhost', 6547), {}),
+    ('shm', 'cube_turns_bench', {}),
+    ('shm', 'cube_turns_bench', {'spin': 10 * interval}),  # Never sleeps between moves
+  ]
+  for transport, address, options in runs:
+    code = f'import benchmark; benchmark._ipc_reader({transport!r}, {address!r}, {options!r})'
+    process = subprocess.Popen([sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__)), stdout=subprocess.PIPE)
+    sender = make_sender(transport, address)
+    sender.connect()
+    time.sleep(0.2)
+
+    for _ in range(count):
+      sender.send(['R'], 'BNCH', time.perf_counter())
+      time.sleep(interval)
+    sender.close()
+    latencies = sorted(json.loads(process.communicate()[0]))
+    name = transport + ''.join(f' {key}={value}' for key, value in options.items())
+    print(f'ipc: {name:14} {len(latencies)}/{count} frames, send to read p50 {latencies[len(latencies) // 2] * 1e6:7.1f} us, '
+          f'p99 {latencies[len(latencies) * 99 // 100] * 1e6:7.1f} us')
+
+
+
+BENCHMARKS = {
+  'crypto': bench_crypto,
+  'batch': bench_batch,
+  'parse': bench_parse,
+  'state': bench_state,
+  'loop': bench_loop,
+  'buffer': bench_buffer,
+  'schedule': bench_schedule,
+  'match': bench_match,
+  'compile': bench_compile,
+  'output': bench_output,
+  'reload': bench_reload,
+  'ipc': bench_ipc,
+}
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Run microbenchmarks.')
+  parser.add_argument('names', nargs='*', help=f'any of: {", ".join(BENCHMARKS)} (default: all)')
+  args = parser.parse_args()
+
+  for name in args.names or BENCHMARKS:
+    if name not in BENCHMARKS:
+      parser.error(f'unknown benchmark: {name}')
+    BENCHMARKS[name]()
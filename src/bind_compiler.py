@@ -0,0 +1,255 @@
+"""
+Ahead-of-time compilation of binds.txt. Keys of every bind are resolved once into
+immutable tuples of (hold time, key codes), and the formulas of every cube scope into a
+CompiledTrie, so recognizing a formula and pressing its keys handles no strings.
+The compiled binds are cached in CACHE_DIR under the hash of binds.txt and of the modules
+that decide what it compiles to (key codes, parsing, matching): the next start with the
+same file loads flat arrays instead of parsing it, and replays the warnings of the parse.
+BindWatcher compiles the file again in a thread whenever it's saved.
+"""
+import hashlib
+import logging
+import marshal
+import os
+import sys
+import threading
+from typing import Callable
+
+import bind_matcher, bind_reader, key_codes, move_buffer
+from bind_matcher import CompiledTrie, FormulaTrie, shadow_warnings
+from bind_reader import binds_for_cube, parse_binds
+from cube_state import SOLVED_FACELETS, STATE_PREFIX
+from key_codes import resolve_comb
+
+
+logger = logging.getLogger('Bind_Compiler')
+
+CACHE_DIR = '.binds_cache'
+CACHE_VERSION = 2  # Bump when the compiled format changes
+# marshal and array bytes depend on the interpreter and the machine
+CACHE_TAG = f'{CACHE_VERSION} {sys.version_info[0]}.{sys.version_info[1]} {sys.byteorder}'.encode()
+CACHE_MODULES = (bind_reader, key_codes, move_buffer, bind_matcher)  # Their source is a part of the cache key
+
+Action = tuple[tuple[float, tuple[int, ...]], ...]  # (hold time, key codes) of every combination of a bind
+
+
+
+class BindTable:
+  """
+  Compiled binds of one cube
+  """
+  def __init__(self, trie: CompiledTrie, actions: list[Action], state_binds: dict[str, Action]):
+    self.trie = trie
+    self.actions = actions  # By formula index of the trie
+    self.state_binds = state_binds  # 'SOLVED' or 54 facelets with '?' -> action
+
+
+
+class CompiledBinds:
+  def __init__(self, tables: dict[str, BindTable], count: int, warnings: list[str]):
+    self.tables = tables  # '' for cubes without scoped binds, else the cube id
+    self.count = count  # Binds in the source
+    self.warnings = warnings
+
+
+  def for_cube(self, cube_id: str) -> BindTable:
+    return self.tables.get(cube_id.upper(), self.tables[''])
+
+
+
+def compile_binds(binds: dict[tuple[str], list[list[str]]]) -> CompiledBinds:
+  """
+  binds: as parsed by bind_reader
+  """
+  actions: dict[tuple, Action] = {}  # Equal keys share one action (and one object in the cache)
+  def action(keys: list[list[str]]) -> Action:
+    text = tuple(tuple(comb) for comb in keys)
+    if text not in actions:
+      actions[text] = tuple(resolve_comb(comb) for comb in keys)
+    return actions[text]
+
+  warnings = []
+  reported = set()
+  tables = {}
+  # Every cube gets unscoped binds and its own ones
+  scopes = {formula[0][1:-1].upper() for formula in binds if formula and formula[0].startswith('[') and formula[0].endswith(']')}
+  for cube_id in [''] + sorted(scopes):
+    cube_binds = binds_for_cube(binds, cube_id)
+    formulas = {formula: keys for formula, keys in cube_binds.items() if formula and not formula[0].startswith(STATE_PREFIX)}
+
+    # State binds: '@SOLVED' or '@<54 facelets>' -> keys
+    state_binds = {}
+    for formula, keys in cube_binds.items():
+      if not formula or not formula[0].startswith(STATE_PREFIX):
+        continue
+      pattern = formula[0][len(STATE_PREFIX):].upper()
+      if len(formula) != 1 or (pattern != 'SOLVED' and (len(pattern) != len(SOLVED_FACELETS) or set(pattern) - set('URFDLB?'))):
+        if formula not in reported:
+          reported.add(formula)
+          warnings.append(f'Invalid cube state pattern: {" ".join(formula)}')
+        continue
+      state_binds[pattern] = action(keys)
+
+    trie = FormulaTrie(formulas)
+    warnings += shadow_warnings(trie, cube_id, reported)
+    tables[cube_id] = BindTable(CompiledTrie.from_trie(trie), [action(formulas[formula]) for formula in trie.formulas], state_binds)
+
+  return CompiledBinds(tables, len(binds), warnings)
+
+
+def load_binds(path: str = 'binds.txt', cache_dir: str | None = CACHE_DIR) -> tuple[CompiledBinds, dict[str, any]]:
+  """
+  Compiled binds of `path`, from the cache if it was compiled before
+  cache_dir: None not to use the cache
+  ret: compiled binds, constants (see bind_reader.upload_binds)
+  """
+  with open(path, 'rb') as file:
+    source = file.read()
+  cache_path = None
+  if cache_dir is not None:
+    cache_path = os.path.join(cache_dir, hashlib.sha256(CACHE_TAG + _modules_digest() + source).hexdigest()[:16] + '.bin')
+    if (cached := _read_cache(cache_path)) is not None:
+      compiled, constants, parse_warnings = cached
+      logger.info(f'Loaded {compiled.count} compiled binds from {cache_path}')
+      for name, warning in parse_warnings:
+        logging.getLogger(name).warning(warning)
+      for warning in compiled.warnings:
+        logger.warning(warning)
+      return compiled, constants
+
+  with _WarningCapture(bind_reader.logger, key_codes.logger) as capture:  # Logged as they come, and kept for the cache
+    binds, constants = parse_binds(source.decode())
+    compiled = compile_binds(binds)
+  for warning in compiled.warnings:
+    logger.warning(warning)
+  if cache_path is not None:
+    _write_cache(cache_path, compiled, constants, capture.warnings)
+  return compiled, constants
+
+
+_digest: bytes | None = None  # Of CACHE_MODULES, read once
+
+
+def _modules_digest() -> bytes:
+  global _digest
+  if _digest is None:
+    digest = hashlib.sha256()
+    for module in CACHE_MODULES:
+      with open(module.__file__, 'rb') as file:
+        digest.update(file.read())
+    _digest = digest.digest()
+  return _digest
+
+
+
+class _WarningCapture(logging.Handler):
+  """
+  Collects the warnings that `loggers` log in this thread (not in a BindWatcher compiling meanwhile)
+  """
+  def __init__(self, *loggers: logging.Logger):
+    super().__init__(logging.WARNING)
+    self.loggers = loggers
+    self.thread = threading.get_ident()
+    self.warnings: list[tuple[str, str]] = []  # (logger name, message)
+
+
+  def emit(self, record: logging.LogRecord) -> None:
+    if record.thread == self.thread:
+      self.warnings.append((record.name, record.getMessage()))
+
+
+  def __enter__(self) -> '_WarningCapture':
+    for item in self.loggers:
+      item.addHandler(self)
+    return self
+
+
+  def __exit__(self, *exc_info) -> None:
+    for item in self.loggers:
+      item.removeHandler(self)
+
+
+
+def _write_cache(path: str, compiled: CompiledBinds, constants: dict[str, any], parse_warnings: list[tuple[str, str]]) -> None:
+  tables = {cube_id: (table.trie.to_bytes(), table.actions, table.state_binds) for cube_id, table in compiled.tables.items()}
+  try:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'wb') as file:
+      marshal.dump((CACHE_TAG, tables, compiled.count, compiled.warnings, constants, parse_warnings), file)
+    os.replace(path + '.tmp', path)  # Another process never reads a half-written cache
+  except OSError as e:
+    logger.warning(f'Cannot write the bind cache {path}: {e}')
+
+
+def _read_cache(path: str) -> tuple[CompiledBinds, dict[str, any], list[tuple[str, str]]] | None:
+  """
+  ret: compiled binds, constants, warnings of parsing as (logger name, message)
+  """
+  try:
+    with open(path, 'rb') as file:
+      tag, tables, count, warnings, constants, parse_warnings = marshal.load(file)
+  except FileNotFoundError:
+    return None
+  except (OSError, EOFError, ValueError, TypeError) as e:
+    logger.warning(f'Ignoring the broken bind cache {path}: {e}')
+    return None
+  if tag != CACHE_TAG:
+    return None
+
+  tables = {cube_id: BindTable(CompiledTrie.from_bytes(trie), actions, state_binds)
+            for cube_id, (trie, actions, state_binds) in tables.items()}
+  return CompiledBinds(tables, count, warnings), constants, parse_warnings
+
+
+
+class BindWatcher:
+  """
+  Checks the modification time of binds.txt and compiles it again in a thread when it
+  changes. The owner swaps the binds in on_reload, which is called from that thread
+  """
+  def __init__(self, path: str, on_reload: Callable[[CompiledBinds, dict[str, any]], None],
+               interval: float = 0.5, cache_dir: str | None = CACHE_DIR):
+    """
+    interval: seconds between checks
+    """
+    self.path = path
+    self.on_reload = on_reload
+    self.interval = interval
+    self.cache_dir = cache_dir
+    self._stamp = self._read_stamp()
+    self._stopped = threading.Event()
+    self._thread = threading.Thread(target=self._run, name='BindWatcher', daemon=True)
+
+
+  def start(self) -> None:
+    self._thread.start()
+
+
+  def stop(self) -> None:
+    self._stopped.set()
+    if self._thread.is_alive():
+      self._thread.join()
+
+
+  def _read_stamp(self) -> tuple[int, int] | None:
+    try:
+      stat = os.stat(self.path)
+    except OSError:  # Being replaced by the editor
+      return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+  def _run(self) -> None:
+    while not self._stopped.wait(self.interval):
+      stamp = self._read_stamp()
+      if stamp is None or stamp == self._stamp:
+        continue
+      self._stamp = stamp
+
+      logger.info(f'{self.path} has changed. Compiling it...')
+      try:
+        binds, constants = load_binds(self.path, self.cache_dir)
+      except (OSError, ValueError, IndexError) as e:  # Saved half-written or with a broken line
+        logger.warning(f'Cannot load {self.path}: {e!r}. Keeping the old binds')
+        continue
+      self.on_reload(binds, constants)
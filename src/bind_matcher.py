@@ -0,0 +1,201 @@
+"""
+Recognition of formulas at the end of the move buffer. Formulas are stored reversed in a
+trie, so walking the buffer backwards from the last move finds every formula it ends with.
+A move costs at most the length of the longest formula, whatever the number of binds.
+Moves are the codes of move_buffer.py, and formulas are reduced to the canonical form of
+the buffer, so a bind also matches every order of commuting turns.
+
+FormulaTrie builds the trie and checks the formulas, CompiledTrie packs it into flat arrays
+(a double-array trie) that match quickly and load from the bind cache without parsing.
+"""
+import logging
+from array import array
+
+from move_buffer import MOVE_CODES, MoveBuffer, canonical
+
+
+logger = logging.getLogger('Bind_Matcher')
+END = None  # Key of a trie node that ends a formula, the value is the index of the formula
+MAX_WARNINGS = 20  # Of one kind for one set of binds, generated sets can have millions
+PACK_WINDOW = 512  # Positions before the end of the double array searched for room for a node
+
+
+
+class FormulaTrie:
+  def __init__(self, formulas):
+    """
+    formulas: iterable of formulas (tuples of moves). The earlier formula wins when several match
+    """
+    self.formulas: list[tuple[str]] = []
+    self.codes: dict[tuple[str], tuple[int]] = {}  # Canonical form of every formula, in the order of self.formulas
+    self.skipped: list[tuple[tuple[str], str]] = []  # (formula, reason) of formulas that can never be recognized
+    self.root: dict = {}
+    self.depth = 0  # Longest formula
+
+    for formula in formulas:
+      if not formula:
+        continue
+      if any(move not in MOVE_CODES for move in formula):
+        self.skipped.append((tuple(formula), 'has moves other than face turns'))
+        continue
+      codes = canonical(MOVE_CODES[move] for move in formula)
+      if not codes:
+        self.skipped.append((tuple(formula), 'cancels out'))
+        continue
+
+      node = self.root
+      for code in reversed(codes):
+        node = node.setdefault(code, {})
+      if END in node:  # The first one wins anyway
+        if self.formulas[node[END]] != tuple(formula):
+          self.skipped.append((tuple(formula), f'is the same as "{" ".join(self.formulas[node[END]])}" listed before it'))
+        continue
+      node[END] = len(self.formulas)
+      self.formulas.append(tuple(formula))
+      self.codes[tuple(formula)] = codes
+      self.depth = max(self.depth, len(codes))
+
+
+  def shadows(self) -> list[tuple[tuple[str], tuple[str], bool]]:
+    """
+    Formulas that keep others from being recognized: one found inside another is recognized
+    before the longer formula is done, one ending another and listed before it always wins
+    ret: list of (shorter formula, longer formula, True if found before the end of the longer one)
+    """
+    ret = []
+    for index, (formula, codes) in enumerate(self.codes.items()):
+      found = set()
+      for end in range(1, len(codes) + 1):  # Every prefix of the formula, as the buffer while doing it
+        node = self.root
+        for code in reversed(codes[:end]):
+          if (node := node.get(code)) is None:
+            break
+          other = node.get(END)
+          if other is None or other == index or other in found:
+            continue
+          inside = end < len(codes)
+          if inside or other < index:
+            found.add(other)
+            ret.append((self.formulas[other], formula, inside))
+    return ret
+
+
+
+class CompiledTrie:
+  """
+  FormulaTrie as a double array: the child of node `n` by move `code` is `base[n] + code`
+  if `check[base[n] + code] == n`. Nodes are positions in the arrays, the root is 0
+  """
+  def __init__(self, base: array, check: array, ends: array, lengths: array):
+    self.base = base
+    self.check = check
+    self.ends = ends  # Index of the formula ending at the node + 1, 0 for none
+    self.lengths = lengths  # Canonical length of every formula
+
+
+  @classmethod
+  def from_trie(cls, trie: FormulaTrie) -> 'CompiledTrie':
+    base, check, ends = array('i', [0]), array('i', [-1]), array('i', [0])
+    used = bytearray(b'\1')  # Position 0 is the root
+
+    queue = [(trie.root, 0)]
+    for node, position in queue:  # Breadth first: positions are assigned as the queue grows
+      if END in node:
+        ends[position] = node[END] + 1
+      moves = sorted(code for code in node if code is not END)
+      if not moves:
+        continue
+
+      # First free position that fits all children, not far from the end: holes further back
+      # are mostly too small and scanning them every time makes the build quadratic
+      free = max(1, len(used) - PACK_WINDOW)
+      while True:
+        found = used.find(0, free)
+        free = found if found >= 0 else max(free, len(used))  # Past the end all is free
+        offset = free - moves[0]
+        if offset >= 0:
+          if len(used) < offset + 24:
+            grow = offset + 24 - len(used)
+            used.extend(bytes(grow))
+            base.extend([0] * grow)
+            check.extend([-1] * grow)
+            ends.extend([0] * grow)
+          if not any(used[offset + code] for code in moves):
+            break
+        free += 1
+
+      base[position] = offset
+      for code in moves:
+        used[offset + code] = 1
+        check[offset + code] = position
+        queue.append((node[code], offset + code))
+
+    # Every lookup base[n] + code stays in the arrays
+    grow = max(base) + 24 - len(base)
+    if grow > 0:
+      base.extend([0] * grow)
+      check.extend([-1] * grow)
+      ends.extend([0] * grow)
+    return cls(base, check, ends, array('H', [len(codes) for codes in trie.codes.values()]))
+
+
+  def match(self, buffer: MoveBuffer, skip_last: bool = False, min_length: int = 1) -> int:
+    """
+    skip_last: match the buffer without its last code (see MoveBuffer.behind)
+    min_length: skip formulas shorter than that
+    ret: index of the first formula (in the order of FormulaTrie.formulas) whose canonical
+      form `buffer` ends with, -1 if there is none
+    """
+    base, check, ends = self.base, self.check, self.ends
+    node, best, codes, end = 0, 0, buffer.codes, buffer.end - skip_last
+    longest = end - min_length  # Index where formulas of min_length start
+    for i in range(end - 1, end - 1 - buffer.length + skip_last, -1):  # reversed(buffer) without a generator
+      child = base[node] + codes[i]
+      if check[child] != node:
+        break
+      node = child
+      if (index := ends[node]) and (not best or index < best) and i <= longest:
+        best = index
+    return best - 1
+
+
+  def to_bytes(self) -> tuple[bytes, bytes, bytes, bytes]:
+    return self.base.tobytes(), self.check.tobytes(), self.ends.tobytes(), self.lengths.tobytes()
+
+
+  @classmethod
+  def from_bytes(cls, data: tuple[bytes, bytes, bytes, bytes]) -> 'CompiledTrie':
+    arrays = [array('i'), array('i'), array('i'), array('H')]
+    for values, raw in zip(arrays, data):
+      values.frombytes(raw)
+    return cls(*arrays)
+
+
+
+def shadow_warnings(trie: FormulaTrie, cube_id: str = '', reported: set | None = None) -> list[str]:
+  """
+  Warnings about formulas that can't be recognized or are shadowed by another (see FormulaTrie.shadows)
+  cube_id: scope of the formulas, for the warnings
+  reported: formulas and pairs (shorter, longer) already warned about, to skip. New ones are added
+  """
+  reported = set() if reported is None else reported
+  scope = f' (binds of cube {cube_id})' if cube_id else ''
+  ret = []
+
+  skipped = [(formula, reason) for formula, reason in trie.skipped if formula not in reported]
+  for formula, reason in skipped[:MAX_WARNINGS]:
+    ret.append(f'"{" ".join(formula)}" {reason}, so it is never recognized{scope}')
+  if len(skipped) > MAX_WARNINGS:
+    ret.append(f'...and {len(skipped) - MAX_WARNINGS} more formulas that are never recognized{scope}')
+  reported.update(formula for formula, _ in skipped)
+
+  shadows = [(short, long, inside) for short, long, inside in trie.shadows() if (short, long) not in reported]
+  for short, long, inside in shadows[:MAX_WARNINGS]:
+    if inside:
+      ret.append(f'"{" ".join(short)}" is inside "{" ".join(long)}" and will be recognized before it is done{scope}')
+    else:
+      ret.append(f'"{" ".join(long)}" ends with "{" ".join(short)}" listed before it, so it is never recognized{scope}')
+  if len(shadows) > MAX_WARNINGS:
+    ret.append(f'...and {len(shadows) - MAX_WARNINGS} more formulas shadowed by others{scope}')
+  reported.update((short, long) for short, long, _ in shadows)
+  return ret
@@ -3,61 +3,84 @@ import logging
 
 logger = logging.getLogger('Bind_Uploader')
 
-def upload_binds() -> tuple[ dict[tuple[str], list[list[str]]], dict[str, any] ]:
+def upload_binds(path: str = 'binds.txt') -> tuple[ dict[tuple[str], list[list[str]]], dict[str, any] ]:
   """
   loads binds from binds.txt
   ret: dict[<formula>, [<key bind>, ...]], dict{'delete_mode': 'flush/postfix/keep', 'idle_time': float}
   """
+  with open(path) as file:
+    return parse_binds(file.read())
+
+
+def parse_binds(binds: str) -> tuple[ dict[tuple[str], list[list[str]]], dict[str, any] ]:
+  """
+  binds: text of binds.txt
+  ret: see upload_binds
+  """
   ret: dict[tuple[str], str] = {}
   constants = {'delete_mode': 'flush', 'idle_time': 10}
-  with open('binds.txt') as file:
-    binds = file.read()
+  for bind in binds.split('\n'):
+    # Empty line check
+    if bind.strip() == '':
+      continue
 
-    for bind in binds.split('\n'):
-      # Empty line check
+    # Deleting comments
+    if bind.count('#') > 0:
+      bind = bind[:bind.find('#')]
       if bind.strip() == '':
         continue
+    
+    # Commands
+    if bind[0] == '!':
+      if len(bind[1:].strip().split()) != 2:
+        logger.warning(f'Not valid setting line: "{bind}"')
+
+      name, value = bind[1:].strip().split()
+      name = name.casefold()
+      value = value.casefold()
 
-      # Deleting comments
-      if bind.count('#') > 0:
-        bind = bind[:bind.find('#')]
-        if bind.strip() == '':
-          continue
+      if name == 'deletion':
+        if value not in ['keep', 'postfix', 'flush']:
+          logger.warning(f'Not valid delete_mode: "{bind}"')
+        else: constants['delete_mode'] = value
       
-      # Commands
-      if bind[0] == '!':
-        if len(bind[1:].strip().split()) != 2:
-          logger.warning(f'Not valid setting line: "{bind}"')
-
-        name, value = bind[1:].strip().split()
-        name = name.casefold()
-        value = value.casefold()
-
-        if name == 'deletion':
-          if value not in ['keep', 'postfix', 'flush']:
-            logger.warning(f'Not valid delete_mode: "{bind}"')
-          else: constants[name] = value
-        
-        elif name == 'idle_time':
-          try:
-            value = float(value)
-            constants[name] = value
-          except ValueError:
-            logger.warning(f'Not valid idle_time: "{bind}"')
+      elif name == 'idle_time':
+        try:
+          value = float(value)
+          constants[name] = value
+        except ValueError:
+          logger.warning(f'Not valid idle_time: "{bind}"')
 
-        continue
+      continue
+    
+    # Regular binds
+    if bind.count('-') != 1:
+      logger.warning(f'Unreadable bind: "{bind}"')
       
-      # Regular binds
-      if bind.count('-') != 1:
-        logger.warning(f'Unreadable bind: "{bind}"')
-        
-      bind = bind.split('-')
-      formula: list[str] = bind[0].strip().split()  # example: ['L', 'R\'', 'U2']
-      keys_list: list[str] = bind[1].strip().split()  # ['ctrl+U', '0.5s', 'alt+tab']
-      keys_list = [comb.split('+') for comb in keys_list]  # [['ctrl', 'U'], ['0.5s'], ['alt', 'tab']]
-
-      ret[tuple(formula)] = keys_list
-  
-  ret_repr = '\n'.join([repr(bind) for bind in ret.items()])
-  logger.info(f'Readed binds:\n{ret_repr}')
+    bind = bind.split('-')
+    formula: list[str] = bind[0].strip().split()  # example: ['L', 'R\'', 'U2']
+    keys_list: list[str] = bind[1].strip().split()  # ['ctrl+U', '0.5s', 'alt+tab']
+    keys_list = [comb.split('+') for comb in keys_list]  # [['ctrl', 'U'], ['0.5s'], ['alt', 'tab']]
+
+    ret[tuple(formula)] = keys_list
+
+  logger.info(f'Readed {len(ret)} binds')
+  if logger.isEnabledFor(logging.DEBUG):  # Generated bind sets are huge
+    ret_repr = '\n'.join([repr(bind) for bind in ret.items()])
+    logger.debug(f'Binds:\n{ret_repr}')
   return ret, constants
+
+
+def binds_for_cube(binds: dict[tuple[str], list[list[str]]], cube_id: str) -> dict[tuple[str], list[list[str]]]:
+  """
+  Picks binds for one cube: ones without scope and ones starting with `[<cube_id>]` (the scope is removed).
+  A scoped bind overrides an unscoped one with the same formula
+  """
+  ret = {}
+  for formula, keys in binds.items():
+    if formula and formula[0].startswith('[') and formula[0].endswith(']'):
+      if formula[0][1:-1].upper() == cube_id.upper():
+        ret[formula[1:]] = keys
+    else:
+      ret.setdefault(formula, keys)
+  return ret
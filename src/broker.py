@@ -0,0 +1,204 @@
+"""
+Fan-out of the move stream: the controller publishes every frame once, and any number
+of subscribers (key emulators, loggers, overlays) attach and detach at any time.
+Subscribers connect like to the 'unix' transport (TCP on localhost on Windows) and read
+with SocketReader. A new subscriber first gets the current state of every cube.
+
+Every subscriber has its own bounded queue. A frame is written straight to the socket
+when nothing is queued for it, otherwise the writer thread of the subscriber sends it
+later, so a slow subscriber never delays the others. When its queue is full, the oldest
+frame is dropped ('drop_oldest') or the subscriber is disconnected ('disconnect').
+"""
+import collections
+import logging
+import os
+import select
+import socket
+import threading
+
+from cube_state import CubeState, STATE_PREFIX
+from transport import FrameEncoder
+
+
+POLICIES = ('drop_oldest', 'disconnect')
+
+
+
+class Subscriber:
+  def __init__(self, sock: socket.socket, name: str, maxsize: int, policy: str):
+    self.logger = logging.getLogger(f'Broker.{name}')
+    self.sock = sock
+    self.sock.setblocking(False)
+    self.name = name
+    self.maxsize = maxsize
+    self.policy = policy
+
+    self.lock = threading.Lock()
+    self.queue: collections.deque[bytes] = collections.deque()
+    self.pending = b''  # Unsent rest of a frame, never dropped: the stream would be cut
+    self.wakeup = threading.Event()
+    self.closed = False
+    self.dropped = 0
+
+    self.thread = threading.Thread(target=self._run, name=f'Subscriber {name}', daemon=True)
+    self.thread.start()
+
+
+  def push(self, frame: bytes) -> bool:
+    """
+    ret: False if the subscriber is gone
+    """
+    with self.lock:
+      if self.closed:
+        return False
+
+      if not self.queue and not self.pending:  # Fast path: no thread hop
+        try:
+          sent = self.sock.send(frame)
+        except BlockingIOError:
+          sent = 0
+        except OSError as e:
+          self._close(f'write failed ({e})')
+          return False
+        if sent < len(frame):
+          self.pending = frame[sent:]
+          self.wakeup.set()
+        return True
+
+      if len(self.queue) >= self.maxsize:
+        if self.policy == 'disconnect':
+          self._close('too slow')
+          return False
+        self.queue.popleft()
+        self.dropped += 1
+        if self.dropped & (self.dropped - 1) == 0:  # 1, 2, 4, 8... not to flood the log
+          self.logger.warning(f'Too slow, {self.dropped} frames dropped so far')
+      self.queue.append(frame)
+      self.wakeup.set()
+      return True
+
+
+  def close(self) -> None:
+    with self.lock:
+      self._close('broker closed')
+
+
+  def _run(self) -> None:
+    while True:
+      self.wakeup.wait()
+      self.wakeup.clear()
+      while True:
+        with self.lock:
+          if self.closed:
+            return
+          if not self.pending:
+            if not self.queue:
+              break
+            self.pending = self.queue.popleft()
+
+        select.select([], [self.sock], [], 1.0)  # Outside the lock: push() must never wait for this
+        with self.lock:
+          if self.closed:
+            return
+          try:
+            self.pending = self.pending[self.sock.send(self.pending):]
+          except BlockingIOError:
+            pass
+          except OSError as e:
+            self._close(f'write failed ({e})')
+            return
+
+
+  def _close(self, reason: str) -> None:
+    if self.closed:
+      return
+    self.closed = True
+    self.sock.close()
+    self.wakeup.set()
+    self.logger.info(f'Detached: {reason}. {self.dropped} frames dropped')
+
+
+
+class BrokerSender:
+  """
+  Sender side of the 'broker' transport. connect() doesn't wait for subscribers
+  """
+  def __init__(self, address, maxsize: int = 256, policy: str = 'drop_oldest'):
+    """
+    address: socket path, or (host, port) for TCP
+    maxsize: frames queued for one subscriber at most
+    policy: what to do with a subscriber whose queue is full, see POLICIES
+    """
+    if policy not in POLICIES:
+      raise ValueError(f'Unknown slow subscriber policy: {policy}')
+    self.address = address
+    self.maxsize = maxsize
+    self.policy = policy
+
+    self.server: socket.socket | None = None
+    self.encoder = FrameEncoder()
+    self.lock = threading.Lock()  # Frames go to every subscriber in the same order
+    self.subscribers: list[Subscriber] = []
+    self.cubes: dict[str, CubeState] = {}  # Replayed to new subscribers
+    self.attached = 0
+
+    self.logger = logging.getLogger('Broker')
+
+
+  def connect(self) -> None:
+    if isinstance(self.address, tuple):
+      self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+      self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    else:
+      self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+      if os.path.exists(self.address):  # Left by a previous run
+        os.unlink(self.address)
+    self.server.bind(self.address)
+    self.server.listen()
+    threading.Thread(target=self._accept, name='Broker', daemon=True).start()
+    self.logger.info(f'Publishing moves on {self.address}.')
+
+
+  def send(self, moves: list[str], cube_id: str = '', timestamp: float | None = None) -> None:
+    with self.lock:
+      if moves and moves[0].startswith(STATE_PREFIX):
+        self.cubes[cube_id] = CubeState.from_hex(moves[0][len(STATE_PREFIX):])
+      else:
+        cube = self.cubes.setdefault(cube_id, CubeState())
+        for move in moves:
+          cube.apply(move)
+
+      frame = self.encoder.encode(moves, cube_id, timestamp)
+      self.subscribers = [subscriber for subscriber in self.subscribers if subscriber.push(frame)]
+
+
+  def close(self) -> None:
+    if self.server:
+      self.server.close()
+      self.server = None
+    with self.lock:
+      for subscriber in self.subscribers:
+        subscriber.close()
+      self.subscribers.clear()
+    if not isinstance(self.address, tuple) and os.path.exists(self.address):
+      os.unlink(self.address)
+
+
+  def _accept(self) -> None:
+    while True:
+      try:
+        sock, _ = self.server.accept()
+      except OSError:  # Closed
+        return
+      self.attached += 1
+      subscriber = Subscriber(sock, str(self.attached), self.maxsize, self.policy)
+
+      with self.lock:
+        # State frames take the sequence numbers just before the next frame, so the new
+        # subscriber sees no gap
+        welcome = FrameEncoder()
+        welcome.seq = (self.encoder.seq - len(self.cubes)) & 0xFFFF
+        for cube_id, cube in self.cubes.items():
+          subscriber.push(welcome.encode([STATE_PREFIX + cube.hex()], cube_id))
+        self.subscribers.append(subscriber)
+      self.logger.info(f'Subscriber {subscriber.name} attached ({len(self.subscribers)} in total).')
@@ -0,0 +1,94 @@
+"""
+Binary log of raw (encrypted) notifications.
+File: 8-byte header, then fixed-size records, so a capture can be memory-mapped
+and indexed directly. Record (little-endian, 36 bytes):
+  timestamp  float64  time.monotonic() of receipt
+  mac        6 bytes  address of the cube
+  protocol   uint8    2, 3 or 4 (Gen2/Gen3/Gen4)
+  length     uint8    length of the packet
+  data       20 bytes packet, zero-padded
+"""
+import mmap
+import struct
+import threading
+from typing import NamedTuple
+
+
+MAGIC = b'GANCAP\x00\x01'
+RECORD = struct.Struct('<d6sBB20s')
+
+
+
+class Record(NamedTuple):
+  timestamp: float
+  address: str
+  protocol: str
+  data: bytes
+
+
+def _mac_to_bytes(address: str) -> bytes:
+  return bytes.fromhex(address.replace(':', ''))
+
+
+def _bytes_to_mac(mac: bytes) -> str:
+  return ':'.join(f'{byte:02X}' for byte in mac)
+
+
+
+class CaptureWriter:
+  """
+  Appends records to a capture file. Safe to use from several pipeline threads
+  """
+  def __init__(self, path: str):
+    self.path = path
+    self.file = open(path, 'wb')
+    self.file.write(MAGIC)
+    self.count = 0
+    self._lock = threading.Lock()
+
+
+  def write(self, timestamp: float, address: str, protocol: str, data: bytes) -> None:
+    record = RECORD.pack(timestamp, _mac_to_bytes(address), int(protocol[-1]), len(data), bytes(data[:20]))
+    with self._lock:
+      self.file.write(record)
+      self.count += 1
+
+
+  def close(self) -> None:
+    with self._lock:
+      self.file.close()
+
+
+
+class CaptureReader:
+  """
+  Memory-mapped capture. Supports len(), indexing and iteration over Record
+  """
+  def __init__(self, path: str):
+    with open(path, 'rb') as file:
+      self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    if self._mmap[:len(MAGIC)] != MAGIC:
+      raise ValueError(f'{path} is not a capture file')
+    self._view = memoryview(self._mmap)[len(MAGIC):]
+    self._count = len(self._view) // RECORD.size  # A partly written last record is ignored
+
+
+  def __len__(self) -> int:
+    return self._count
+
+
+  def __getitem__(self, index: int) -> Record:
+    if not -self._count <= index < self._count:
+      raise IndexError('capture record index out of range')
+    timestamp, mac, protocol, length, data = RECORD.unpack_from(self._view, (index % self._count) * RECORD.size)
+    return Record(timestamp, _bytes_to_mac(mac), f'Gen{protocol}', data[:length])
+
+
+  def __iter__(self):
+    for index in range(self._count):
+      yield self[index]
+
+
+  def close(self) -> None:
+    self._view.release()
+    self._mmap.close()
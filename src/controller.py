@@ -1,15 +1,27 @@
 import sys
 sys.coinit_flags = 0  # MTA thread mode
 
+import argparse
 import asyncio
 from bleak import BleakScanner, BleakClient
 import logging
+import threading
+import time
 
-from named_pipes import PipeSender
+from broker import POLICIES
 from cryptor import Cryptor
+from capture import CaptureWriter
+from cube_state import CubeState, RESYNC, STATE_PREFIX
+from device_registry import DeviceRegistry
+from packet_schema import GEN2, GEN3, GEN4, read_cubies, read_history
+from pipeline import DecodePipeline
+from sequencer import MoveSequencer
+from transport import DEFAULT_TRANSPORT, TRANSPORTS, make_sender, parse_address
 from uuids_list import UUIDS_LIST
 
 
+LAUNCH_TIME = time.monotonic()
+
 
 async def _choose_protocol(client: BleakClient) -> tuple[str, str]:
   uuids_list = []
@@ -24,84 +36,248 @@ async def _choose_protocol(client: BleakClient) -> tuple[str, str]:
   return None
 
 
+def cube_id(address: str) -> str:
+  """
+  Short id of the cube used to tag its moves, e.g. 'AB:12:CD:34:EF:56' -> 'EF56'
+  """
+  return address.replace(':', '').replace('-', '')[-4:].upper()
+
+
+async def find_gan_device(timeout: float = 10.0, exclude: set[str] = frozenset()):
+  """
+  Scans until the first advertisement of a GAN cube arrives
+  exclude: ids of cubes to ignore
+  ret: BLEDevice or None
+  """
+  logger = logging.getLogger('Controller')
+  logger.info("Searching for GAN Smart Cube...")
+
+  seen = set()
+  def is_gan(device, advertisement_data) -> bool:
+    seen.add(device.address)
+    return bool(device.name) and 'GAN' in device.name and cube_id(device.address) not in exclude
+
+  device = await BleakScanner.find_device_by_filter(is_gan, timeout=timeout)
+  if device is None:
+    if not seen:
+      logger.critical('Couldn\'t find any device. Most likely, something wrong with bluetooth.')
+    else:
+      logger.warning('Couldn\'t find the cube, but the bluetooth is working.')
+  return device
+
+
 
 class GANCubeController:
-  def __init__(self, send):
+  def __init__(self, send, cube_id: str | None = None, capture: CaptureWriter | None = None):
     """
     send(moves: list[str]) -> None.
-    send(moves) called when controller wants to send list of recieved moves
+    send(moves) called when controller wants to send list of recieved moves.
+    When the cube reports its state, the list is [STATE_PREFIX + <CubeState.hex()>], followed by
+    RESYNC if moves were lost or the link was reconnected before it (answers to watchdog probes never are).
+    It is called from the decode pipeline thread, so it may block
+    cube_id: id of the cube in logs (for sessions with several cubes)
+    capture: if given, every raw notification is written to it
     """
-    self.logger = logging.getLogger('Controller')
+    self.cube_id = cube_id
+    self.logger = logging.getLogger(f'Controller.{cube_id}' if cube_id else 'Controller')
 
     self.client = None
     self.send = send
+    self.address = None
+    self.name = None
 
     self.protocol = None  # Gen2, Gen3, Gen4
     self.move_count = None
-
-
-  async def connect_to_cube(self):
+    self.cube = CubeState()  # Assumed solved until the cube reports its state
+    self.resync = False  # The next state report follows lost moves or a reconnect
+    self.cryptor = None
+    self.capture = capture
+    self.lost: asyncio.Event | None = None  # Set by bleak when the link drops
+    self.loop: asyncio.AbstractEventLoop | None = None  # Loop of the client, for writes from the pipeline thread
+    self.sequencer = MoveSequencer(self._request_history, self._request_resync)  # Gen3/Gen4 serials. Gen2 uses only the counters
+    self.pipeline = DecodePipeline(deadline=self.sequencer.deadline, on_deadline=self.sequencer.expire)
+    self.connected_at = 0.0
+
+
+  async def connect_to_cube(self, device=None, known: dict[str, str] | None = None, timeout: float = 10.0):
+    """
+    device: BLEDevice or address to connect to. If None, connects to the first GAN cube found
+    known: DeviceRegistry entry of the device. Protocol detection is skipped
+    """
     # Scanning for devices
-    self.logger.info("Searching for GAN Smart Cube...")
-    devices = await BleakScanner.discover(timeout=5.0)
-    gan_devices = [device for device in devices if device.name and 'GAN' in device.name]
-    if not gan_devices:
-      if not devices:
-        self.logger.critical('Couldn\'t find any device. Most likely, something wrong with bluetooth.')
-      else:
-        self.logger.warning('Couldn\'t find the cube, but the bluetooth is working.')
-      return False
+    if device is None:
+      device = await find_gan_device()
+      if device is None:
+        return False
+
+    self.address = device if isinstance(device, str) else device.address
+    self.name = getattr(device, 'name', None) or (known or {}).get('name') or self.address
 
     # Connecting
-    self.logger.info(f"Found {gan_devices[0].name}. Connecting...")
-    self.client = BleakClient(gan_devices[0])
+    self.logger.info(f"Found {self.name}. Connecting...")
+    lost = self.lost = asyncio.Event()
+    self.loop = asyncio.get_running_loop()
+    # A late drop of this client must not set the event of the next connection
+    self.client = BleakClient(device, disconnected_callback=lambda client: lost.set(), timeout=timeout)
     await self.client.connect()
-    self.logger.info(f"Connected to {gan_devices[0].name} ({gan_devices[0].address}).")
+    self.connected_at = time.monotonic()
+    self.logger.info(f"Connected to {self.name} ({self.address}).")
 
     # Choosing right protocol
-    self.protocol = await _choose_protocol(self.client)
-    if not self.protocol:
-      self.logger.critical("Unknown protocol. Disconnecting...")
-      await self.client.disconnect()
-      return False
+    if known:
+      self.protocol = known['protocol']
+      self.NOTIFY_UUID = known['notify']
+      self.WRITE_UUID = known['write']
+      self.logger.debug(f'Known protocol: {self.protocol}')
     else:
+      self.protocol = await _choose_protocol(self.client)
+      if not self.protocol:
+        self.logger.critical("Unknown protocol. Disconnecting...")
+        await self.client.disconnect()
+        return False
       self.logger.debug(f'Choosed protocol: {self.protocol}')
       self.NOTIFY_UUID = UUIDS_LIST[self.protocol]['notify']
       self.WRITE_UUID = UUIDS_LIST[self.protocol]['write']
       
-    self.cryptor = Cryptor(gan_devices[0].address)
+    if self.cryptor is None:  # Kept on reconnect
+      self.cryptor = Cryptor(self.address)
+      self.logger.info(f'Crypto backend: {self.cryptor.backend} ({self.cryptor.packet_cost * 1e6:.1f} us/packet)')
     
-    # Subscribe to notifications
-    if self.protocol == 'Gen2':
-      await self.client.start_notify(self.NOTIFY_UUID, self._notification_handler_gen2)
-      # Request the initial state from the cube. For gen2 it's necessary
-      await self.client.write_gatt_char(self.WRITE_UUID, self.cryptor.encrypt(b'\x04' + b'\x00' * 19), response=True)
+    # Subscribe to notifications. Handlers run on the pipeline thread
+    self.pipeline.start()
+    handler = {
+      'Gen2': self._notification_handler_gen2,
+      'Gen3': self._notification_handler_gen3,
+      'Gen4': self._notification_handler_gen4,
+    }[self.protocol]
+    tap = (lambda timestamp, data: self.capture.write(timestamp, self.address, self.protocol, data)) if self.capture else None
+    await self.client.start_notify(self.NOTIFY_UUID, self.pipeline.wrap(handler, tap))
+
+    # Request the initial state from the cube. For gen2 it's necessary
+    await self.request_state()
+    
+    return True
 
-    elif self.protocol == 'Gen3':
-      await self.client.start_notify(self.NOTIFY_UUID, self._notification_handler_gen3)
-      # Request the initial state from the cube
-      await self.client.write_gatt_char(self.WRITE_UUID, self.cryptor.encrypt(b'\x68' + b'\x01' + b'\x00' * 18), response=True)
 
+  def gap_stats(self) -> dict[str, int]:
+    return self.sequencer.stats()
+
+
+  def _state_request(self) -> bytes:
+    if self.protocol == 'Gen2':
+      return b'\x04' + b'\x00' * 19
+    elif self.protocol == 'Gen3':
+      return b'\x68' + b'\x01' + b'\x00' * 18
     else:  # self.protocol == 'Gen4'
-      await self.client.start_notify(self.NOTIFY_UUID, self._notification_handler_gen4)
-      # Request the initial state from the cube
-      await self.client.write_gatt_char(self.WRITE_UUID, self.cryptor.encrypt(b'\x05' + b'\x00' * 19), response=True)
-    
-    
-    
-    return True
+      return b'\x05' + b'\x00' * 19
+
+
+  async def request_state(self) -> None:
+    await self.client.write_gatt_char(self.WRITE_UUID, self.cryptor.encrypt(self._state_request()), response=True)
+
+
+  async def reconnect(self, timeout: float = 10.0) -> bool:
+    """
+    Connects again to the same cube keeping Cryptor, pipeline and cube state
+    """
+    if self.client and self.client.is_connected:
+      try:
+        await self.client.disconnect()
+      except Exception as e:
+        self.logger.debug(f'Disconnect before reconnecting failed: {e}')
+    known = {'name': self.name, 'protocol': self.protocol, 'notify': self.NOTIFY_UUID, 'write': self.WRITE_UUID}
+    self.move_count = None  # Gen2 moves are ignored until the state answer resyncs the counter
+    self.resync = True
+    return await self.connect_to_cube(self.address, known, timeout)
+
+
+  async def watch(self, stall_timeout: float = 10.0, probe_timeout: float = 3.0) -> str:
+    """
+    Waits until the link drops or stalls. A cube silent for `stall_timeout` is asked
+    for its state; no answer within `probe_timeout` means the link is stalled
+    ret: reason
+    """
+    while True:
+      silent = time.monotonic() - max(self.pipeline.last_received, self.connected_at)
+      if silent < stall_timeout:
+        try:
+          await asyncio.wait_for(self.lost.wait(), stall_timeout - silent)
+          return 'connection lost'
+        except asyncio.TimeoutError:
+          continue
+
+      received = self.pipeline.received
+      try:
+        await self.request_state()
+        await asyncio.wait_for(self.lost.wait(), probe_timeout)
+        return 'connection lost'
+      except asyncio.TimeoutError:
+        pass
+      except Exception as e:
+        return f'state request failed ({e})'
+
+      if self.pipeline.received == received:
+        return f'no notifications for {silent + probe_timeout:.0f} s'
+      self.connected_at = time.monotonic()  # The cube answered, just idle
   
 
+  def _request_history(self, serial: int, count: int) -> None:
+    """
+    Asks the cube for `count` moves ending with `serial`. Called from the pipeline thread
+    """
+    # History comes byte-aligned starting with an odd serial, so the window is widened up to
+    # the next odd serial and to an even count
+    if serial % 2 == 0:
+      serial += 1
+      count += 1
+    count += count % 2
+    if count > serial + 1:  # The cube doesn't read across the 255 -> 0 edge: the older part is asked for separately
+      self._request_history(0xFF, count - serial - 1)
+      count = serial + 1
+
+    if self.protocol == 'Gen3':
+      request = bytes([0x68, 0x03, serial, 0, count, 0]) + b'\x00' * 14
+    else:  # self.protocol == 'Gen4'
+      request = bytes([0xD1, 0x04, serial, 0, count, 0]) + b'\x00' * 14
+    self._write_threadsafe(request)
+
+
+  def _request_resync(self) -> None:
+    """
+    Moves were lost for good: the cube state is asked for and sent as a resync. Called from the pipeline thread
+    """
+    self.resync = True
+    self._write_threadsafe(self._state_request())
+
+
+  def _write_threadsafe(self, request: bytes) -> None:
+    def check(future) -> None:
+      if not future.cancelled() and future.exception():
+        self.logger.warning(f'Request failed: {future.exception()}')
+
+    asyncio.run_coroutine_threadsafe(
+      self.client.write_gatt_char(self.WRITE_UUID, self.cryptor.encrypt(request), response=True), self.loop
+    ).add_done_callback(check)
+
+
   ###########################   Notification handlers   ###########################
   def _notification_handler_gen4(self, sender, data: bytearray):
     data = bytearray(self.cryptor.decrypt(data))
     
     try:
-      if data[0] == 0x01:  # Last move in notation
+      if GEN4.event(data) == 0x01:  # Last move in notation
         self.logger.debug(f'Got move data: {data.hex()}')
         move = self._parce_move_gen4(data)
-        self.logger.debug(f'Parced move: {move}')
-        self.send([move])
+        if move:
+          self.logger.debug(f'Parced move: {move}')
+          self._emit(self.sequencer.push(GEN4.serial(data), move))
+      elif GEN4.event(data) == 0xD1:  # Move history
+        self.logger.debug(f'Got move history: {data.hex()}')
+        self._emit(self.sequencer.push_history(*read_history(GEN4, data)))
+      elif GEN4.event(data) == 0xED:  # Facelets
+        self.logger.debug('Got facelets data')
+        if self._set_state(GEN4, data):
+          self._emit(self.sequencer.reset(GEN4.state_serial(data)))
       else:
         self.logger.debug(f'Got unknown notification: {data.hex()}')
         
@@ -113,14 +289,22 @@ class GANCubeController:
     data = bytearray(self.cryptor.decrypt(data))
     
     try:
-      if data[0] != 0x55 and data[2] != 0x00:  
+      if GEN3.magic(data) != 0x55 or GEN3.length(data) == 0:
         return
 
-      if data[1] == 0x01:  # Last move in notation
+      if GEN3.event(data) == 0x01:  # Last move in notation
         self.logger.debug(f'Got move data: {data.hex()}')
-        move = self._parce_moves_gen3(data)
-        self.logger.debug(f'Parced move: {move}')
-        self.send([move])
+        move = self._parce_move_gen3(data)
+        if move:
+          self.logger.debug(f'Parced move: {move}')
+          self._emit(self.sequencer.push(GEN3.serial(data), move))
+      elif GEN3.event(data) == 0x06:  # Move history
+        self.logger.debug(f'Got move history: {data.hex()}')
+        self._emit(self.sequencer.push_history(*read_history(GEN3, data)))
+      elif GEN3.event(data) == 0x02:  # Facelets
+        self.logger.debug('Got facelets data')
+        if self._set_state(GEN3, data):
+          self._emit(self.sequencer.reset(GEN3.state_serial(data)))
       else:
         self.logger.debug(f'Got unknown notification: {data.hex()}')
         
@@ -133,7 +317,7 @@ class GANCubeController:
     self.logger.debug(f'Got notification: {data.hex()}')
     
     try:
-      if data[0] >> 4 == 0x02:  # Moves in notation
+      if GEN2.event(data) == 0x02:  # Moves in notation
         self.logger.debug(f'Got move data.')
 
         if self.move_count is None:  # Can process moves only after getting facelets state
@@ -142,16 +326,12 @@ class GANCubeController:
         moves = self._parce_moves_gen2(data)
         if moves:
           self.logger.debug(f'Parced moves: {moves}')
-          self.send(moves)
+          self._emit(moves)
 
-      elif data[0] >> 4 == 0x04:  # Facelets
+      elif GEN2.event(data) == 0x04:  # Facelets
         self.logger.debug('Got facelets data')
-        array = ''.join(format(byte, '08b') for byte in data)
-        def getBitWord(array, start, length):
-          return array[start: start + length]
-        
-        self.move_count = int(getBitWord(array, 4, 8), 2)
-        pass  # There can be logic of reconstucting facelets
+        self.move_count = GEN2.move_count(data)
+        self._set_state(GEN2, data)
 
       else:
         self.logger.debug(f'Unknown notification.')
@@ -160,89 +340,232 @@ class GANCubeController:
       self.logger.warning(f"Error processing cube data: {e}")
 
 
-  ###########################       Data parcers       ###########################
-  def _parce_move_gen4(self, data):
-    array = ''.join(format(byte, '08b') for byte in data)
-    def getBitWord(array, start, length):
-      return array[start: start + length]
-    
-    direction = getBitWord(array, 64, 2)[1] == '1'
-    face = [1, 5, 3, 0, 4, 2][getBitWord(array, 66, 6).find('1')]
-    
-    return ('BRDFUL'[face] + ' \''[direction]).replace(' ', '')
+  def _emit(self, moves: list[str]) -> None:
+    if not moves:
+      return
+    for move in moves:
+      self.cube.apply(move)
+    self.send(moves)
 
 
-  def _parce_move_gen3(self, data):
-    array = ''.join(format(byte, '08b') for byte in data)
-    def getBitWord(array, start, length):
-      return array[start: start + length]
-    
-    direction = getBitWord(array, 72, 2)[1] == '1'
-    face = [1, 5, 3, 0, 4, 2][getBitWord(array, 74, 6).find('1')]
-    
-    return ('BRDFUL'[face] + ' \''[direction]).replace(' ', '')
+  def _set_state(self, schema, data) -> bool:
+    try:
+      self.cube = CubeState.from_cubies(*read_cubies(schema, data))
+    except ValueError as e:
+      self.logger.warning(f'Reseived corrupted facelets data: {e}')
+      return False
+    self.logger.debug(f'Cube state: {self.cube.to_facelets()}')
+    self.send([STATE_PREFIX + self.cube.hex()] + ([RESYNC] if self.resync else []))
+    self.resync = False
+    return True
+
+
+  ###########################       Data parcers       ###########################
+  def _parce_move_gen4(self, data) -> str | None:
+    move = GEN4.move(data)
+    if move is None:
+      self.logger.warning('Reseived corrupted move data (no face bit)')
+    return move
+
+
+  def _parce_move_gen3(self, data) -> str | None:
+    move = GEN3.move(data)
+    if move is None:
+      self.logger.warning('Reseived corrupted move data (no face bit)')
+    return move
   
 
-  def _parce_moves_gen2(self, data):
-    array = ''.join(format(byte, '08b') for byte in data)
-    def getBitWord(array, start, length):
-      return array[start: start + length]
-    
-    move_count = int(getBitWord(array, 4, 8), 2)
-    sended_count = min((move_count - self.move_count) & 0xff, 7)  # TODO: move_count suppose to cicle like u_int8 and "& 0xff" is for 255->0 transition. Does it work correctly in Python?
-    self.move_count = move_count
-    if sended_count <= 0:
-      self.logger.warning('Not positive sended_count.')
+  def _parce_moves_gen2(self, data) -> list[str]:
+    move_count = GEN2.move_count(data)
+    sended_count = (move_count - self.move_count) & 0xff  # move_count is uint8, "& 0xff" handles 255 -> 0
+    if sended_count == 0 or sended_count >= 0x80:  # Repeated packet
+      return []
+
+    if sended_count > 7:  # A packet holds only 7 last moves, and Gen2 has no move history
+      # The 7 moves of the packet are dropped too: they come after a hole, so they can't be
+      # applied to a known state, and the resync that the state answer brings clears the buffers anyway
+      self.sequencer.note_gap(sended_count - 7)
+      self.logger.warning(f'Missed {sended_count - 7} moves. Requesting the state...')
+      self.move_count = None  # Moves are ignored until the state comes
+      self._request_resync()
       return []
+    self.move_count = move_count
 
     ret = []
     for i in range(sended_count - 1, -1, -1):
-      direction = int(getBitWord(array, 16 + 5 * i, 1), 2)
-      face = int(getBitWord(array, 12 + 5 * i, 4), 2)
-      
-      if face > 5:
+      move = GEN2.moves[i](data)
+      if move is None:
         self.logger.warning('Reseived corrupted move data (face_mapper > 5)')
-        i -= 1
         continue
-
-      move = ('URFDLB'[face] + ' \''[direction]).replace(' ', '')
       ret.append(move)
 
-      i -= 1
+    return ret  # Oldest move first
 
-    return ret[::-1]  # TODO: Does move send in reverse?
 
 
+class CubeSessionManager:
+  """
+  Runs one GANCubeController per cube, all in the same asyncio loop.
+  Every session has its own Cryptor, protocol and move counter.
+  """
+  def __init__(self, send, registry: DeviceRegistry | None = None, capture: CaptureWriter | None = None):
+    """
+    send(moves: list[str], cube_id: str, timestamp: float) -> None. timestamp is time.monotonic() of the notification
+    registry: known cubes. Updated on every successful connection
+    capture: if given, raw notifications of every cube are written to it
+    """
+    self.logger = logging.getLogger('Sessions')
+    self.send = send
+    self.capture = capture
+    self.registry = registry or DeviceRegistry()
+    self.sessions: dict[str, GANCubeController] = {}  # cube_id -> controller
+    self.supervisors: dict[str, asyncio.Task] = {}  # cube_id -> task reconnecting the session
+    self.reconnects: dict[str, int] = {}  # cube_id -> number of reconnections
+    self._send_lock = threading.Lock()  # Every session sends from its own pipeline thread
+    self.first_move_time: float | None = None  # Seconds from launch to the first move
 
-logger = logging.getLogger('CubeScript')
 
-async def main():
-  # Configuring logging
-  logging.basicConfig(
-      level=logging.INFO,
-      format='%(asctime)s - [%(name)s] - %(levelname)s - %(message)s',
-      datefmt='%H:%M:%S'
-  )
+  async def connect_known_cubes(self, limit: int | None = None, timeout: float = 3.0) -> int:
+    """
+    Connects directly (without scanning) to known cubes that have no session yet, the most
+    recently used first
+    limit: stop when there are this many sessions. None tries every known cube
+    ret: number of new sessions
+    """
+    addresses = [address for address in self.registry.recent() if cube_id(address) not in self.sessions]
+    connected = 0
+    while addresses and (limit is None or len(self.sessions) < limit):
+      # Only as many at once as needed, the next ones if some are out of range
+      count = len(addresses) if limit is None else limit - len(self.sessions)
+      batch, addresses = addresses[:count], addresses[count:]
+      connected += sum(await asyncio.gather(*(
+        self._connect(address, self.registry.get(address), timeout) for address in batch
+      )))
+    return connected
+
+
+  async def connect_new_cubes(self, timeout: float = 10.0) -> int:
+    """
+    Scans until the first GAN cube without session shows up and connects to it
+    ret: number of new sessions
+    """
+    device = await find_gan_device(timeout, exclude=set(self.sessions))
+    if device is None:
+      return 0
+    return int(await self._connect(device, self.registry.get(device.address)))
 
-  pipe = PipeSender()
-  pipe.connect()
 
-  controller = GANCubeController(lambda lst: pipe.send(lst))
+  async def disconnect_all(self) -> None:
+    for task in self.supervisors.values():
+      task.cancel()
+    await asyncio.gather(*self.supervisors.values(), return_exceptions=True)
+    self.supervisors.clear()
+
+    for controller in self.sessions.values():
+      if controller.client and controller.client.is_connected:
+        await controller.client.disconnect()
+      controller.pipeline.stop()
+    self.sessions.clear()
+
+
+  async def _connect(self, device, known: dict[str, str] | None = None, timeout: float = 10.0) -> bool:
+    """
+    device: BLEDevice or address
+    """
+    address = device if isinstance(device, str) else device.address
+    cid = cube_id(address)
+
+    def send(moves: list[str]) -> None:
+      if self.first_move_time is None and any(not move.startswith(STATE_PREFIX) for move in moves):
+        self.first_move_time = time.monotonic() - LAUNCH_TIME
+        self.logger.info(f'First move {self.first_move_time:.2f} s after launch.')
+      with self._send_lock:
+        self.send(moves, cid, controller.pipeline.timestamp)
+
+    controller = GANCubeController(send, cid, self.capture)
+    try:
+      if not await controller.connect_to_cube(device, known, timeout):
+        return False
+    except Exception as e:
+      self.logger.warning(f'Failed to connect to {address}: {e}')
+      if controller.client and controller.client.is_connected:
+        await controller.client.disconnect()
+      controller.pipeline.stop()
+      return False
+
+    self.registry.remember(address, controller.name, controller.protocol, controller.NOTIFY_UUID, controller.WRITE_UUID)
+    self.sessions[cid] = controller
+    self.reconnects[cid] = 0
+    self.supervisors[cid] = asyncio.create_task(self._supervise(cid))
+    self.logger.info(f'Cube {cid} connected ({address}) {time.monotonic() - LAUNCH_TIME:.2f} s after launch.')
+    return True
+
+
+  async def _supervise(self, cid: str, min_backoff: float = 0.5, max_backoff: float = 30.0) -> None:
+    """
+    Reconnects the session in place whenever its link drops or stalls
+    """
+    controller = self.sessions[cid]
+    while True:
+      reason = await controller.watch()
+      self.logger.warning(f'Cube {cid}: {reason}. Reconnecting...')
+
+      backoff = min_backoff
+      while True:
+        try:
+          if await controller.reconnect():
+            break
+        except Exception as e:
+          self.logger.debug(f'Cube {cid}: reconnection failed: {e}')
+        self.logger.info(f'Cube {cid}: trying again in {backoff:.1f} seconds.')
+        await asyncio.sleep(backoff)
+        backoff = min(backoff * 2, max_backoff)
+
+      self.reconnects[cid] += 1
+      self.logger.info(f'Cube {cid} reconnected.')
+
+
+
+logger = logging.getLogger('CubeScript')
+
+async def run_sessions(send, cubes: int = 1, capture_path: str | None = None) -> None:
+  """
+  Connects the cubes and keeps their sessions alive (forever)
+  send: see CubeSessionManager
+  cubes: number of cubes to wait for before going on
+  capture_path: file to record raw notifications to (see capture.py)
+  """
+  capture = CaptureWriter(capture_path) if capture_path else None
+  manager = CubeSessionManager(send, capture=capture)
   
   try:
-    while not await controller.connect_to_cube():
-      wait_time = 2
-      controller.logger.warning('Cube not found. It should blink white.')
-      controller.logger.warning('Check that the cube isn\'t connected to your PC. Try do (U4)x5.')
-      controller.logger.info(f'Trying again in {wait_time} seconds.\n')
+    await manager.connect_known_cubes(cubes)
+    while len(manager.sessions) < cubes:
+      if await manager.connect_new_cubes():
+        continue
+      wait_time = 0.5  # The scan itself already waited
+      logger.warning('Cube not found. It should blink white.')
+      logger.warning('Check that the cube isn\'t connected to your PC. Try do (U4)x5.')
+      logger.info(f'Trying again in {wait_time} seconds.\n')
       await asyncio.sleep(wait_time)
-    logger.info("Cube connected.")
+    logger.info(f"Cubes connected: {', '.join(manager.sessions)}.")
 
     # Keep the script alive (forever)
+    dropped = {}
+    last_gaps = {}
     while True:
-      if not controller.client.is_connected:
-        logger.critical('Connection lost.')
-        return
+      for cid, controller in manager.sessions.items():
+        stats = controller.pipeline.stats()
+        if stats['dropped'] != dropped.get(cid, 0):
+          logger.warning(f'Decode queue of cube {cid} overflowed, {stats["dropped"] - dropped.get(cid, 0)} notifications dropped. Pipeline: {stats}')
+          dropped[cid] = stats['dropped']
+        else:
+          logger.debug(f'Pipeline of cube {cid}: {stats}, reconnects: {manager.reconnects[cid]}')
+
+        gaps = controller.gap_stats()
+        if gaps != last_gaps.get(cid):
+          logger.info(f'Move gaps of cube {cid}: {gaps}')
+          last_gaps[cid] = gaps
       await asyncio.sleep(2)
           
   except KeyboardInterrupt:
@@ -252,14 +575,46 @@ async def main():
     logger.critical(f"An error occurred: {e}")
 
   finally:
-    if controller.client and controller.client.is_connected:
-      await controller.client.disconnect()
+    await manager.disconnect_all()
+    if capture:
+      capture.close()
+      logger.info(f'Captured {capture.count} notifications to {capture.path}.')
     logger.critical("Disconnected from cube.")
 
 
+async def main(cubes: int = 1, capture_path: str | None = None, transport: str = DEFAULT_TRANSPORT, address=None,
+               **options):
+  """
+  transport, address: how moves go to key_emulator.py (see transport.py)
+  options: extra arguments of the sender (e.g. policy of 'broker')
+  """
+  # Configuring logging
+  logging.basicConfig(
+      level=logging.INFO,
+      format='%(asctime)s - [%(name)s] - %(levelname)s - %(message)s',
+      datefmt='%H:%M:%S'
+  )
+
+  pipe = make_sender(transport, address, **options)
+  pipe.connect()
+  try:
+    await run_sessions(pipe.send, cubes, capture_path)
+  finally:
+    pipe.close()
+
+
 if __name__ == "__main__":
   try:
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description='Sends turns of GAN smart cubes to the key emulator.')
+    parser.add_argument('--cubes', type=int, default=1, help='number of cubes to connect to (default: 1)')
+    parser.add_argument('--capture', metavar='PATH', help='record raw notifications to a capture file for replay.py')
+    parser.add_argument('--transport', choices=TRANSPORTS, default=DEFAULT_TRANSPORT, help=f'move stream to key_emulator.py (default: {DEFAULT_TRANSPORT})')
+    parser.add_argument('--address', help='pipe name, socket path or host:port of the transport')
+    parser.add_argument('--queue', type=int, default=256, help='broker: frames queued for a slow subscriber at most (default: 256)')
+    parser.add_argument('--slow', choices=POLICIES, default='drop_oldest', help='broker: what to do when a subscriber queue is full (default: drop_oldest)')
+    args = parser.parse_args()
+    options = {'maxsize': args.queue, 'policy': args.slow} if args.transport == 'broker' else {}
+    asyncio.run(main(args.cubes, args.capture, args.transport, parse_address(args.transport, args.address), **options))
   except Exception as e:
     print(f"Fatal error: {e}")
     import traceback
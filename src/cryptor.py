@@ -23,6 +23,16 @@
     DEALINGS IN THE SOFTWARE.
 """
 
+import logging
+import struct
+import time
+
+try:
+    import numpy as np
+except ImportError:  # only needed for batch decryption
+    np = None
+
+
 Sbox = (
     0x63, 0x7C, 0x77, 0x7B, 0xF2, 0x6B, 0x6F, 0xC5, 0x30, 0x01, 0x67, 0x2B, 0xFE, 0xD7, 0xAB, 0x76,
     0xCA, 0x82, 0xC9, 0x7D, 0xFA, 0x59, 0x47, 0xF0, 0xAD, 0xD4, 0xA2, 0xAF, 0x9C, 0xA4, 0x72, 0xC0,
@@ -228,48 +238,320 @@ class AES:
 
 
 
+def _gmul(a, b):
+    # multiplication in GF(2^8), used only to build the tables below
+    r = 0
+    while b:
+        if b & 1:
+            r ^= a
+        a = xtime(a)
+        b >>= 1
+    return r
+
+
+def _rotr8(w):
+    return ((w >> 8) | (w << 24)) & 0xFFFFFFFF
+
+
+# T-tables: SubBytes + MixColumns (and their inverses) folded into 32-bit words
+Te0 = tuple((_gmul(s, 2) << 24) | (s << 16) | (s << 8) | _gmul(s, 3) for s in Sbox)
+Te1 = tuple(_rotr8(w) for w in Te0)
+Te2 = tuple(_rotr8(w) for w in Te1)
+Te3 = tuple(_rotr8(w) for w in Te2)
+
+Td0 = tuple((_gmul(s, 14) << 24) | (_gmul(s, 9) << 16) | (_gmul(s, 13) << 8) | _gmul(s, 11) for s in InvSbox)
+Td1 = tuple(_rotr8(w) for w in Td0)
+Td2 = tuple(_rotr8(w) for w in Td1)
+Td3 = tuple(_rotr8(w) for w in Td2)
+
+_words = struct.Struct('>4I')
+
+
+class FastAES:
+    """
+    AES-128 working on flat 32-bit words with precomputed T-tables.
+    Round keys (and the inverse round keys of the equivalent inverse cipher)
+    are expanded once in __init__, so a block costs only table lookups.
+
+    `iv` (optional, 16 bytes) is XORed into the plaintext before encryption and
+    into the result after decryption. It is folded into the first/last round key,
+    so it costs nothing per block.
+    """
+    def __init__(self, master_key: bytes, iv: bytes = bytes(16)):
+        w = list(_words.unpack(bytes(master_key)))
+        for i in range(4, 44):
+            t = w[i - 1]
+            if i % 4 == 0:
+                t = (Sbox[(t >> 16) & 0xFF] << 24 | Sbox[(t >> 8) & 0xFF] << 16
+                     | Sbox[t & 0xFF] << 8 | Sbox[t >> 24]) ^ (Rcon[i // 4] << 24)
+            w.append(w[i - 4] ^ t)
+
+        iv = _words.unpack(bytes(iv))
+
+        ek = list(w)
+        for c in range(4):
+            ek[c] ^= iv[c]
+        self._ek = tuple(ek)
+
+        dk = []
+        for r in range(10, -1, -1):
+            for c in range(4):
+                k = w[4 * r + c]
+                if 0 < r < 10:  # InvMixColumns of the round key
+                    k = Td0[Sbox[k >> 24]] ^ Td1[Sbox[(k >> 16) & 0xFF]] \
+                      ^ Td2[Sbox[(k >> 8) & 0xFF]] ^ Td3[Sbox[k & 0xFF]]
+                elif r == 0:
+                    k ^= iv[c]
+                dk.append(k)
+        self._dk = tuple(dk)
+
+    def encrypt_block(self, block: bytes) -> bytes:
+        T0, T1, T2, T3, S, k = Te0, Te1, Te2, Te3, Sbox, self._ek
+
+        s0, s1, s2, s3 = _words.unpack(block)
+        s0 ^= k[0]; s1 ^= k[1]; s2 ^= k[2]; s3 ^= k[3]
+
+        for i in range(4, 40, 4):
+            t0 = T0[s0 >> 24] ^ T1[(s1 >> 16) & 0xFF] ^ T2[(s2 >> 8) & 0xFF] ^ T3[s3 & 0xFF] ^ k[i]
+            t1 = T0[s1 >> 24] ^ T1[(s2 >> 16) & 0xFF] ^ T2[(s3 >> 8) & 0xFF] ^ T3[s0 & 0xFF] ^ k[i + 1]
+            t2 = T0[s2 >> 24] ^ T1[(s3 >> 16) & 0xFF] ^ T2[(s0 >> 8) & 0xFF] ^ T3[s1 & 0xFF] ^ k[i + 2]
+            t3 = T0[s3 >> 24] ^ T1[(s0 >> 16) & 0xFF] ^ T2[(s1 >> 8) & 0xFF] ^ T3[s2 & 0xFF] ^ k[i + 3]
+            s0, s1, s2, s3 = t0, t1, t2, t3
+
+        return _words.pack(
+            (S[s0 >> 24] << 24 | S[(s1 >> 16) & 0xFF] << 16 | S[(s2 >> 8) & 0xFF] << 8 | S[s3 & 0xFF]) ^ k[40],
+            (S[s1 >> 24] << 24 | S[(s2 >> 16) & 0xFF] << 16 | S[(s3 >> 8) & 0xFF] << 8 | S[s0 & 0xFF]) ^ k[41],
+            (S[s2 >> 24] << 24 | S[(s3 >> 16) & 0xFF] << 16 | S[(s0 >> 8) & 0xFF] << 8 | S[s1 & 0xFF]) ^ k[42],
+            (S[s3 >> 24] << 24 | S[(s0 >> 16) & 0xFF] << 16 | S[(s1 >> 8) & 0xFF] << 8 | S[s2 & 0xFF]) ^ k[43],
+        )
+
+    def decrypt_block(self, block: bytes) -> bytes:
+        T0, T1, T2, T3, S, k = Td0, Td1, Td2, Td3, InvSbox, self._dk
+
+        s0, s1, s2, s3 = _words.unpack(block)
+        s0 ^= k[0]; s1 ^= k[1]; s2 ^= k[2]; s3 ^= k[3]
+
+        for i in range(4, 40, 4):
+            t0 = T0[s0 >> 24] ^ T1[(s3 >> 16) & 0xFF] ^ T2[(s2 >> 8) & 0xFF] ^ T3[s1 & 0xFF] ^ k[i]
+            t1 = T0[s1 >> 24] ^ T1[(s0 >> 16) & 0xFF] ^ T2[(s3 >> 8) & 0xFF] ^ T3[s2 & 0xFF] ^ k[i + 1]
+            t2 = T0[s2 >> 24] ^ T1[(s1 >> 16) & 0xFF] ^ T2[(s0 >> 8) & 0xFF] ^ T3[s3 & 0xFF] ^ k[i + 2]
+            t3 = T0[s3 >> 24] ^ T1[(s2 >> 16) & 0xFF] ^ T2[(s1 >> 8) & 0xFF] ^ T3[s0 & 0xFF] ^ k[i + 3]
+            s0, s1, s2, s3 = t0, t1, t2, t3
+
+        return _words.pack(
+            (S[s0 >> 24] << 24 | S[(s3 >> 16) & 0xFF] << 16 | S[(s2 >> 8) & 0xFF] << 8 | S[s1 & 0xFF]) ^ k[40],
+            (S[s1 >> 24] << 24 | S[(s0 >> 16) & 0xFF] << 16 | S[(s3 >> 8) & 0xFF] << 8 | S[s2 & 0xFF]) ^ k[41],
+            (S[s2 >> 24] << 24 | S[(s1 >> 16) & 0xFF] << 16 | S[(s0 >> 8) & 0xFF] << 8 | S[s3 & 0xFF]) ^ k[42],
+            (S[s3 >> 24] << 24 | S[(s2 >> 16) & 0xFF] << 16 | S[(s1 >> 8) & 0xFF] << 8 | S[s0 & 0xFF]) ^ k[43],
+        )
+
+
+
+class BatchAES:
+    """
+    Vectorized AES-128 decryption of many blocks at once (requires numpy).
+    Runs the same T-table rounds as FastAES.decrypt_block, but every word is
+    a numpy column holding that word of all N blocks. Same key/iv semantics.
+    """
+    def __init__(self, key: bytes, iv: bytes = bytes(16)):
+        if np is None:
+            raise ImportError('Batch decryption requires numpy')
+
+        self._dk = np.array(FastAES(key, iv)._dk, dtype=np.uint32)
+        self._td = tuple(np.array(t, dtype=np.uint32) for t in (Td0, Td1, Td2, Td3))
+        self._inv_sbox = np.array(InvSbox, dtype=np.uint32)
+
+    def decrypt_blocks(self, blocks):
+        """
+        blocks: (N, 16) uint8 array
+        ret: (N, 16) uint8 array
+        """
+        T0, T1, T2, T3 = self._td
+        S, k = self._inv_sbox, self._dk
+
+        w = np.ascontiguousarray(blocks).view('>u4').astype(np.uint32)
+        s0, s1, s2, s3 = w[:, 0] ^ k[0], w[:, 1] ^ k[1], w[:, 2] ^ k[2], w[:, 3] ^ k[3]
+
+        for i in range(4, 40, 4):
+            t0 = T0[s0 >> 24] ^ T1[(s3 >> 16) & 0xFF] ^ T2[(s2 >> 8) & 0xFF] ^ T3[s1 & 0xFF] ^ k[i]
+            t1 = T0[s1 >> 24] ^ T1[(s0 >> 16) & 0xFF] ^ T2[(s3 >> 8) & 0xFF] ^ T3[s2 & 0xFF] ^ k[i + 1]
+            t2 = T0[s2 >> 24] ^ T1[(s1 >> 16) & 0xFF] ^ T2[(s0 >> 8) & 0xFF] ^ T3[s3 & 0xFF] ^ k[i + 2]
+            t3 = T0[s3 >> 24] ^ T1[(s2 >> 16) & 0xFF] ^ T2[(s1 >> 8) & 0xFF] ^ T3[s0 & 0xFF] ^ k[i + 3]
+            s0, s1, s2, s3 = t0, t1, t2, t3
+
+        out = np.stack((
+            (S[s0 >> 24] << 24 | S[(s3 >> 16) & 0xFF] << 16 | S[(s2 >> 8) & 0xFF] << 8 | S[s1 & 0xFF]) ^ k[40],
+            (S[s1 >> 24] << 24 | S[(s0 >> 16) & 0xFF] << 16 | S[(s3 >> 8) & 0xFF] << 8 | S[s2 & 0xFF]) ^ k[41],
+            (S[s2 >> 24] << 24 | S[(s1 >> 16) & 0xFF] << 16 | S[(s0 >> 8) & 0xFF] << 8 | S[s3 & 0xFF]) ^ k[42],
+            (S[s3 >> 24] << 24 | S[(s2 >> 16) & 0xFF] << 16 | S[(s1 >> 8) & 0xFF] << 8 | S[s0 & 0xFF]) ^ k[43],
+        ), axis=1)
+        return out.astype('>u4').view(np.uint8).reshape(-1, 16)
+
+
+
+class _NativeAES:
+    """
+    Gives a native AES-128-ECB primitive the FastAES interface (IV whitening included)
+    """
+    def __init__(self, encrypt, decrypt, iv: bytes):
+        self._encrypt = encrypt
+        self._decrypt = decrypt
+        self._iv = int.from_bytes(iv, 'big')
+
+    def encrypt_block(self, block: bytes) -> bytes:
+        return self._encrypt((int.from_bytes(block, 'big') ^ self._iv).to_bytes(16, 'big'))
+
+    def decrypt_block(self, block: bytes) -> bytes:
+        return (int.from_bytes(self._decrypt(block), 'big') ^ self._iv).to_bytes(16, 'big')
+
+
+def _python_backend(key: bytes, iv: bytes):
+    return FastAES(key, iv)
+
+
+def _cryptography_backend(key: bytes, iv: bytes):
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    cipher = Cipher(algorithms.AES(key), modes.ECB())
+    return _NativeAES(cipher.encryptor().update, cipher.decryptor().update, iv)
+
+
+def _pycryptodome_backend(key: bytes, iv: bytes):
+    from Crypto.Cipher import AES as CryptodomeAES
+    cipher = CryptodomeAES.new(key, CryptodomeAES.MODE_ECB)
+    return _NativeAES(cipher.encrypt, cipher.decrypt, iv)
+
+
+# name -> factory(key, iv). A factory raises ImportError if its library is not installed
+BACKENDS = {
+    'cryptography': _cryptography_backend,
+    'pycryptodome': _pycryptodome_backend,
+    'python': _python_backend,
+}
+
+logger = logging.getLogger('Cryptor')
+
+_selected: dict[bytes, tuple[str, float]] = {}  # key + iv -> (backend, seconds per packet)
+
+
+def _packet_cost(cipher, rounds: int = 200) -> float:
+    block = bytes(16)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        cipher.decrypt_block(cipher.decrypt_block(block))
+    return (time.perf_counter() - start) / rounds
+
+
+def select_backend(key: bytes, iv: bytes, preferred: str | None = None) -> tuple[str, float]:
+    """
+    Picks the fastest installed backend that agrees with FastAES on a probe block.
+    The result is cached, so the choice happens once per MAC key.
+    ret: backend name, measured cost of one packet (two blocks) in seconds
+    """
+    if preferred is None and key + iv in _selected:
+        return _selected[key + iv]
+    if preferred is not None and preferred not in BACKENDS:
+        raise ValueError(f'Unknown crypto backend: {preferred}')
+
+    reference = FastAES(key, iv)
+    probe = bytes(range(16))
+
+    results = []
+    for name in [preferred] if preferred else BACKENDS:
+        try:
+            cipher = BACKENDS[name](key, iv)
+        except ImportError:
+            logger.debug(f'Crypto backend {name} is not installed')
+            continue
+
+        if cipher.encrypt_block(probe) != reference.encrypt_block(probe) \
+           or cipher.decrypt_block(probe) != reference.decrypt_block(probe):
+            logger.warning(f'Crypto backend {name} gives wrong results. Skipping it')
+            continue
+
+        results.append((_packet_cost(cipher), name))
+
+    if not results:
+        raise ValueError(f'Crypto backend {preferred} is not available')
+
+    cost, name = min(results)
+    if preferred is None:
+        _selected[key + iv] = name, cost
+    return name, cost
+
+
+
 class GanCube:
     KEY = [1,2,66,40,49,145,22,7,32,5,24,84,66,17,18,83]
     IV = [17,3,50,40,33,1,118,39,32,149,120,20,50,18,2,67]
     
-    def __init__(self, mac: str):
+    def __init__(self, mac: str, backend: str | None = None):
         mac = list(map(int, mac.split(':'), [16]*6))
         key = [i for i in self.KEY]
         iv = [i for i in self.IV]
         for i in range(6):
             key[i]  = (key[i] + mac[5-i]) % 255
             iv[i]   = (iv[i] + mac[5-i]) % 255
-        self.decoder = AES(key)
-        self.decoder.iv = iv
-
-    def encrypt(self, data):
+        self.key = bytes(key)
+        self.iv = bytes(iv)
+        self.backend, self.packet_cost = select_backend(self.key, self.iv, backend)
+        self.decoder = BACKENDS[self.backend](self.key, self.iv)
+        self._batch = None  # BatchAES, built on first use
+
+    def encrypt(self, data: bytes) -> bytes:
+        # Two overlapping blocks: [0:16], then [4:20] of the half-encrypted packet
         assert(len(data) == 20)
 
-        iv = self.decoder.iv
-        enc = self.decoder.encrypt([data[i] ^ iv[i] for i in range(16)]) + [0]*4
-        enc = enc[:4] + self.decoder.encrypt([enc[i+4] ^ iv[i] for i in range(16)])
-
-        return enc
+        head = self.decoder.encrypt_block(data[:16])
+        return head[:4] + self.decoder.encrypt_block(head[4:] + data[16:])
 
-    def decrypt(self, enc):
+    def decrypt(self, enc: bytes) -> bytes:
         assert(len(enc) == 20)
 
-        iv = self.decoder.iv
-        _block = self.decoder.decrypt(enc[4:])
-        dec = [_block[i] ^ iv[i] for i in range(16)]
-        _block = self.decoder.decrypt(enc[:4] + dec[:12]) 
-        dec = [_block[i] ^ iv[i] for i in range(16)] + dec[12:]
-        
-        return dec
+        tail = self.decoder.decrypt_block(enc[4:])
+        return self.decoder.decrypt_block(enc[:4] + tail[:12]) + tail[12:]
+
+    def decrypt_batch(self, enc):
+        assert(enc.ndim == 2 and enc.shape[1] == 20)
+
+        if self._batch is None:
+            self._batch = BatchAES(self.key, self.iv)
+
+        tail = self._batch.decrypt_blocks(enc[:, 4:])
+        head = self._batch.decrypt_blocks(np.concatenate((enc[:, :4], tail[:, :12]), axis=1))
+        return np.concatenate((head, tail[:, 12:]), axis=1)
     
 
 
 class Cryptor:
-    def __init__(self, mac: str):
-        self._cube = GanCube(mac)
+    def __init__(self, mac: str, backend: str | None = None):
+        """
+        backend: name from BACKENDS to force, or None to pick the fastest installed one
+        """
+        self._cube = GanCube(mac, backend)
+
+    @property
+    def backend(self) -> str:
+        return self._cube.backend
+
+    @property
+    def packet_cost(self) -> float:
+        """ Measured decryption cost of one packet, seconds """
+        return self._cube.packet_cost
 
     def encrypt(self, data):
-        return bytes(self._cube.encrypt(bytearray(data)))
+        return self._cube.encrypt(bytes(data))
 
     def decrypt(self, data):
-        return self._cube.decrypt([int(i) for i in data])
\ No newline at end of file
+        return list(self._cube.decrypt(bytes(data)))
+
+    def decrypt_batch(self, packets):
+        """
+        Decrypts many packets at once, e.g. a recorded session (requires numpy).
+        packets: (N, 20) uint8 array or a contiguous buffer of N * 20 bytes
+        ret: (N, 20) uint8 array. `ret.tolist()` gives rows in the format of decrypt()
+        """
+        if np is None:
+            raise ImportError('Batch decryption requires numpy')
+        if not isinstance(packets, np.ndarray):
+            packets = np.frombuffer(packets, dtype=np.uint8)
+        return self._cube.decrypt_batch(packets.reshape(-1, 20))
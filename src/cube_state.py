@@ -0,0 +1,162 @@
+"""
+Cubie-level model of the cube.
+Cubie order follows Kociemba:
+  corners URF, UFL, ULB, UBR, DFR, DLF, DBL, DRB
+  edges   UR, UF, UL, UB, DR, DF, DL, DB, FR, FL, BL, BR
+The state is one bytearray of 20 positions: 8 corners (piece * 3 + twist), then 12 edges (piece * 2 + flip).
+"""
+
+
+
+# Basic quarter turns in "replaced by" form: new_cp[i] = cp[p[i]], new_co[i] = (co[p[i]] + o[i]) % 3
+_BASIC_MOVES = {
+  'U': ([3, 0, 1, 2, 4, 5, 6, 7], [0, 0, 0, 0, 0, 0, 0, 0],
+        [3, 0, 1, 2, 4, 5, 6, 7, 8, 9, 10, 11], [0] * 12),
+  'R': ([4, 1, 2, 0, 7, 5, 6, 3], [2, 0, 0, 1, 1, 0, 0, 2],
+        [8, 1, 2, 3, 11, 5, 6, 7, 4, 9, 10, 0], [0] * 12),
+  'F': ([1, 5, 2, 3, 0, 4, 6, 7], [1, 2, 0, 0, 2, 1, 0, 0],
+        [0, 9, 2, 3, 4, 8, 6, 7, 1, 5, 10, 11], [0, 1, 0, 0, 0, 1, 0, 0, 1, 1, 0, 0]),
+  'D': ([0, 1, 2, 3, 5, 6, 7, 4], [0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 1, 2, 3, 5, 6, 7, 4, 8, 9, 10, 11], [0] * 12),
+  'L': ([0, 2, 6, 3, 4, 1, 5, 7], [0, 1, 2, 0, 0, 2, 1, 0],
+        [0, 1, 10, 3, 4, 5, 9, 7, 8, 2, 6, 11], [0] * 12),
+  'B': ([0, 1, 3, 7, 4, 5, 2, 6], [0, 0, 1, 2, 0, 0, 2, 1],
+        [0, 1, 2, 11, 4, 5, 6, 10, 8, 9, 3, 7], [0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 1, 1]),
+}
+
+_CORNER_FACELETS = ((8, 9, 20), (6, 18, 38), (0, 36, 47), (2, 45, 11),
+                    (29, 26, 15), (27, 44, 24), (33, 53, 42), (35, 17, 51))
+_CORNER_COLORS = ('URF', 'UFL', 'ULB', 'UBR', 'DFR', 'DLF', 'DBL', 'DRB')
+_EDGE_FACELETS = ((5, 10), (7, 19), (3, 37), (1, 46), (32, 16), (28, 25),
+                  (30, 43), (34, 52), (23, 12), (21, 41), (50, 39), (48, 14))
+_EDGE_COLORS = ('UR', 'UF', 'UL', 'UB', 'DR', 'DF', 'DL', 'DB', 'FR', 'FL', 'BL', 'BR')
+
+SOLVED = bytes([c * 3 for c in range(8)] + [e * 2 for e in range(12)])
+SOLVED_FACELETS = ''.join(face * 9 for face in 'URFDLB')
+
+STATE_PREFIX = '@'  # Marks a state message in the move stream: STATE_PREFIX + CubeState.hex()
+RESYNC = 'resync'  # Second item of a state message sent after lost moves or a reconnect
+
+
+
+def _compose(a: tuple, b: tuple) -> tuple:
+  # a then b
+  a_cp, a_co, a_ep, a_eo = a
+  b_cp, b_co, b_ep, b_eo = b
+  return ([a_cp[b_cp[i]] for i in range(8)],
+          [(a_co[b_cp[i]] + b_co[i]) % 3 for i in range(8)],
+          [a_ep[b_ep[i]] for i in range(12)],
+          [(a_eo[b_ep[i]] + b_eo[i]) % 2 for i in range(12)])
+
+
+def _compile_move(move: tuple) -> tuple:
+  """
+  Turns a move into cycles over the 20 positions of the state
+  ret: ((positions, tables), ...) where new[positions[k]] = tables[k][old[positions[k + 1]]]
+  """
+  cp, co, ep, eo = move
+  perm = cp + [8 + e for e in ep]
+  tables = [bytes((v // 3) * 3 + (v % 3 + co[i]) % 3 for v in range(24)) for i in range(8)] \
+         + [bytes((v // 2) * 2 + (v % 2 ^ eo[i]) for v in range(24)) for i in range(12)]
+
+  cycles = []
+  seen = set()
+  for start in range(20):
+    if start in seen or (perm[start] == start and tables[start] == bytes(range(24))):
+      continue
+    positions = [start]
+    while perm[positions[-1]] != start:
+      positions.append(perm[positions[-1]])
+    seen.update(positions)
+    cycles.append((tuple(positions), tuple(tables[p] for p in positions)))
+  return tuple(cycles)
+
+
+def _build_moves() -> dict[str, tuple]:
+  moves = {}
+  for face, quarter in _BASIC_MOVES.items():
+    half = _compose(quarter, quarter)
+    moves[face] = _compile_move(quarter)
+    moves[face + '2'] = _compile_move(half)
+    moves[face + '\''] = _compile_move(_compose(half, quarter))
+  return moves
+
+
+MOVES = _build_moves()  # 18 face turns -> precomputed cycles
+
+
+
+class CubeState:
+  def __init__(self, state: bytes = SOLVED):
+    self._state = bytearray(state)
+
+
+  @classmethod
+  def from_cubies(cls, cp: list[int], co: list[int], ep: list[int], eo: list[int]) -> 'CubeState':
+    if sorted(cp) != list(range(8)) or sorted(ep) != list(range(12)) \
+       or any(o > 2 for o in co) or any(o > 1 for o in eo):
+      raise ValueError(f'Not a valid cube: cp={cp}, co={co}, ep={ep}, eo={eo}')
+    return cls(bytes([cp[i] * 3 + co[i] for i in range(8)] + [ep[i] * 2 + eo[i] for i in range(12)]))
+
+
+  @classmethod
+  def from_hex(cls, text: str) -> 'CubeState':
+    state = bytes.fromhex(text)
+    if len(state) != len(SOLVED):
+      raise ValueError(f'Not a valid cube state: {text}')
+    return cls(state)
+
+
+  def hex(self) -> str:
+    return self._state.hex()
+
+
+  def to_cubies(self) -> tuple[list[int], list[int], list[int], list[int]]:
+    """
+    ret: cp, co, ep, eo as taken by from_cubies
+    """
+    s = self._state
+    return [v // 3 for v in s[:8]], [v % 3 for v in s[:8]], [v // 2 for v in s[8:]], [v % 2 for v in s[8:]]
+
+
+  def apply(self, move: str) -> None:
+    """
+    Applies one face turn in place (e.g. "R", "U'", "F2")
+    """
+    s = self._state
+    for positions, tables in MOVES[move]:
+      first = s[positions[0]]
+      for k in range(len(positions) - 1):
+        s[positions[k]] = tables[k][s[positions[k + 1]]]
+      s[positions[-1]] = tables[-1][first]
+
+
+  def is_solved(self) -> bool:
+    return self._state == SOLVED
+
+
+  def to_facelets(self) -> str:
+    """
+    ret: 54 facelets in Kociemba order (U1..U9, R1..R9, F, D, L, B)
+    """
+    facelets = list(SOLVED_FACELETS)
+    s = self._state
+    for i in range(8):
+      piece, twist = divmod(s[i], 3)
+      for n in range(3):
+        facelets[_CORNER_FACELETS[i][(n + twist) % 3]] = _CORNER_COLORS[piece][n]
+    for i in range(12):
+      piece, flip = divmod(s[8 + i], 2)
+      for n in range(2):
+        facelets[_EDGE_FACELETS[i][(n + flip) % 2]] = _EDGE_COLORS[piece][n]
+    return ''.join(facelets)
+
+
+  def matches(self, pattern: str, facelets: str | None = None) -> bool:
+    """
+    pattern: 'SOLVED' or 54 facelets in Kociemba order where '?' matches any color
+    facelets: to_facelets() of the cube, if the caller checks several patterns
+    """
+    if pattern == 'SOLVED':
+      return self.is_solved()
+    return all(p == '?' or p == f for p, f in zip(pattern, facelets or self.to_facelets()))
@@ -0,0 +1,62 @@
+import json
+import logging
+
+
+
+class DeviceRegistry:
+  """
+  Cubes connected before: address -> {'name', 'protocol', 'notify', 'write'}, the most
+  recently used last. Lets the controller connect to them directly and skip protocol detection
+  """
+  def __init__(self, path: str | None = 'known_cubes.json'):
+    """
+    path: JSON file of the registry. None keeps it in memory only
+    """
+    self.logger = logging.getLogger('Registry')
+    self.path = path
+    self.devices: dict[str, dict[str, str]] = {}
+
+    if path is None:
+      return
+    try:
+      with open(path) as file:
+        self.devices = json.load(file)
+    except FileNotFoundError:
+      pass
+    except (OSError, ValueError) as e:
+      self.logger.warning(f'Couldn\'t read {path}: {e}. Starting with empty registry')
+
+
+  def get(self, address: str) -> dict[str, str] | None:
+    return self.devices.get(address)
+
+
+  def recent(self) -> list[str]:
+    """
+    ret: addresses, the most recently used first
+    """
+    return list(reversed(self.devices))
+
+
+  def remember(self, address: str, name: str, protocol: str, notify: str, write: str) -> None:
+    entry = {'name': name, 'protocol': protocol, 'notify': notify, 'write': write}
+    if self.devices.get(address) == entry and next(reversed(self.devices)) == address:
+      return
+    self.devices.pop(address, None)
+    self.devices[address] = entry  # Moves it to the end
+    self.save()
+
+
+  def forget(self, address: str) -> None:
+    if self.devices.pop(address, None) is not None:
+      self.save()
+
+
+  def save(self) -> None:
+    if self.path is None:
+      return
+    try:
+      with open(self.path, 'w') as file:
+        json.dump(self.devices, file, indent=2)
+    except OSError as e:
+      self.logger.warning(f'Couldn\'t save {self.path}: {e}')
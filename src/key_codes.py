@@ -0,0 +1,139 @@
+"""
+Key names of binds.txt resolved to Windows virtual-key codes. The codes are plain ints
+(the values of win32con.VK_*), so binds compile without pywin32. Mouse buttons are
+VK_LBUTTON and VK_RBUTTON.
+"""
+import logging
+import string
+
+
+logger = logging.getLogger('KeyCodes')
+
+DEFAULT_HOLD_TIME = 0.05
+VK_LBUTTON, VK_RBUTTON = 0x01, 0x02
+VK_F1 = 0x70
+
+# Mapping for special keys
+SPECIAL_KEYS = {
+  'ctrl': 0x11,       # VK_CONTROL
+  'shift': 0x10,      # VK_SHIFT
+  'tab': 0x09,        # VK_TAB
+  'win': 0x5B,        # VK_LWIN
+  'left': 0x25,       # VK_LEFT
+  'right': 0x27,      # VK_RIGHT
+  'up': 0x26,         # VK_UP
+  'down': 0x28,       # VK_DOWN
+  'enter': 0x0D,      # VK_RETURN
+  'space': 0x20,      # VK_SPACE
+  'esc': 0x1B,        # VK_ESCAPE
+  'escape': 0x1B,
+  'backspace': 0x08,  # VK_BACK
+  'del': 0x2E,        # VK_DELETE
+  'delete': 0x2E,
+  'insert': 0x2D,     # VK_INSERT
+  'home': 0x24,       # VK_HOME
+  'end': 0x23,        # VK_END
+  'pageup': 0x21,     # VK_PRIOR
+  'pagedown': 0x22,   # VK_NEXT
+  'capslock': 0x14,   # VK_CAPITAL
+  'alt': 0x12,        # VK_MENU
+
+  'lmb': VK_LBUTTON,
+  'lclick': VK_LBUTTON,
+  'rmb': VK_RBUTTON,
+  'rclick': VK_RBUTTON,
+}
+
+SYMBOL_KEYS = {
+    # Symbol names
+    'comma': 0xBC,         # VK_OEM_COMMA
+    'period': 0xBE,        # VK_OEM_PERIOD
+    'slash': 0xBF,         # VK_OEM_2      ("/?" on US keyboard)
+    'backslash': 0xDC,     # VK_OEM_5      ("\|" on US keyboard)
+    'semicolon': 0xBA,     # VK_OEM_1      (";:" on US keyboard)
+    'quote': 0xDE,         # VK_OEM_7      ("'\"" on US keyboard)
+    'minus': 0xBD,         # VK_OEM_MINUS  ("-_" on US keyboard)
+    'equals': 0xBB,        # VK_OEM_PLUS   ("=+" on US keyboard)
+    'leftbracket': 0xDB,   # VK_OEM_4      ("[{" on US keyboard)
+    'rightbracket': 0xDD,  # VK_OEM_6      ("]}" on US keyboard)
+    'backtick': 0xC0,      # VK_OEM_3      ("`~" on US keyboard)
+
+    # Single character symbols
+    ',': 0xBC,  # VK_OEM_COMMA
+    '.': 0xBE,  # VK_OEM_PERIOD
+    '/': 0xBF,  # VK_OEM_2
+   '\\': 0xDC,  # VK_OEM_5
+    ';': 0xBA,  # VK_OEM_1
+    "'": 0xDE,  # VK_OEM_7
+    # '-': 0xBD,  # VK_OEM_MINUS  '-' reserved for separation
+    '=': 0xBB,  # VK_OEM_PLUS
+    '[': 0xDB,  # VK_OEM_4
+    ']': 0xDD,  # VK_OEM_6
+    '`': 0xC0,  # VK_OEM_3
+}
+
+KEY_NAMES = {code: name for name, code in reversed([*SPECIAL_KEYS.items(), *SYMBOL_KEYS.items()]) if len(name) > 1}  # First name of every code
+
+
+
+def resolve_comb(comb: list[str]) -> tuple[float, tuple[int]]:
+  """
+  comb: key combination in format ["ctrl", "A"] or ["W", "10.0s"]
+  ret: hold time and codes of the keys
+  """
+  ret: list[int] = []
+  hold_time = DEFAULT_HOLD_TIME
+
+  for subkey in comb:
+    subkey = subkey.casefold()
+
+    # Check for hold time
+    if subkey.endswith('s') and subkey[:-1].replace('.', '').isdigit():
+      try:
+        hold_time = float(subkey[:-1])
+      except ValueError:
+        logger.warning(f"Invalid hold time: {subkey}")
+      continue
+
+    # Check special keys
+    elif subkey in SPECIAL_KEYS:
+      ret.append(SPECIAL_KEYS[subkey])
+
+    # Check special symbols
+    elif subkey in SYMBOL_KEYS:
+      ret.append(SYMBOL_KEYS[subkey])
+
+    # Check function keys (F1-F12)
+    elif subkey.startswith('f') and subkey[1:].isdigit():
+      fn_num = int(subkey[1:])
+      if 1 <= fn_num <= 12:
+        ret.append(VK_F1 + fn_num - 1)
+      else:
+        logger.warning(f'Unsupported F key: {subkey}')
+
+    # Check single character keys
+    elif len(subkey) == 1:
+      if subkey in string.ascii_lowercase:
+        ret.append(ord(subkey.upper()))
+      elif subkey in string.digits:
+        ret.append(ord(subkey))
+      else:
+        logger.warning(f'Unrecognized character key: {subkey}')
+
+    else:
+      logger.warning(f'Unrecognizable key: {subkey}')
+
+  return hold_time, tuple(ret)
+
+
+def key_name(code: int) -> str:
+  """
+  ret: name of a key code for the log (e.g. 'ctrl', 'A', 'F5')
+  """
+  if code in KEY_NAMES:
+    return KEY_NAMES[code]
+  if VK_F1 <= code < VK_F1 + 12:
+    return f'F{code - VK_F1 + 1}'
+  if chr(code) in string.ascii_uppercase + string.digits:
+    return chr(code)
+  return f'{code:#04x}'
@@ -1,271 +1,376 @@
-import win32con, win32api
-import logging, time, string
+import argparse, bisect, heapq, itertools, logging, time
 
-from bind_reader import upload_binds
-from named_pipes import PipeReader
+from bind_compiler import Action, BindTable, BindWatcher, CompiledBinds, load_binds
+from cube_state import CubeState
+from key_output import DEFAULT_OUTPUT, OUTPUTS, make_output
+from move_buffer import MOVE_CODES, MOVE_NAMES, MoveBuffer
+from transport import DEFAULT_TRANSPORT, TRANSPORTS, make_reader, parse_address
 
 
 MAX_BUFFER_SIZE = 100
+SPIN = 0.2  # Seconds the loop polls after a frame before it sleeps: a wake-up costs ~0.1 ms, turns of a solve come closer
+JITTER_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05)  # Upper bounds in seconds, the last bucket is the rest
+
+
+
+class JitterHistogram:
+  """
+  How late presses and releases are sent compared to their schedule
+  """
+  def __init__(self, bounds: tuple[float] = JITTER_BUCKETS):
+    self.bounds = bounds
+    self.counts = [0] * (len(bounds) + 1)
+    self.total = 0.0
+    self.worst = 0.0
+
+
+  def add(self, delay: float) -> None:
+    self.counts[bisect.bisect_left(self.bounds, delay)] += 1
+    self.total += delay
+    if delay > self.worst:
+      self.worst = delay
+
+
+  def report(self) -> str:
+    count = sum(self.counts)
+    if not count:
+      return 'no keys were sent'
+    lines = [f'{count} presses and releases, late by {self.total / count * 1e3:.2f} ms on average, {self.worst * 1e3:.2f} ms at most']
+    labels = [f'<= {bound * 1e3:g} ms' for bound in self.bounds] + [f'> {self.bounds[-1] * 1e3:g} ms']
+    for label, bucket in zip(labels, self.counts):
+      lines.append(f'  {label:>9} {bucket:6} {"#" * round(40 * bucket / count)}')
+    return '\n'.join(lines)
 
 
 
 class KeyEmulator:
-  def __init__(self, bind_list: dict[tuple[str], list[list[str]]], constants: dict[str, any] | None = None):
+  def __init__(self, table: BindTable, constants: dict[str, any] | None = None,
+               pressed: dict[int, int] | None = None, jitter: JitterHistogram | None = None, output=None):
+    """
+    table: compiled binds of the cube (see bind_compiler.py)
+    pressed, jitter, output: shared by the emulators of all cubes, since keys are held system-wide
+    output: where keys are sent (see key_output.py), the default one of the platform if None
+    """
     self.logger = logging.getLogger('KeyEmulator')
-    self.bind_list = bind_list
+    self.table = table
+    self.matched_states: set[str] = self._matched_states(CubeState())
 
     if not constants:
       constants = {'delete_mode': 'flush', 'idle_time': 10}
     self.delete_mode = constants['delete_mode']
 
-    self.schedule: list[tuple[float, bool, int | str]] = []  # Elements: (time, is_to_press, key)
-    self.currently_pressed: list[int | str] = []
+    self.schedule: list[tuple[float, int, bool, int]] = []  # Heap of (time, order, is_to_press, key)
+    self._order = itertools.count()  # Keeps events of the same time in the order they were added
+    self.pressed = {} if pressed is None else pressed  # key -> number of binds holding it
+    self.jitter = JitterHistogram() if jitter is None else jitter
+    self.output = make_output() if output is None else output
 
 
-  def process_buffer(self, buffer: list[str]) -> None:
-    if keys := self._recognize(buffer):
-      coded_combs = [self._key_to_codes(comb) for comb in keys]  # list[(time, coded_comb)]
-      self._create_task(coded_combs)
-  
-
-  def _recognize(self, turns: list[str]) -> list[list[str]] | None:
+  def reload(self, table: BindTable, constants: dict[str, any], cube: CubeState) -> None:
     """
-    Search matches with binds in `turns`
-    ret: key to press (i.g. [['ctrl', 'A'], ['0.5s'], ['alt', 'tab']])
+    Switches to new binds. Scheduled presses and releases stay, so held keys are released
+    cube: current state of the cube. New state binds it already matches don't fire
     """
-    for formula in self.bind_list.keys():
-      if len(formula) <= len(turns) and turns[-len(formula):] == list(formula):
-        ret = self.bind_list[formula]
-
-        if self.delete_mode == 'flush':
-          turns.clear()
-        elif self.delete_mode == 'postfix':
-          del turns[-len(formula):]
-        elif self.delete_mode == 'keep':
-          pass
-        else:
-          self.logger.warning(f'Invalid DELETE_MODE: {self.delete_mode}. Switching to \'flush\'...')
-          self.delete_mode = 'flush'
-
-        return ret
-    return None
+    self.table = table
+    self.delete_mode = constants['delete_mode']
+    self.matched_states = self._matched_states(cube)
+
+
+  def process_buffer(self, buffer: MoveBuffer) -> None:
+    if action := self._recognize(buffer):
+      self._create_task(action)
   
 
-  def _key_to_codes(self, key: list[str]) -> tuple[float, list[int | str]]:
+  def process_state(self, cube: CubeState, press: bool = True) -> None:
     """
-    key: key press in format ["ctrl", "A"]
-    ret: hold_time and list of codes 'win32con.VK_{}'
+    Presses keys of state binds which the cube has just started to match
+    press: False to only remember matched states (e.g. on a state report from the cube)
     """
-    ret: list[int] = []
-    hold_time: float = 0.05
-
-    # Mapping for special keys
-    special_keys = {
-      'ctrl': win32con.VK_CONTROL,
-      'shift': win32con.VK_SHIFT,
-      'tab': win32con.VK_TAB,
-      'win': win32con.VK_LWIN,
-      'left': win32con.VK_LEFT,
-      'right': win32con.VK_RIGHT,
-      'up': win32con.VK_UP,
-      'down': win32con.VK_DOWN,
-      'enter': win32con.VK_RETURN,
-      'space': win32con.VK_SPACE,
-      'esc': win32con.VK_ESCAPE,
-      'escape': win32con.VK_ESCAPE,
-      'backspace': win32con.VK_BACK,
-      'del': win32con.VK_DELETE,
-      'delete': win32con.VK_DELETE,
-      'insert': win32con.VK_INSERT,
-      'home': win32con.VK_HOME,
-      'end': win32con.VK_END,
-      'pageup': win32con.VK_PRIOR,
-      'pagedown': win32con.VK_NEXT,
-      'capslock': win32con.VK_CAPITAL,
-      'alt': win32con.VK_MENU,
-
-      'lmb': 'lmb',
-      'lclick': 'lmb',
-      'rmb': 'rmb',
-      'rclick': 'rmb'
-    }
-
-    symbol_map = {
-        # Symbol names
-        'comma': 0xBC,         # VK_OEM_COMMA
-        'period': 0xBE,        # VK_OEM_PERIOD
-        'slash': 0xBF,         # VK_OEM_2      ("/?" on US keyboard)
-        'backslash': 0xDC,     # VK_OEM_5      ("\|" on US keyboard)
-        'semicolon': 0xBA,     # VK_OEM_1      (";:" on US keyboard)
-        'quote': 0xDE,         # VK_OEM_7      ("'\"" on US keyboard)
-        'minus': 0xBD,         # VK_OEM_MINUS  ("-_" on US keyboard)
-        'equals': 0xBB,        # VK_OEM_PLUS   ("=+" on US keyboard)
-        'leftbracket': 0xDB,   # VK_OEM_4      ("[{" on US keyboard)
-        'rightbracket': 0xDD,  # VK_OEM_6      ("]}" on US keyboard)
-        'backtick': 0xC0,      # VK_OEM_3      ("`~" on US keyboard)
-        
-        # Single character symbols
-        ',': 0xBC,  # VK_OEM_COMMA
-        '.': 0xBE,  # VK_OEM_PERIOD
-        '/': 0xBF,  # VK_OEM_2
-       '\\': 0xDC,  # VK_OEM_5
-        ';': 0xBA,  # VK_OEM_1
-        "'": 0xDE,  # VK_OEM_7
-        # '-': 0xBD,  # VK_OEM_MINUS  '-' reserved for separation
-        '=': 0xBB,  # VK_OEM_PLUS
-        '[': 0xDB,  # VK_OEM_4
-        ']': 0xDD,  # VK_OEM_6
-        '`': 0xC0,  # VK_OEM_3
-    }
-
-    for subkey in key:
-      subkey = subkey.casefold()
-      
-      # Check for hold time
-      if subkey.endswith('s') and subkey[:-1].replace('.', '').isdigit():
-        try:
-          hold_time = float(subkey[:-1])
-        except ValueError:
-          self.logger.warning(f"Invalid hold time: {subkey}")
-        continue
-
-      # Check special keys
-      elif subkey in special_keys.keys():
-        ret.append(special_keys[subkey])
-
-      # Check special symbpls
-      elif subkey in symbol_map.keys():
-        ret.append(symbol_map[subkey])
-      
-      # Check function keys (F1-F12)
-      elif subkey.startswith('f') and subkey[1:].isdigit():
-        fn_num = int(subkey[1:])
-        if 1 <= fn_num <= 12:
-          ret.append(getattr(win32con, f'VK_F{fn_num}'))
-        else:
-          self.logger.warning(f'Unsupported F key: {subkey}')
-      
-      # Check single character keys
-      elif len(subkey) == 1:
-        if subkey in string.ascii_lowercase:
-          ret.append(ord(subkey.upper()))
-        elif subkey in string.digits:
-          ret.append(ord(subkey))
-        else:
-          self.logger.warning(f'Unrecognized character key: {subkey}')
-      
-      else:
-        self.logger.warning(f'Unrecognizable key: {subkey}')
-
-    return hold_time, ret
-
-
-  def _create_task(self, tasks: list[tuple[float, list[int | str]]]):
-    schedule = []
+    if not self.table.state_binds:
+      return
+    matched = self._matched_states(cube)
+    if press:
+      for pattern, action in self.table.state_binds.items():
+        if pattern in matched and pattern not in self.matched_states:
+          self._create_task(action)
+    self.matched_states = matched
+
+
+  def _matched_states(self, cube: CubeState) -> set[str]:
+    facelets = None  # Made once for all the patterns, and only if one needs them
+    ret = set()
+    for pattern in self.table.state_binds:
+      if pattern != 'SOLVED' and facelets is None:
+        facelets = cube.to_facelets()
+      if cube.matches(pattern, facelets):
+        ret.add(pattern)
+    return ret
+
+
+  def _recognize(self, turns: MoveBuffer) -> Action | None:
+    """
+    Search matches with binds in `turns`
+    ret: (hold time, key codes) to press (i.g. ((0.05, (0x11, 0x41)), (0.5, ()), (0.05, (0x12, 0x09))))
+    """
+    if turns.cancelled:  # The buffer ends the way it ended before
+      return None
+    skipped = False
+    if turns.behind:  # The last move went before a turn of the opposite face, the last code is older
+      index = self.table.trie.match(turns, min_length=2)
+      if index < 0:
+        index = self.table.trie.match(turns, skip_last=True)
+        skipped = index >= 0
+    else:
+      index = self.table.trie.match(turns)
+    if index < 0:
+      return None
+    ret = self.table.actions[index]
+
+    if self.delete_mode == 'flush':
+      turns.clear()
+    elif self.delete_mode == 'postfix':
+      turns.pop(self.table.trie.lengths[index], keep_last=skipped)  # The buffer ends with its canonical form
+    elif self.delete_mode == 'keep':
+      pass
+    else:
+      self.logger.warning(f'Invalid DELETE_MODE: {self.delete_mode}. Switching to \'flush\'...')
+      self.delete_mode = 'flush'
+
+    return ret
+
+
+  def _create_task(self, tasks: Action):
+    schedule, order = self.schedule, self._order
 
     t = time.time()
     for hold_time, keys in tasks:
       for key in keys:
-        schedule.append((t, True, key))
+        heapq.heappush(schedule, (t, next(order), True, key))
       
       t += hold_time
 
       for key in reversed(keys):
-        schedule.append((t, False, key))
+        heapq.heappush(schedule, (t, next(order), False, key))
       
       t += 0.05  # To separate presses
-    
-    self.schedule.extend(schedule)
 
 
   def press_keys(self) -> None:
     """
-    Process the schedule
+    Sends the presses and releases that are due, in one batch. A key held by several binds is
+    released by the last of them
     """
+    schedule, pressed = self.schedule, self.pressed
+    batch = []
     t = time.time()
-    tasks = [task for task in self.schedule if task[0] <= t]
+    while schedule and schedule[0][0] <= t:
+      scheduled_to, _, is_to_press, key = heapq.heappop(schedule)
+      self.jitter.add(time.time() - scheduled_to)
 
-    for scheduled_to, is_to_press, key in tasks:
-      # Checking if trying to unpress unpressed key
-      if not is_to_press and key not in self.currently_pressed:
-        continue
-      # ...and to press pressed
-      if is_to_press and key in self.currently_pressed:
-        continue
-
-      # Regular key
-      if isinstance(key, int):
-        if is_to_press:
-          win32api.keybd_event(key, 0, 0, 0)
-        else:
-          win32api.keybd_event(key, 0, win32con.KEYEVENTF_KEYUP, 0)
-
-      # Mouse
-      else:
-        if key == 'lmb':
-          if is_to_press:
-            win32api.mouse_event(win32con.MOUSEEVENTF_LEFTDOWN, 0, 0, 0, 0)
-          else:
-            win32api.mouse_event(win32con.MOUSEEVENTF_LEFTUP, 0, 0, 0, 0)
-        elif key == 'rmb':
-          if is_to_press:
-            win32api.mouse_event(win32con.MOUSEEVENTF_RIGHTDOWN, 0, 0, 0, 0)
-          else:
-            win32api.mouse_event(win32con.MOUSEEVENTF_RIGHTUP, 0, 0, 0, 0)
-
-      # Updating currently_pressed
+      count = pressed.get(key, 0)
       if is_to_press:
-        self.currently_pressed.append(key)
+        pressed[key] = count + 1
+        if count:  # Already held
+          continue
       else:
-        self.currently_pressed.remove(key)
-    
-    # Deleting completed tasks
-    self.schedule = [task for task in self.schedule if task[0] > t]
+        if count == 0:  # Not pressed
+          continue
+        if count > 1:  # Still held by another bind
+          pressed[key] = count - 1
+          continue
+        del pressed[key]
+
+      batch.append((key, is_to_press))
+
+    if batch:
+      self.output.send(batch)
+
+
+  def next_event(self) -> float | None:
+    """
+    ret: time of the earliest scheduled press or release, None if nothing is scheduled
+    """
+    return self.schedule[0][0] if self.schedule else None
 
 
 
 logger = logging.getLogger('KeyScript')
 
 
-def trim_buffer(buffer: list[str]) -> None:
-  while len(buffer) > 0:
-    if buffer[-1][0] not in 'ULFRBD':
-      logger.warning(f'Strange thing in buffer: {buffer[-1]}. Deleting it')
-      del buffer[-1]
-      continue
+class BindDispatcher:
+  """
+  Routes moves and states of every cube to its own emulator (binds scoped to it),
+  buffer of moves and cube state. Doesn't wait by itself: the owner calls press_keys()
+  and clear_idle() at next_deadline()
+  """
+  def __init__(self, binds: CompiledBinds, constants: dict[str, any], output=None):
+    """
+    output: where keys are sent (see key_output.py), the default one of the platform if None
+    """
+    self.binds = binds
+    self.constants = constants
 
-    if len(buffer) == 1:
-      break
+    self.emulators: dict[str, KeyEmulator] = {}
+    self.buffers: dict[str, MoveBuffer] = {}
+    self.cubes: dict[str, CubeState] = {}  # Assumed solved until the controller reports the state
+    self.last_ts: dict[str, float] = {}
+    self.pressed: dict[int, int] = {}  # Shared by the emulators
+    self.jitter = JitterHistogram()
+    self.output = make_output() if output is None else output
 
-    if buffer[-1][0] != buffer[-2][0]:
-      break
 
-    # Merge/cancel out similar turns
-    n1 = buffer[-1][1:]
-    if n1 == '\'': n1 = 3
-    elif n1 != '': n1 = int(n1)
-    else:          n1 = 1
-    
-    n2 = buffer[-2][1:]
-    if n2 == '\'': n2 = 3
-    elif n2 != '': n2 = int(n2)
-    else:          n2 = 1
+  def handle_state(self, cube_id: str, state: bytes, resync: bool = False) -> None:
+    """
+    resync: the state comes after lost moves or a reconnect
+    """
+    key_emulator, buffer = self._session(cube_id)
+    cube = CubeState(state)
+    if cube.hex() == self.cubes[cube_id].hex() and not resync:  # E.g. the answer to a watchdog probe
+      logger.debug(f'Cube {cube_id} state is as expected')
+      return
+    self.cubes[cube_id] = cube
+    key_emulator.process_state(cube, press=False)
+    buffer.clear()  # Moves before the state are missing, so the buffer can't be trusted
+    logger.info(f'Cube {cube_id} state - {cube.to_facelets()}')
+
+
+  def reload(self, binds: CompiledBinds, constants: dict[str, any]) -> None:
+    """
+    Swaps in new binds and constants between moves. Buffers and held keys are kept
+    """
+    self.binds = binds
+    self.constants = constants
+    for cube_id, key_emulator in self.emulators.items():
+      key_emulator.reload(binds.for_cube(cube_id), constants, self.cubes[cube_id])
+    logger.info(f'Reloaded {binds.count} binds')
 
-    del buffer[-1]
 
-    sm = (n1 + n2) % 4
+  def handle_moves(self, cube_id: str, moves: list[str], timestamp: float | None = None) -> None:
+    """
+    moves: face turns (e.g. "R", "U'")
+    timestamp: time.monotonic() of the notification with the moves, for the log
+    """
+    codes = []
+    for move in moves:
+      if (code := MOVE_CODES.get(move)) is None:
+        logger.warning(f'Strange thing in buffer: {move}. Deleting it')
+        continue
+      codes.append(code)
+    self.handle_codes(cube_id, codes, timestamp)
 
-    if sm == 0:   del buffer[-1]
-    elif sm == 1: buffer[-1] = buffer[-1][0]
-    elif sm == 2: buffer[-1] = buffer[-1][0] + '2'
-    else:         buffer[-1] = buffer[-1][0] + '\''
 
-  if len(buffer) > MAX_BUFFER_SIZE:
-    del buffer[:-MAX_BUFFER_SIZE]
-    trim_buffer(buffer)
+  def handle_codes(self, cube_id: str, codes: bytes | list[int], timestamp: float | None = None) -> None:
+    """
+    codes: move codes of move_buffer.py, as frames of transport.py carry them
+    timestamp: time.monotonic() of the notification with the moves, for the log
+    """
+    key_emulator, buffer = self._session(cube_id)
+    cube = self.cubes[cube_id]
+    self.last_ts[cube_id] = time.time()
+    for code in codes:  # Emulating reading one-by-one
+      buffer.push(code)
+      cube.apply(MOVE_NAMES[code])
+
+      key_emulator.process_buffer(buffer)
+      key_emulator.process_state(cube)
+    latency = f' ({(time.monotonic() - timestamp) * 1000:.1f} ms after the notification)' if timestamp else ''
+    logger.info(f'Cube {cube_id} buffer (last 10) - {buffer.names(10)}{latency}')
+
+
+  def press_keys(self) -> None:
+    for key_emulator in self.emulators.values():
+      key_emulator.press_keys()
 
 
-def main():
+  def clear_idle(self) -> None:
+    if self.constants['idle_time'] == 0:
+      return
+    for cube_id, buffer in self.buffers.items():
+      if buffer and time.time() - self.last_ts[cube_id] >= self.constants['idle_time']:
+        buffer.clear()
+        logger.info(f'Cleared the buffer of cube {cube_id} due to inactivity. []')
+
+
+  def next_deadline(self) -> float | None:
+    """
+    ret: time.time() of the next scheduled key or idle buffer, None if there is nothing to wait for
+    """
+    deadlines = [t for key_emulator in self.emulators.values() if (t := key_emulator.next_event()) is not None]
+    if self.constants['idle_time'] != 0:
+      deadlines += [self.last_ts[cube_id] + self.constants['idle_time'] for cube_id, buffer in self.buffers.items() if buffer]
+    return min(deadlines, default=None)
+
+
+  def _session(self, cube_id: str) -> tuple[KeyEmulator, MoveBuffer]:
+    if cube_id not in self.emulators:
+      self.emulators[cube_id] = KeyEmulator(self.binds.for_cube(cube_id), self.constants, self.pressed, self.jitter, self.output)
+      self.buffers[cube_id] = MoveBuffer(MAX_BUFFER_SIZE)
+      self.cubes[cube_id] = CubeState()
+    return self.emulators[cube_id], self.buffers[cube_id]
+
+
+def run(pipe, binds: CompiledBinds, constants: dict[str, any], output=None,
+        max_wait: float | None = None, watch: str | None = None, spin: float = SPIN) -> None:
+  """
+  Handles frames from a connected reader until EOF. Sleeps until a frame comes, a scheduled
+  key is due or a buffer goes idle, whichever is first
+  output: see BindDispatcher
+  max_wait: upper bound for one wait (0 polls without sleeping)
+  watch: path of binds.txt to reload the binds from when it changes
+  spin: seconds to keep polling the reader after a frame, so the next move of a solve is
+        read without waking up the process (0 sleeps right away)
+  """
+  dispatcher = BindDispatcher(binds, constants, output)
+  reloads = []  # Filled by the watcher thread
+  watcher = None
+  if watch is not None:
+    watcher = BindWatcher(watch, lambda binds, constants: reloads.append((binds, constants)))
+    watcher.start()
+
+  try:
+    _handle_frames(pipe, dispatcher, reloads, max_wait, spin)
+  finally:
+    if watcher:
+      watcher.stop()
+
+
+def _handle_frames(pipe, dispatcher: BindDispatcher, reloads: list, max_wait: float | None, spin: float) -> None:
+  spin_until = 0.0  # time.monotonic()
+  while True:
+    deadline = dispatcher.next_deadline()
+    timeout = None if deadline is None else max(0.0, deadline - time.time())
+    if max_wait is not None:
+      timeout = max_wait if timeout is None else min(timeout, max_wait)
+    if spin_until and time.monotonic() < spin_until:
+      timeout = 0.0
+
+    frames = pipe.read(timeout)
+    if frames is False:
+      logger.critical('The controller closed the move stream.')
+      logger.info(f'Key timing: {dispatcher.jitter.report()}')
+      break
+
+    while reloads:  # Before the moves that came after the change
+      dispatcher.reload(*reloads.pop(0))
+
+    if frames:
+      spin_until = time.monotonic() + spin if spin else 0.0
+    for frame in frames or ():
+      if frame.state:
+        dispatcher.handle_state(frame.cube_id, frame.state, frame.resync)
+      else:
+        dispatcher.handle_codes(frame.cube_id, frame.codes, frame.timestamp)
+
+    dispatcher.press_keys()  # Keys of a just recognized formula go out right away
+    dispatcher.clear_idle()
+
+
+def main(transport: str = DEFAULT_TRANSPORT, address=None, output: str = DEFAULT_OUTPUT, spin: float = SPIN):
+  """
+  transport, address: how moves come from controller.py (see transport.py)
+  output: where keys are sent (see key_output.py)
+  spin: seconds to poll for the next move before sleeping (see run)
+  """
   # Configuring logger
   logging.basicConfig(
       level=logging.INFO,
@@ -273,34 +378,23 @@ def main():
       datefmt='%H:%M:%S'
   )
 
-  binds, constants = upload_binds()
-  key_emulator = KeyEmulator(binds, constants)
+  binds, constants = load_binds()
 
-  pipe = PipeReader()
+  keys = make_output(output)
+  pipe = make_reader(transport, address)
   pipe.connect()
-
-  buffer: list[str] = []  # global buffer of moves
-
-  last_ts = time.time()
-
-  while True:
-    key_emulator.press_keys()
-
-    if moves := pipe.read():
-      for move in moves:  # Emulating reading one-by-one
-        last_ts = time.time()
-        buffer.append(move)
-
-        trim_buffer(buffer)
-        key_emulator.process_buffer(buffer)
-        logger.info(f'Current buffer (last 10) - {buffer[-10:]}')
-    
-    elif constants['idle_time'] != 0:
-      if time.time() - last_ts > constants['idle_time'] and len(buffer) != 0:
-        buffer.clear()
-        logger.info('Cleared the buffer due to inactivity. []')
-        last_ts = time.time()
+  try:
+    run(pipe, binds, constants, keys, watch='binds.txt', spin=spin)
+  finally:
+    keys.close()
 
 
 if __name__ == "__main__":
-  main()
\ No newline at end of file
+  parser = argparse.ArgumentParser(description='Presses keys bound to formulas in binds.txt.')
+  parser.add_argument('--transport', choices=TRANSPORTS, default=DEFAULT_TRANSPORT, help=f'move stream from controller.py (default: {DEFAULT_TRANSPORT})')
+  parser.add_argument('--address', help='pipe name, socket path or host:port of the transport')
+  parser.add_argument('--output', choices=OUTPUTS, default=DEFAULT_OUTPUT, help=f'how keys are pressed (default: {DEFAULT_OUTPUT})')
+  parser.add_argument('--spin', type=float, default=SPIN, help=f'seconds to poll for the next move before sleeping (default: {SPIN}). '
+                                                                'Keeps a CPU core busy while the cube is turned, 0 sleeps right away')
+  args = parser.parse_args()
+  main(args.transport, parse_address(args.transport, args.address), args.output, args.spin)
\ No newline at end of file
@@ -0,0 +1,191 @@
+"""
+Where the key emulator sends presses and releases. Every backend has the same contract:
+  output.send(events)  events: list of (key code, is_to_press) that are due together,
+                       sent as one batch in this order
+  output.close()
+Backends: 'sendinput' - Windows SendInput, the whole batch in one call, so the keys of a
+combination (e.g. ctrl+shift+S) come with no gap between them; 'uinput' - a virtual
+keyboard of the Linux kernel (needs python-evdev and write access to /dev/uinput), the
+batch ends with one SYN_REPORT; 'record' - keeps events in memory and logs them, for
+benchmarks and runs without pressing anything.
+Key codes are virtual-key codes of key_codes.py.
+"""
+import ctypes
+import logging
+import string
+import sys
+import time
+
+from key_codes import SPECIAL_KEYS, SYMBOL_KEYS, VK_F1, VK_LBUTTON, VK_RBUTTON, key_name
+
+
+OUTPUTS = ('sendinput', 'uinput', 'record')
+DEFAULT_OUTPUT = 'sendinput' if sys.platform == 'win32' else 'uinput'
+
+logger = logging.getLogger('KeyOutput')
+
+
+
+###########################      SendInput       ###########################
+INPUT_MOUSE, INPUT_KEYBOARD = 0, 1
+KEYEVENTF_EXTENDEDKEY, KEYEVENTF_KEYUP = 0x0001, 0x0002
+MOUSE_FLAGS = {  # key -> (press flag, release flag)
+  VK_LBUTTON: (0x0002, 0x0004),  # MOUSEEVENTF_LEFTDOWN, MOUSEEVENTF_LEFTUP
+  VK_RBUTTON: (0x0008, 0x0010),  # MOUSEEVENTF_RIGHTDOWN, MOUSEEVENTF_RIGHTUP
+}
+# Keys of the navigation block. Without the flag they are taken for numpad keys
+EXTENDED_KEYS = frozenset([0x21, 0x22, 0x23, 0x24, 0x25, 0x26, 0x27, 0x28, 0x2D, 0x2E, 0x5B])
+
+
+class _MOUSEINPUT(ctypes.Structure):
+  _fields_ = [('dx', ctypes.c_int32), ('dy', ctypes.c_int32), ('mouseData', ctypes.c_uint32),
+              ('dwFlags', ctypes.c_uint32), ('time', ctypes.c_uint32), ('dwExtraInfo', ctypes.c_size_t)]
+
+
+class _KEYBDINPUT(ctypes.Structure):
+  _fields_ = [('wVk', ctypes.c_uint16), ('wScan', ctypes.c_uint16), ('dwFlags', ctypes.c_uint32),
+              ('time', ctypes.c_uint32), ('dwExtraInfo', ctypes.c_size_t)]
+
+
+class _INPUTUNION(ctypes.Union):
+  _fields_ = [('mi', _MOUSEINPUT), ('ki', _KEYBDINPUT)]  # The largest member sets the size of INPUT
+
+
+class _INPUT(ctypes.Structure):
+  _anonymous_ = ('u',)
+  _fields_ = [('type', ctypes.c_uint32), ('u', _INPUTUNION)]
+
+
+
+class SendInputOutput:
+  def __init__(self):
+    if sys.platform != 'win32':
+      raise OSError('SendInput is only available on Windows')
+    user32 = ctypes.WinDLL('user32', use_last_error=True)
+    self._send_input = user32.SendInput
+    self._send_input.argtypes = (ctypes.c_uint, ctypes.POINTER(_INPUT), ctypes.c_int)
+    self._send_input.restype = ctypes.c_uint
+
+
+  def send(self, events: list[tuple[int, bool]]) -> None:
+    inputs = (_INPUT * len(events))()
+    for item, (key, is_to_press) in zip(inputs, events):
+      if key in MOUSE_FLAGS:
+        item.type = INPUT_MOUSE
+        item.mi.dwFlags = MOUSE_FLAGS[key][0 if is_to_press else 1]
+      else:
+        item.type = INPUT_KEYBOARD
+        item.ki.wVk = key
+        item.ki.dwFlags = (0 if is_to_press else KEYEVENTF_KEYUP) | (KEYEVENTF_EXTENDEDKEY if key in EXTENDED_KEYS else 0)
+
+    sent = self._send_input(len(events), inputs, ctypes.sizeof(_INPUT))
+    if sent != len(events):  # E.g. the window in focus runs as administrator
+      logger.warning(f'SendInput sent {sent} of {len(events)} events (error {ctypes.get_last_error()})')
+
+
+  def close(self) -> None:
+    pass
+
+
+
+###########################        uinput        ###########################
+# Virtual-key code -> name of the Linux key code in evdev.ecodes
+UINPUT_KEYS = {
+  **{ord(char): f'KEY_{char}' for char in string.ascii_uppercase + string.digits},
+  **{VK_F1 + i: f'KEY_F{i + 1}' for i in range(12)},
+  SPECIAL_KEYS['ctrl']: 'KEY_LEFTCTRL',
+  SPECIAL_KEYS['shift']: 'KEY_LEFTSHIFT',
+  SPECIAL_KEYS['alt']: 'KEY_LEFTALT',
+  SPECIAL_KEYS['win']: 'KEY_LEFTMETA',
+  SPECIAL_KEYS['tab']: 'KEY_TAB',
+  SPECIAL_KEYS['left']: 'KEY_LEFT',
+  SPECIAL_KEYS['right']: 'KEY_RIGHT',
+  SPECIAL_KEYS['up']: 'KEY_UP',
+  SPECIAL_KEYS['down']: 'KEY_DOWN',
+  SPECIAL_KEYS['enter']: 'KEY_ENTER',
+  SPECIAL_KEYS['space']: 'KEY_SPACE',
+  SPECIAL_KEYS['esc']: 'KEY_ESC',
+  SPECIAL_KEYS['backspace']: 'KEY_BACKSPACE',
+  SPECIAL_KEYS['del']: 'KEY_DELETE',
+  SPECIAL_KEYS['insert']: 'KEY_INSERT',
+  SPECIAL_KEYS['home']: 'KEY_HOME',
+  SPECIAL_KEYS['end']: 'KEY_END',
+  SPECIAL_KEYS['pageup']: 'KEY_PAGEUP',
+  SPECIAL_KEYS['pagedown']: 'KEY_PAGEDOWN',
+  SPECIAL_KEYS['capslock']: 'KEY_CAPSLOCK',
+  SYMBOL_KEYS['comma']: 'KEY_COMMA',
+  SYMBOL_KEYS['period']: 'KEY_DOT',
+  SYMBOL_KEYS['slash']: 'KEY_SLASH',
+  SYMBOL_KEYS['backslash']: 'KEY_BACKSLASH',
+  SYMBOL_KEYS['semicolon']: 'KEY_SEMICOLON',
+  SYMBOL_KEYS['quote']: 'KEY_APOSTROPHE',
+  SYMBOL_KEYS['minus']: 'KEY_MINUS',
+  SYMBOL_KEYS['equals']: 'KEY_EQUAL',
+  SYMBOL_KEYS['leftbracket']: 'KEY_LEFTBRACE',
+  SYMBOL_KEYS['rightbracket']: 'KEY_RIGHTBRACE',
+  SYMBOL_KEYS['backtick']: 'KEY_GRAVE',
+  VK_LBUTTON: 'BTN_LEFT',
+  VK_RBUTTON: 'BTN_RIGHT',
+}
+
+
+
+class UinputOutput:
+  def __init__(self, name: str = 'GAN cube keys'):
+    from evdev import UInput, ecodes  # Needs python-evdev
+    self.ecodes = ecodes
+    self.codes = {key: ecodes.ecodes[code_name] for key, code_name in UINPUT_KEYS.items()}
+    # Relative axes make the device a mouse too, so the buttons are not ignored
+    self.device = UInput({ecodes.EV_KEY: sorted(set(self.codes.values())), ecodes.EV_REL: [ecodes.REL_X, ecodes.REL_Y]}, name=name)
+
+
+  def send(self, events: list[tuple[int, bool]]) -> None:
+    write, ev_key = self.device.write, self.ecodes.EV_KEY
+    for key, is_to_press in events:
+      if (code := self.codes.get(key)) is None:
+        logger.warning(f'Key {key_name(key)} has no uinput code')
+        continue
+      write(ev_key, code, 1 if is_to_press else 0)
+    self.device.syn()  # Applications see the batch at once
+
+
+  def close(self) -> None:
+    self.device.close()
+
+
+
+###########################       Recording      ###########################
+class RecordingOutput:
+  """
+  Presses nothing: keeps the events with the time they were sent
+  """
+  def __init__(self, log: bool = True):
+    self.events: list[tuple[float, int, bool]] = []  # (time.perf_counter(), key, is_to_press)
+    self.batches = 0
+    self.log = log
+
+
+  def send(self, events: list[tuple[int, bool]]) -> None:
+    t = time.perf_counter()
+    self.events += [(t, key, is_to_press) for key, is_to_press in events]
+    self.batches += 1
+    if self.log:
+      logger.info(f'Keys: {" ".join(("+" if is_to_press else "-") + key_name(key) for key, is_to_press in events)}')
+
+
+  def close(self) -> None:
+    pass
+
+
+
+def make_output(output: str = DEFAULT_OUTPUT, **options):
+  """
+  options: extra arguments of the backend (e.g. log of 'record')
+  """
+  if output == 'sendinput':
+    return SendInputOutput(**options)
+  if output == 'uinput':
+    return UinputOutput(**options)
+  if output == 'record':
+    return RecordingOutput(**options)
+  raise ValueError(f'Unknown output: {output}')
@@ -0,0 +1,130 @@
+"""
+Move buffer of the key emulator. Moves are small ints, face * 4 + quarter turns clockwise
+(U = 1, U2 = 2, U' = 3, R = 5...). Code face * 4 is no turn and is never stored.
+
+The buffer is kept in a canonical form: turns of opposite faces commute, so `R L'` and
+`L' R` are the same buffer. A run of turns on one axis is at most one turn per face,
+U before D, R before L, F before B. Turns of the same face are merged through COMBINE,
+also across a turn of the opposite face (`R L R` is `R2 L`). Bind formulas are reduced
+to the same form by canonical(), so a bind covers every order of commuting turns.
+When the last move lands before the turn of the opposite face (`L R` is kept as `R L`),
+`behind` is set: the matcher takes only formulas that reach the code before the last one,
+and tries the buffer without its last code, so a bind ending with that move (`R`,
+`F L R` for a bind `F R`) fires, and a bind ending with the untouched `L` doesn't fire
+again. When the last move cancels out (`R L R'`), `cancelled` is set and nothing is matched.
+The oldest move is overwritten once the ring is full, so adding a move allocates nothing
+and shifts nothing.
+"""
+FACES = 'URFDLB'
+OPPOSITE = [3, 4, 5, 0, 1, 2]  # By face
+MOVE_NAMES = tuple(face + suffix for face in FACES for suffix in ('', '', '2', '\''))  # By code, no-turn codes included
+MOVE_CODES = {face + suffix: face_index * 4 + quarters
+              for face_index, face in enumerate(FACES)
+              for suffix, quarters in (('', 1), ('2', 2), ('2\'', 2), ('\'', 3))}
+TURN_NAMES = tuple(name for code, name in enumerate(MOVE_NAMES) if code & 3)  # The 18 face turns
+# COMBINE[a][b]: the move equal to `a` then `b` on the same face (a no-turn code if they cancel), -1 for different faces
+COMBINE = [[a & ~3 | (a + b) & 3 if a >> 2 == b >> 2 else -1 for b in range(24)] for a in range(24)]
+
+
+
+def canonical(codes) -> tuple[int]:
+  """
+  ret: canonical form of a sequence of move codes (see the module docstring)
+  """
+  codes = list(codes)
+  buffer = MoveBuffer(max(1, len(codes)))
+  for code in codes:
+    buffer.push(code)
+  return tuple(buffer.codes[:buffer.length])  # The ring hasn't wrapped: it holds every move
+
+
+
+class MoveBuffer:
+  def __init__(self, capacity: int = 100):
+    self.capacity = capacity
+    self.codes = [0] * capacity
+    self.end = 0  # Index after the last move
+    self.length = 0
+    self.behind = False  # The last move went before the last code (see the module docstring)
+    self.cancelled = False  # The last move cancelled out with an earlier one
+
+
+  def push(self, code: int) -> None:
+    """
+    Adds a move, keeping the buffer canonical
+    """
+    codes, capacity = self.codes, self.capacity
+    self.behind = self.cancelled = False
+    if self.length:
+      last = self.end - 1  # -1 is the end of the list, as the ring wraps
+      face, last_face = code >> 2, codes[last] >> 2
+      if face == last_face:
+        target = last
+      elif face == OPPOSITE[last_face]:
+        if self.length > 1 and codes[last - 1] >> 2 == face:  # The run is `face`, opposite face
+          target = last - 1
+        else:
+          target = None
+          if face < last_face:  # Goes before the last move
+            code, codes[last] = codes[last], code
+            self.behind = True
+      else:
+        target = None
+
+      if target is not None:
+        merged = COMBINE[codes[target]][code]
+        if merged & 3:
+          codes[target] = merged
+          self.behind = target != last
+        else:  # Cancelled out
+          if target != last:
+            codes[target] = codes[last]
+          self.end = last % capacity
+          self.length -= 1
+          self.cancelled = True
+        return
+
+    codes[self.end] = code
+    self.end = self.end + 1 if self.end + 1 < capacity else 0
+    if self.length < capacity:
+      self.length += 1
+
+
+  def pop(self, count: int, keep_last: bool = False) -> None:
+    """
+    Removes the last `count` moves
+    keep_last: remove the `count` moves before the last one instead
+    """
+    last = self.codes[self.end - 1]
+    if keep_last:
+      count = min(count + 1, self.length)
+    count = min(count, self.length)
+    self.end = (self.end - count) % self.capacity
+    self.length -= count
+    self.behind = self.cancelled = False
+    if keep_last:
+      self.push(last)
+
+
+  def clear(self) -> None:
+    self.end = 0
+    self.length = 0
+    self.behind = self.cancelled = False
+
+
+  def names(self, last: int | None = None) -> list[str]:
+    """
+    ret: names of the moves, oldest first. Only the last `last` moves if given
+    """
+    count = self.length if last is None else min(last, self.length)
+    return [MOVE_NAMES[self.codes[(self.end - i) % self.capacity]] for i in range(count, 0, -1)]
+
+
+  def __len__(self) -> int:
+    return self.length
+
+
+  def __reversed__(self):
+    codes, end = self.codes, self.end
+    for i in range(end - 1, end - 1 - self.length, -1):
+      yield codes[i]  # Negative indices wrap around to the end of the list
@@ -1,11 +1,16 @@
 import win32pipe, win32file
 import logging
+import queue
+import threading
 from time import sleep
 
+from transport import Frame, FrameDecoder, FrameEncoder
+
 class PipeSender:
   def __init__(self, pipe_name='\\\\.\\pipe\\Turns'):
     self.pipe_name = pipe_name
     self.pipe = None
+    self.encoder = FrameEncoder()
 
     self.logger = logging.getLogger('PipeSender')
 
@@ -26,66 +31,102 @@ class PipeSender:
     self.logger.debug("Pipe client connected.")
 
 
-  def send(self, moves: list[str]) -> None:
-    self.logger.debug(f'Sending moves: {moves}')
+  def send(self, moves: list[str], cube_id: str = '', timestamp: float | None = None) -> None:
+    self.logger.debug(f'Sending moves of cube {cube_id}: {moves}')
     if not self.pipe:
       self.logger.critical("Cannot send moves, pipe is not connected.")
       return
     
-    data = ( ';'.join(moves) + ';' ).encode('utf-8')
     try:
-      win32file.WriteFile(self.pipe, data)
+      win32file.WriteFile(self.pipe, self.encoder.encode(moves, cube_id, timestamp))
     except Exception as e:
       self.logger.critical(f"Failed to write to pipe: {e}")
       self.pipe = None
   
 
+  def close(self):
+    if self.pipe:
+      win32file.CloseHandle(self.pipe)
+      self.pipe = None
+
+
   def __del__(self):
-    win32file.CloseHandle(self.pipe)
+    self.close()
 
 
 
 class PipeReader:
+  """
+  A thread blocks in ReadFile and queues whole messages, so read() can wait with a timeout
+  (a pipe handle can't be waited on directly)
+  """
   def __init__(self, pipe_name='\\\\.\\pipe\\Turns'):
     self.pipe_name = pipe_name
     self.pipe = None
+    self.decoder = FrameDecoder()
+    self.queue: queue.Queue = queue.Queue()
+    self.thread: threading.Thread | None = None
 
     self.logger = logging.getLogger('PipeReader')
 
 
   def connect(self):
     self.logger.debug(f"Waiting for a client to connect to pipe {self.pipe_name}...")
-    sleep(2)  # Wait for the pipe to be created
     
-    # Create the named pipe
-    pipe_handle = win32file.CreateFile(
-                    self.pipe_name,
-                    win32file.GENERIC_READ,
-                    0,
-                    None,
-                    win32file.OPEN_EXISTING,  # Crucial: open existing pipe
-                    0,  # Default attributes
-                    None
-                  )
+    # Open the named pipe as soon as the sender creates it
+    while True:
+      try:
+        pipe_handle = win32file.CreateFile(
+                        self.pipe_name,
+                        win32file.GENERIC_READ,
+                        0,
+                        None,
+                        win32file.OPEN_EXISTING,  # Crucial: open existing pipe
+                        0,  # Default attributes
+                        None
+                      )
+        break
+      except win32file.error as e:
+        if e.winerror not in (2, 231):  # Not created yet, busy
+          raise
+        sleep(0.05)
     
     self.pipe = pipe_handle
+    self.thread = threading.Thread(target=self._receive, name='PipeReader', daemon=True)
+    self.thread.start()
     self.logger.debug("Pipe client connected.")
 
 
-  def read(self) -> list[str] | None:
+  def read(self, timeout: float | None = 0.0) -> list[Frame] | None:
     """
     read new data from pipe and append it to buffer
-    ret: list of readed moves or None
+    timeout: seconds to wait for data, None waits until it comes
+    ret: list of readed frames, None if nothing came, False on EOF
     """
     try:
-      if win32pipe.PeekNamedPipe(self.pipe, 0)[1] == 0:
-        return None
-      data = win32file.ReadFile(self.pipe, 65536)
-      data = data[1].decode('utf-8').strip(';').split(';')
-
-      self.logger.debug(f'Read: "{data}"')
-      return data
-    except win32file.error as e:
-      if e.winerror == 232:  # EOF
-        self.logger.debug(f'Recieved EOF')
-        return False
\ No newline at end of file
+      data = self.queue.get(timeout=timeout)
+    except queue.Empty:
+      return None
+    if data is False:
+      self.queue.put(False)  # Every later read gets EOF too
+      return False
+    return self.decoder.feed(data) or None
+
+
+  def _receive(self):
+    while True:
+      try:
+        self.queue.put(win32file.ReadFile(self.pipe, 65536)[1])
+      except win32file.error as e:
+        if e.winerror in (109, 232):  # Broken pipe, EOF
+          self.logger.debug(f'Recieved EOF')
+        else:
+          self.logger.critical(f'Failed to read from pipe: {e}')
+        self.queue.put(False)
+        return
+
+
+  def close(self):
+    if self.pipe:
+      win32file.CloseHandle(self.pipe)
+      self.pipe = None
\ No newline at end of file
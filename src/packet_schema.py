@@ -0,0 +1,166 @@
+# Bit layouts of decrypted notifications. Taken from https://github.com/afedotov/gan-web-bluetooth
+
+from typing import Callable, NamedTuple
+
+
+
+class Field(NamedTuple):
+  offset: int  # in bits from the start of the packet, most significant bit first
+  width: int  # in bits
+  table: tuple | None = None  # maps the raw value to the result (None marks corrupted values)
+
+
+
+def compile_field(field: Field) -> Callable[[bytes], int | str | None]:
+  """
+  Turns a field into an extractor working on whole bytes with a single shift and mask
+  ret: extractor(data) -> value of the field in `data`
+  """
+  first = field.offset // 8
+  last = (field.offset + field.width - 1) // 8 + 1
+  shift = last * 8 - field.offset - field.width
+  mask = (1 << field.width) - 1
+  table = field.table
+
+  if last - first == 1:
+    if table is None:
+      return lambda data: (data[first] >> shift) & mask
+    return lambda data: table[(data[first] >> shift) & mask]
+
+  if table is None:
+    return lambda data: (int.from_bytes(data[first:last], 'big') >> shift) & mask
+  return lambda data: table[(int.from_bytes(data[first:last], 'big') >> shift) & mask]
+
+
+def pack(schema: dict[str, Field | list[Field]], values: dict, size: int = 20) -> bytes:
+  """
+  Inverse of the extractors: builds a packet from field values (e.g. for a simulated cube)
+  values: field name -> value, or list of values for a list of fields. Missing fields are zero
+  """
+  packet = 0
+  for name, value in values.items():
+    fields = schema[name]
+    pairs = zip(fields, value) if isinstance(fields, list) else [(fields, value)]
+    for field, item in pairs:
+      raw = field.table.index(item) if field.table else item
+      packet |= (raw & ((1 << field.width) - 1)) << (size * 8 - field.offset - field.width)
+  return packet.to_bytes(size, 'big')
+
+
+class CompiledSchema:
+  """
+  Every field of the schema becomes an attribute holding its extractor
+  (or a list of extractors for a list of fields)
+  """
+  def __init__(self, schema: dict[str, Field | list[Field]]):
+    for name, field in schema.items():
+      if isinstance(field, list):
+        setattr(self, name, [compile_field(f) for f in field])
+      else:
+        setattr(self, name, compile_field(field))
+
+
+
+###########################      Lookup tables      ###########################
+def _one_hot_move(value: int) -> str | None:
+  # 2 bits of direction + 6 bits of one-hot face (U=000010, R=100000, F=001000, D=000001, L=010000, B=000100)
+  direction, face = (value >> 6) & 1, value & 0x3F
+  if face == 0:
+    return None
+  return 'BRDFUL'[[1, 5, 3, 0, 4, 2][6 - face.bit_length()]] + ('\'' if direction else '')
+
+
+def _gen2_move(value: int) -> str | None:
+  # 4 bits of face + 1 bit of direction
+  face, direction = value >> 1, value & 1
+  if face > 5:
+    return None
+  return 'URFDLB'[face] + ('\'' if direction else '')
+
+
+def _history_move(value: int) -> str | None:
+  # 3 bits of face (U=1, R=5, F=3, D=0, L=4, B=2) + 1 bit of direction
+  code, direction = value >> 1, value & 1
+  if code not in (1, 5, 3, 0, 4, 2):
+    return None
+  return 'URFDLB'[[1, 5, 3, 0, 4, 2].index(code)] + ('\'' if direction else '')
+
+
+ONE_HOT_MOVES = tuple(_one_hot_move(value) for value in range(256))
+GEN2_MOVES = tuple(_gen2_move(value) for value in range(32))
+HISTORY_MOVES = tuple(_history_move(value) for value in range(16))
+
+
+
+###########################         Schemas         ###########################
+SCHEMAS = {
+  'Gen2': {
+    'event': Field(0, 4),  # 0x2 - moves, 0x4 - facelets
+    'move_count': Field(4, 8),
+    'moves': [Field(12 + 5 * i, 5, GEN2_MOVES) for i in range(7)],  # moves[0] is the latest
+    # Facelets event: first 7 corners and 11 edges, the last ones are implied
+    'cp': [Field(12 + 3 * i, 3) for i in range(7)],
+    'co': [Field(33 + 2 * i, 2) for i in range(7)],
+    'ep': [Field(47 + 4 * i, 4) for i in range(11)],
+    'eo': [Field(91 + i, 1) for i in range(11)],
+  },
+  'Gen3': {
+    'magic': Field(0, 8),  # always 0x55
+    'event': Field(8, 8),  # 0x01 - move, 0x02 - facelets, 0x06 - move history
+    'length': Field(16, 8),
+    # Serials are 16-bit little-endian, only the low byte is read: history works with 8 bits
+    'serial': Field(56, 8),
+    'move': Field(72, 8, ONE_HOT_MOVES),
+    'state_serial': Field(24, 8),
+    'history_serial': Field(24, 8),  # serial of history[0], then decreasing
+    'history': [Field(32 + 4 * i, 4, HISTORY_MOVES) for i in range(32)],
+    'cp': [Field(40 + 3 * i, 3) for i in range(7)],
+    'co': [Field(61 + 2 * i, 2) for i in range(7)],
+    'ep': [Field(77 + 4 * i, 4) for i in range(11)],
+    'eo': [Field(121 + i, 1) for i in range(11)],
+  },
+  'Gen4': {
+    'event': Field(0, 8),  # 0x01 - move, 0xED - facelets, 0xD1 - move history
+    'length': Field(8, 8),
+    'serial': Field(48, 8),
+    'move': Field(64, 8, ONE_HOT_MOVES),
+    'state_serial': Field(16, 8),
+    'history_serial': Field(16, 8),
+    'history': [Field(24 + 4 * i, 4, HISTORY_MOVES) for i in range(34)],
+    'cp': [Field(32 + 3 * i, 3) for i in range(7)],
+    'co': [Field(53 + 2 * i, 2) for i in range(7)],
+    'ep': [Field(69 + 4 * i, 4) for i in range(11)],
+    'eo': [Field(113 + i, 1) for i in range(11)],
+  },
+}
+
+GEN2 = CompiledSchema(SCHEMAS['Gen2'])
+GEN3 = CompiledSchema(SCHEMAS['Gen3'])
+GEN4 = CompiledSchema(SCHEMAS['Gen4'])
+
+
+def read_history(schema: CompiledSchema, data) -> tuple[int, list[str | None]]:
+  """
+  Reads a move history event (Gen3/Gen4)
+  ret: serial of the first move, moves with decreasing serials (None for unreadable ones)
+  """
+  count = min((schema.length(data) - 1) * 2, len(schema.history))
+  return schema.history_serial(data), [field(data) for field in schema.history[:count]]
+
+
+def read_cubies(schema: CompiledSchema, data) -> tuple[list[int], list[int], list[int], list[int]]:
+  """
+  Reads a facelets event of any generation
+  ret: corner permutation/orientation, edge permutation/orientation (Kociemba order)
+  """
+  cp = [field(data) for field in schema.cp]
+  co = [field(data) for field in schema.co]
+  ep = [field(data) for field in schema.ep]
+  eo = [field(data) for field in schema.eo]
+
+  # The last cubie is implied by the others
+  cp.append(28 - sum(cp))
+  co.append((3 - sum(co) % 3) % 3)
+  ep.append(66 - sum(ep))
+  eo.append((2 - sum(eo) % 2) % 2)
+  return cp, co, ep, eo
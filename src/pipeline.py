@@ -0,0 +1,112 @@
+import logging
+import queue
+import threading
+import time
+
+
+
+class DecodePipeline:
+  """
+  Keeps bleak's event loop free: the notification callback only enqueues the raw
+  packet with a monotonic timestamp, and a worker thread runs the real handler
+  (decrypt, parse, send) for every packet in order.
+  """
+  def __init__(self, maxsize: int = 1024, deadline=None, on_deadline=None):
+    """
+    deadline() -> time.monotonic() to call on_deadline() at if no packet comes before, or None.
+    Both run on the worker thread, between packets
+    """
+    self.logger = logging.getLogger('Pipeline')
+    self.deadline = deadline
+    self.on_deadline = on_deadline
+
+    self.queue: queue.Queue = queue.Queue(maxsize)
+    self.thread: threading.Thread | None = None
+    self.stopping = threading.Event()
+
+    self.received = 0
+    self.dropped = 0  # Packets lost because the queue was full
+    self.processed = 0
+    self.max_depth = 0
+    self.max_latency = 0.0  # Longest time a packet waited in the queue, seconds
+    self.timestamp: float | None = None  # Receipt time of the packet being handled
+    self.last_received = 0.0  # Receipt time of the latest packet
+
+
+  def wrap(self, handler, tap=None):
+    """
+    handler(sender, data) -> None. Runs on the worker thread
+    tap(timestamp, data) -> None. Optional, sees every raw packet before the handler (e.g. capture)
+    ret: notification callback for BleakClient.start_notify
+    """
+    def callback(sender, data: bytearray):
+      self.received += 1
+      self.last_received = time.monotonic()
+      try:
+        self.queue.put_nowait((self.last_received, handler, tap, sender, bytes(data)))
+      except queue.Full:
+        self.dropped += 1
+        return
+      self.max_depth = max(self.max_depth, self.queue.qsize())
+    return callback
+
+
+  def start(self) -> None:
+    if self.thread and self.thread.is_alive():
+      return
+    self.stopping.clear()
+    self.thread = threading.Thread(target=self._run, name='DecodePipeline', daemon=True)
+    self.thread.start()
+
+
+  def stop(self) -> None:
+    """
+    Stops the worker after the packet it handles. Packets still in the queue are thrown away
+    """
+    if not self.thread:
+      return
+    self.stopping.set()
+    try:
+      self.queue.put_nowait(None)  # Wakes the worker up if it waits for a packet
+    except queue.Full:  # Then it doesn't wait, and sees `stopping` after the current packet
+      pass
+    self.thread.join()
+    self.thread = None
+    while not self.queue.empty():  # Neither the rest nor the wake-up may reach the next worker
+      self.queue.get_nowait()
+
+
+  def stats(self) -> dict[str, int | float]:
+    return {
+      'depth': self.queue.qsize(),
+      'max_depth': self.max_depth,
+      'received': self.received,
+      'dropped': self.dropped,
+      'processed': self.processed,
+      'max_latency': self.max_latency,
+    }
+
+
+  def _run(self) -> None:
+    while True:
+      deadline = self.deadline() if self.deadline else None
+      try:
+        item = self.queue.get(timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+      except queue.Empty:
+        try:
+          self.on_deadline()
+        except Exception as e:
+          self.logger.critical(f'Error in deadline handler: {e}')
+        continue
+      if item is None or self.stopping.is_set():
+        break
+
+      self.timestamp, handler, tap, sender, data = item
+      self.max_latency = max(self.max_latency, time.monotonic() - self.timestamp)
+      try:
+        if tap:
+          tap(self.timestamp, data)
+        handler(sender, data)
+      except Exception as e:
+        self.logger.critical(f'Error in notification handler: {e}')
+      self.processed += 1
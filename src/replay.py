@@ -0,0 +1,89 @@
+"""
+Feeds a capture (see capture.py) through the real notification handlers,
+without a cube or bluetooth. Record with: python src/controller.py --capture cube.cap
+Usage: python src/replay.py cube.cap [--speed 2 | --fast]
+"""
+import argparse
+import time
+
+from capture import CaptureReader
+from controller import GANCubeController, cube_id
+from cryptor import Cryptor
+from cube_state import STATE_PREFIX
+
+
+
+class ReplayController(GANCubeController):
+  """
+  Controller without a client: requests to the cube (state, history) are dropped
+  """
+  def __init__(self, send, address: str, protocol: str):
+    super().__init__(send, cube_id(address))
+    self.address = address
+    self.protocol = protocol
+    self.cryptor = Cryptor(address)
+    self.handler = {
+      'Gen2': self._notification_handler_gen2,
+      'Gen3': self._notification_handler_gen3,
+      'Gen4': self._notification_handler_gen4,
+    }[protocol]
+
+
+  def _write_threadsafe(self, request: bytes) -> None:
+    pass
+
+
+
+def replay(path: str, speed: float | None = 1.0) -> dict[str, int | float]:
+  """
+  speed: 1.0 keeps the recorded timing, None replays as fast as possible
+  ret: replay stats
+  """
+  stats = {'packets': 0, 'moves': 0, 'states': 0, 'handler_time': 0.0}
+
+  def send(moves: list[str]) -> None:
+    if moves[0].startswith(STATE_PREFIX):
+      stats['states'] += 1
+    else:
+      stats['moves'] += len(moves)
+
+  controllers: dict[str, ReplayController] = {}
+  reader = CaptureReader(path)
+  start = time.perf_counter()
+  first = None
+  try:
+    for record in reader:
+      if record.address not in controllers:
+        controllers[record.address] = ReplayController(send, record.address, record.protocol)
+      controller = controllers[record.address]
+
+      if speed is not None:
+        first = record.timestamp if first is None else first
+        delay = (record.timestamp - first) / speed - (time.perf_counter() - start)
+        if delay > 0:
+          time.sleep(delay)
+
+      tick = time.perf_counter()
+      controller.handler(None, record.data)
+      stats['handler_time'] += time.perf_counter() - tick
+      stats['packets'] += 1
+  finally:
+    reader.close()
+
+  stats['elapsed'] = time.perf_counter() - start
+  stats['cubes'] = len(controllers)
+  return stats
+
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Replay a capture through the notification handlers.')
+  parser.add_argument('path', help='capture file written by controller.py --capture')
+  parser.add_argument('--speed', type=float, default=1.0, help='replay speed relative to the recording (default: 1)')
+  parser.add_argument('--fast', action='store_true', help='ignore the recorded timing')
+  args = parser.parse_args()
+
+  stats = replay(args.path, None if args.fast else args.speed)
+  per_packet = stats['handler_time'] / stats['packets'] * 1e6 if stats['packets'] else 0.0
+  print(f'{stats["packets"]} packets from {stats["cubes"]} cubes: {stats["moves"]} moves, {stats["states"]} states')
+  print(f'elapsed {stats["elapsed"]:.3f} s, handlers {per_packet:.1f} us/packet')
@@ -0,0 +1,187 @@
+import logging
+import time
+
+
+
+class MoveSequencer:
+  """
+  Orders moves by their 8-bit serial number. Moves after a gap are held back until
+  the missing ones are recovered from the move history of the cube, so they are sent
+  in order. If the history doesn't come within `timeout`, the missing moves are given up
+  and the cube is asked for its state.
+  """
+  MAX_REQUESTS = 3  # Times a missing serial is asked for while the history replies skip it
+
+  def __init__(self, request_history, request_state, timeout: float = 1.0):
+    """
+    request_history(serial: int, count: int) -> None. Asks the cube for `count` moves ending with `serial`
+    request_state() -> None. Asks the cube for its state after the missing moves are given up
+    """
+    self.logger = logging.getLogger('Sequencer')
+    self.request_history = request_history
+    self.request_state = request_state
+    self.timeout = timeout
+
+    self.last_serial: int | None = None  # Serial of the latest sent move
+    self.pending: dict[int, str] = {}  # serial -> move, held back after a gap
+    self.requested: dict[int, int] = {}  # missing serial -> times asked for
+    self.waiting_since: float | None = None
+
+    self.gaps = 0
+    self.lost = 0  # Moves that couldn't be recovered
+    self.recovered = 0
+
+
+  def stats(self) -> dict[str, int]:
+    return {'gaps': self.gaps, 'lost': self.lost, 'recovered': self.recovered, 'pending': len(self.pending)}
+
+
+  def deadline(self) -> float | None:
+    """
+    ret: time.monotonic() when the missing moves are given up, None if nothing is missing
+    """
+    return None if self.waiting_since is None else self.waiting_since + self.timeout
+
+
+  def expire(self) -> None:
+    """
+    Gives up the missing moves if the history hasn't come in time. Called at deadline(),
+    as no move may come to push() for a while
+    """
+    if self.waiting_since is not None and time.monotonic() - self.waiting_since >= self.timeout:
+      self._give_up()
+
+
+  def note_gap(self, missing: int) -> None:
+    """
+    Counts moves lost where there is no history to recover them from (Gen2)
+    """
+    self.gaps += 1
+    self.lost += missing
+
+
+  def reset(self, serial: int) -> list[str]:
+    """
+    The cube reported its state after the move `serial`
+    ret: held back moves that come after the state, in order
+    """
+    self.pending = {s: move for s, move in self.pending.items() if 0 < (s - serial) & 0xFF < 0x80}
+    self.last_serial = serial
+    self.requested.clear()
+    self.waiting_since = None
+    ready = self._drain()
+    if self.pending:
+      self._request_missing()
+    return ready
+
+
+  def push(self, serial: int, move: str) -> list[str]:
+    """
+    ret: moves ready to be sent, in order
+    """
+    if self.last_serial is None:
+      self.last_serial = serial
+      return [move]
+
+    ahead = (serial - self.last_serial) & 0xFF
+    if ahead == 0 or ahead >= 0x80:  # Duplicate or already given up
+      return []
+
+    self.pending[serial] = move
+    ready = self._drain()
+
+    if not self.pending:
+      self._end_wait()
+    elif self.waiting_since is not None and time.monotonic() - self.waiting_since > self.timeout:
+      self._give_up()
+    else:
+      self._request_missing()
+
+    return ready
+
+
+  def push_history(self, start_serial: int, moves: list[str | None]) -> list[str]:
+    """
+    moves[i] has serial `start_serial - i`. None marks unreadable moves
+    ret: moves ready to be sent, in order
+    """
+    if self.last_serial is None or not self.pending:
+      return []
+
+    for i, move in enumerate(moves):
+      serial = (start_serial - i) & 0xFF
+      if 0 < (serial - self.last_serial) & 0xFF < 0x80 and serial not in self.pending:
+        self.requested[serial] = self.MAX_REQUESTS  # Answered: asking again won't help if it's unreadable
+        if move is not None:
+          self.pending[serial] = move
+          self.recovered += 1
+
+    ready = self._drain()
+    if not self.pending:
+      self._end_wait()
+    else:  # The reply didn't cover the whole gap, or a newer gap opened meanwhile
+      self._request_missing(replied=start_serial)
+    return ready
+
+
+  def _drain(self) -> list[str]:
+    ready = []
+    while (serial := (self.last_serial + 1) & 0xFF) in self.pending:
+      ready.append(self.pending.pop(serial))
+      self.last_serial = serial
+    return ready
+
+
+  def _missing(self) -> list[int]:
+    """
+    ret: serials between the latest sent move and the newest held back one that haven't come, oldest first
+    """
+    newest = max((s - self.last_serial) & 0xFF for s in self.pending)
+    serials = ((self.last_serial + i) & 0xFF for i in range(1, newest))
+    return [serial for serial in serials if serial not in self.pending]
+
+
+  def _request_missing(self, replied: int | None = None) -> None:
+    """
+    Asks for the history up to the newest held back move if a missing move wasn't asked for yet.
+    replied: serial a history reply started with. The older moves it skipped are asked for again,
+             the newer ones may be in flight
+    """
+    missing = self._missing()
+    new = [serial for serial in missing if serial not in self.requested]
+    skipped = [] if replied is None else [
+      serial for serial in missing
+      if self.requested.get(serial, 0) < self.MAX_REQUESTS and (replied - serial) & 0xFF < 0x80
+    ]
+    asked = sorted(set(new + skipped), key=lambda s: (s - self.last_serial) & 0xFF)
+    if not asked:
+      return
+
+    if new:  # Every new gap gets the whole timeout
+      self.gaps += 1
+      self.waiting_since = time.monotonic()
+      self.logger.warning(f'Missed {len(new)} moves before serial {(new[-1] + 1) & 0xFF}. Requesting history...')
+
+    oldest, newest = asked[0], asked[-1]
+    self.request_history(newest, ((newest - oldest) & 0xFF) + 1)
+    for serial in missing[missing.index(oldest):missing.index(newest) + 1]:
+      self.requested[serial] = self.requested.get(serial, 0) + 1
+
+
+  def _end_wait(self) -> None:
+    self.requested.clear()
+    self.waiting_since = None
+
+
+  def _give_up(self) -> None:
+    """
+    Skips the missing moves and the held back ones: the moves after the gap can't be placed
+    on a known cube state, so request_state() resyncs the receiver instead
+    """
+    missing = len(self._missing())
+    self.lost += missing
+    self.logger.warning(f'History didn\'t come. {missing} moves are lost, {len(self.pending)} held back moves are dropped')
+    self.last_serial = max(self.pending, key=lambda s: (s - self.last_serial) & 0xFF)
+    self.pending.clear()
+    self._end_wait()
+    self.request_state()
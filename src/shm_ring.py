@@ -0,0 +1,253 @@
+"""
+Shared-memory transport: a single-producer/single-consumer ring of fixed-size slots,
+each holding one frame of transport.py. Moving a frame costs no syscall: the sender
+copies it into a slot and advances `head`, the reader copies it out and advances `tail`.
+The reader spins for a moment when the ring is empty, then sleeps on a doorbell that
+the sender rings only if the reader has said it's asleep.
+
+Layout (little-endian):
+  0     head      uint64  slots written, only the sender writes it
+  64    tail      uint64  slots read, only the reader writes it (own cache line)
+  128   magic     uint32
+  132   slots     uint32  number of slots, power of two
+  136   attached  uint8   set by the reader
+  137   closed    uint8   set by the sender (EOF)
+  138   waiting   uint8   the reader sleeps on the doorbell
+  192   slots     slot = length uint8 + frame
+"""
+import logging
+import os
+import select
+import socket
+import struct
+import sys
+import tempfile
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+from transport import HEADER, Frame, FrameDecoder, FrameEncoder
+
+
+MAGIC = 0x43554245
+SLOT_SIZE = 64
+MAX_MOVES = SLOT_SIZE - 1 - HEADER.size  # Moves in one frame, longer lists are split
+HEAD, TAIL, CONTROL, DATA = 0, 64, 128, 192
+CONTROL_FORMAT = struct.Struct('<II')
+ATTACHED, CLOSED, WAITING = CONTROL + 8, CONTROL + 9, CONTROL + 10
+INDEX = struct.Struct('<Q')
+WAIT_SLICE = 0.05  # Longest sleep before looking at the ring again, covers a missed doorbell
+
+
+
+class Doorbell:
+  """
+  Wakes the reader up. A datagram Unix socket, or a named event on Windows
+  """
+  def __init__(self, name: str, owner: bool):
+    self.name = name
+    self.owner = owner  # The reader owns it and waits on it
+    if sys.platform == 'win32':
+      import win32event
+      self._win32event = win32event
+      self.event = win32event.CreateEvent(None, False, False, f'Local\\{name}')
+    else:
+      self.path = os.path.join(tempfile.gettempdir(), f'{name}.bell')
+      self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+      self.sock.setblocking(False)
+      if owner:
+        if os.path.exists(self.path):
+          os.unlink(self.path)
+        self.sock.bind(self.path)
+
+
+  def ring(self) -> None:
+    if sys.platform == 'win32':
+      self._win32event.SetEvent(self.event)
+      return
+    try:
+      self.sock.sendto(b'\0', self.path)
+    except (BlockingIOError, FileNotFoundError, ConnectionRefusedError):  # Already ringing, or no reader
+      pass
+
+
+  def wait(self, timeout: float) -> None:
+    if sys.platform == 'win32':
+      self._win32event.WaitForSingleObject(self.event, int(timeout * 1000))
+      return
+    if select.select([self.sock], [], [], timeout)[0]:
+      try:
+        while self.sock.recv(64):
+          pass
+      except BlockingIOError:
+        pass
+
+
+  def close(self) -> None:
+    if sys.platform == 'win32':
+      self.event.Close()
+      return
+    self.sock.close()
+    if self.owner and os.path.exists(self.path):
+      os.unlink(self.path)
+
+
+
+class ShmSender:
+  def __init__(self, name: str = 'cube_turns', slots: int = 1024):
+    """
+    slots: capacity of the ring, rounded up to a power of two
+    """
+    self.name = name
+    self.slots = 1 << max(0, slots - 1).bit_length()
+    self.shm: shared_memory.SharedMemory | None = None
+    self.doorbell: Doorbell | None = None
+    self.encoder = FrameEncoder()
+    self.head = 0
+    self.dropped = 0  # Frames lost because the ring was full
+
+    self.logger = logging.getLogger('ShmSender')
+
+
+  def connect(self) -> None:
+    self.logger.debug(f'Waiting for a reader on shared memory {self.name}...')
+    try:  # Left by a previous run
+      old = shared_memory.SharedMemory(self.name)
+      old.close()
+      old.unlink()
+    except FileNotFoundError:
+      pass
+    self.shm = shared_memory.SharedMemory(self.name, create=True, size=DATA + self.slots * SLOT_SIZE)
+    self.buf = self.shm.buf
+    self.buf[:DATA] = bytes(DATA)
+    CONTROL_FORMAT.pack_into(self.buf, CONTROL, MAGIC, self.slots)
+    while not self.buf[ATTACHED]:
+      time.sleep(0.01)
+    self.doorbell = Doorbell(self.name, owner=False)
+    self.logger.debug('Reader connected.')
+
+
+  def send(self, moves: list[str], cube_id: str = '', timestamp: float | None = None) -> None:
+    if not self.shm:
+      self.logger.critical('Cannot send moves, shared memory is not connected.')
+      return
+    buf, mask = self.buf, self.slots - 1
+    for start in range(0, max(len(moves), 1), MAX_MOVES):
+      frame = self.encoder.encode(moves[start:start + MAX_MOVES], cube_id, timestamp)
+      if self.head - INDEX.unpack_from(buf, TAIL)[0] >= self.slots:
+        self.dropped += 1
+        self.logger.warning(f'Ring is full, {self.dropped} frames dropped so far')
+        continue
+      offset = DATA + (self.head & mask) * SLOT_SIZE
+      buf[offset] = len(frame)
+      buf[offset + 1:offset + 1 + len(frame)] = frame
+      self.head += 1
+      INDEX.pack_into(buf, HEAD, self.head)  # Published after the slot is written
+    if buf[WAITING]:
+      self.doorbell.ring()
+
+
+  def close(self) -> None:
+    if not self.shm:
+      return
+    self.buf[CLOSED] = 1
+    self.doorbell.ring()
+    self.doorbell.close()
+    del self.buf
+    self.shm.close()
+    self.shm.unlink()  # The reader keeps its mapping
+    self.shm = None
+
+
+
+class ShmReader:
+  def __init__(self, name: str = 'cube_turns', spin: float = 0.0002):
+    """
+    spin: seconds to poll an empty ring before sleeping on the doorbell
+    """
+    self.name = name
+    self.spin = spin
+    self.shm: shared_memory.SharedMemory | None = None
+    self.doorbell: Doorbell | None = None
+    self.decoder = FrameDecoder()
+    self.tail = 0
+
+    self.logger = logging.getLogger('ShmReader')
+
+
+  def connect(self) -> None:
+    self.logger.debug(f'Connecting to shared memory {self.name}...')
+    self.doorbell = Doorbell(self.name, owner=True)
+    while True:
+      try:
+        self.shm = shared_memory.SharedMemory(self.name)
+      except FileNotFoundError:  # The sender hasn't created it yet
+        time.sleep(0.05)
+        continue
+      if CONTROL_FORMAT.unpack_from(self.shm.buf, CONTROL)[0] == MAGIC:
+        break
+      self.shm.close()
+      time.sleep(0.05)
+    if sys.platform != 'win32':  # Only the sender may unlink it (Python < 3.13 tracks every attach)
+      resource_tracker.unregister(self.shm._name, 'shared_memory')
+    self.buf = self.shm.buf
+    self.slots = CONTROL_FORMAT.unpack_from(self.buf, CONTROL)[1]
+    self.buf[ATTACHED] = 1
+    self.logger.debug('Connected to sender.')
+
+
+  def read(self, timeout: float | None = 0.0) -> list[Frame] | None:
+    """
+    ret: list of read frames, None if there is nothing to read, False on EOF
+    """
+    buf = self.buf
+    head = INDEX.unpack_from(buf, HEAD)[0]
+    if head == self.tail:
+      if buf[CLOSED]:
+        self.logger.debug('Recieved EOF')
+        return False
+      if timeout == 0:
+        return None
+      head = self._wait(timeout)
+      if head == self.tail:
+        return False if buf[CLOSED] else None
+
+    frames = []
+    mask = self.slots - 1
+    for index in range(self.tail, head):
+      offset = DATA + (index & mask) * SLOT_SIZE
+      frames += self.decoder.feed(buf[offset + 1:offset + 1 + buf[offset]])
+    self.tail = head
+    INDEX.pack_into(buf, TAIL, head)  # Frees the slots only after they were copied out
+    return frames or None
+
+
+  def _wait(self, timeout: float | None) -> int:
+    """
+    ret: head once it moves, the deadline passes or the sender closes
+    """
+    buf = self.buf
+    now = time.perf_counter()
+    deadline = None if timeout is None else now + timeout
+    spin_until = now + self.spin if deadline is None else min(now + self.spin, deadline)
+
+    while (head := INDEX.unpack_from(buf, HEAD)[0]) == self.tail and time.perf_counter() < spin_until:
+      pass
+    while head == self.tail and not buf[CLOSED]:
+      left = WAIT_SLICE if deadline is None else min(WAIT_SLICE, deadline - time.perf_counter())
+      if left <= 0:
+        break
+      buf[WAITING] = 1
+      if (head := INDEX.unpack_from(buf, HEAD)[0]) == self.tail:  # Nothing came while going to sleep
+        self.doorbell.wait(left)
+      buf[WAITING] = 0
+      head = INDEX.unpack_from(buf, HEAD)[0]
+    return head
+
+
+  def close(self) -> None:
+    if not self.shm:
+      return
+    del self.buf
+    self.shm.close()
+    self.doorbell.close()
+    self.shm = None
@@ -0,0 +1,304 @@
+"""
+Simulated GAN cubes standing in for bleak, so the whole controller runs without a radio.
+A SimulatedCube advertises, exposes the characteristics of its protocol, answers state
+and history requests and turns on its own, sending encrypted move packets.
+Load test: python src/simulator.py --protocol Gen3 --tps 30 --burst 3 --loss 0.02 --duration 10
+"""
+import argparse
+import asyncio
+import collections
+import logging
+import random
+import time
+from types import SimpleNamespace
+
+from cryptor import Cryptor
+from cube_state import CubeState, STATE_PREFIX
+from packet_schema import SCHEMAS, pack
+from uuids_list import UUIDS_LIST
+
+
+QUARTER_TURNS = [face + suffix for face in 'URFDLB' for suffix in ('', '\'')]
+
+
+
+class SimulatedCube:
+  """
+  One cube. Turns `tps` times per second on average, in bursts of `burst` back-to-back
+  moves, and drops every move notification with probability `loss`
+  """
+  def __init__(self, address: str, protocol: str = 'Gen3', tps: float = 10.0, burst: int = 1,
+               loss: float = 0.0, seed: int | None = None, name: str | None = None):
+    self.logger = logging.getLogger(f'Simulator.{address[-5:].replace(":", "")}')
+    self.address = address
+    self.name = name or f'GAN-sim-{address[-5:].replace(":", "")}'
+    self.protocol = protocol
+    self.tps = tps
+    self.burst = burst
+    self.loss = loss
+    self.random = random.Random(seed)
+
+    self.cryptor = Cryptor(address)
+    self.schema = SCHEMAS[protocol]
+    self.cube = CubeState()
+    self.serial = 0  # Serial of the latest move (move counter for Gen2)
+    self.history: dict[int, str] = {}  # serial -> move
+    self.recent: collections.deque[str] = collections.deque(maxlen=7)  # Gen2 packets carry the last 7 moves
+
+    self.client: 'SimulatedClient | None' = None
+    self._notify = None  # (characteristic, callback) of the subscription
+    self._task: asyncio.Task | None = None
+
+    self.turns = 0
+    self.dropped = 0
+
+
+  def turn(self, move: str | None = None) -> None:
+    move = move or self.random.choice(QUARTER_TURNS)
+    self.cube.apply(move)
+    self.serial = (self.serial + 1) & 0xFF
+    self.history[self.serial] = move
+    self.recent.appendleft(move)
+    self.turns += 1
+
+    if self.random.random() < self.loss:
+      self.dropped += 1
+      return
+    self._send(self._move_packet(move))
+
+
+  def pause(self) -> None:
+    if self._task:
+      self._task.cancel()
+      self._task = None
+
+
+  def drop(self) -> None:
+    """
+    Simulates a link loss: the client is disconnected without asking
+    """
+    if self.client:
+      self.client._disconnected()
+
+
+  ###########################    Client side    ###########################
+  def attach(self, client: 'SimulatedClient') -> None:
+    self.client = client
+
+
+  def detach(self) -> None:
+    self.pause()
+    self.client = None
+    self._notify = None
+
+
+  def subscribe(self, characteristic, callback) -> None:
+    self._notify = (characteristic, callback)
+    if self._task is None and self.tps > 0:
+      self._task = asyncio.get_running_loop().create_task(self._turn_loop())
+
+
+  def handle_write(self, data: bytes) -> None:
+    # Replies are built when they are sent: they go after the moves already on the way
+    request = bytes(self.cryptor.decrypt(data))
+    if (self.protocol, request[0]) in (('Gen2', 0x04), ('Gen4', 0x05)) or request[:2] == b'\x68\x01':
+      reply = self._state_packet
+    elif request[:2] in (b'\x68\x03', b'\xD1\x04'):
+      reply = lambda: self._history_packet(request[2], request[4])
+    else:
+      self.logger.debug(f'Unknown request: {request.hex()}')
+      return
+    asyncio.get_running_loop().call_soon(lambda: self._send(reply()))
+
+
+  async def _turn_loop(self) -> None:
+    period = self.burst / self.tps
+    deadline = time.monotonic()
+    while True:
+      for _ in range(self.burst):
+        self.turn()
+      deadline += period
+      await asyncio.sleep(max(0.0, deadline - time.monotonic()))
+
+
+  def _send(self, packet: bytes) -> None:
+    if self._notify:
+      characteristic, callback = self._notify
+      callback(characteristic, bytearray(self.cryptor.encrypt(packet)))
+
+
+  ###########################      Packets      ###########################
+  def _move_packet(self, move: str) -> bytes:
+    if self.protocol == 'Gen2':
+      return pack(self.schema, {'event': 0x2, 'move_count': self.serial, 'moves': list(self.recent)})
+    values = {'event': 0x01, 'length': 7, 'serial': self.serial, 'move': move}
+    if self.protocol == 'Gen3':
+      values['magic'] = 0x55
+    return pack(self.schema, values)
+
+
+  def _state_packet(self) -> bytes:
+    cp, co, ep, eo = self.cube.to_cubies()
+    values = {'cp': cp[:7], 'co': co[:7], 'ep': ep[:11], 'eo': eo[:11]}  # The last cubies are implied
+    if self.protocol == 'Gen2':
+      values.update(event=0x4, move_count=self.serial)
+    elif self.protocol == 'Gen3':
+      values.update(magic=0x55, event=0x02, length=16, state_serial=self.serial)
+    else:  # self.protocol == 'Gen4'
+      values.update(event=0xED, length=16, state_serial=self.serial)
+    return pack(self.schema, values)
+
+
+  def _history_packet(self, serial: int, count: int) -> bytes:
+    count = min(count, len(self.schema['history']))
+    moves = [self.history.get((serial - i) & 0xFF) for i in range(count)]
+    values = {'length': count // 2 + 1, 'history_serial': serial, 'history': moves}
+    if self.protocol == 'Gen3':
+      values.update(magic=0x55, event=0x06)
+    else:  # self.protocol == 'Gen4'
+      values.update(event=0xD1)
+    return pack(self.schema, values)
+
+
+
+class SimulatedClient:
+  """
+  The part of BleakClient used by GANCubeController
+  """
+  def __init__(self, radio: 'SimulatedRadio', device, disconnected_callback=None, timeout: float = 10.0, **kwargs):
+    self.address = device if isinstance(device, str) else device.address
+    self.cube = radio.cubes.get(self.address)
+    self.disconnected_callback = disconnected_callback
+    self.is_connected = False
+    self.services = []
+
+
+  async def connect(self) -> None:
+    if self.cube is None or self.cube.client is not None:
+      raise ConnectionError(f'Device with address {self.address} was not found')
+    self.cube.attach(self)
+    self.is_connected = True
+    uuids = UUIDS_LIST[self.cube.protocol]
+    self.services = [SimpleNamespace(characteristics=[SimpleNamespace(uuid=uuids['notify']), SimpleNamespace(uuid=uuids['write'])])]
+
+
+  async def disconnect(self) -> None:
+    self._disconnected()
+
+
+  async def start_notify(self, uuid: str, callback) -> None:
+    self._check(uuid, 'notify')
+    self.cube.subscribe(SimpleNamespace(uuid=uuid), callback)
+
+
+  async def write_gatt_char(self, uuid: str, data: bytes, response: bool = False) -> None:
+    self._check(uuid, 'write')
+    self.cube.handle_write(bytes(data))
+
+
+  def _check(self, uuid: str, kind: str) -> None:
+    if not self.is_connected:
+      raise ConnectionError('Not connected')
+    if uuid != UUIDS_LIST[self.cube.protocol][kind]:
+      raise ValueError(f'Characteristic {uuid} was not found')
+
+
+  def _disconnected(self) -> None:
+    if not self.is_connected:
+      return
+    self.is_connected = False
+    self.cube.detach()
+    if self.disconnected_callback:
+      self.disconnected_callback(self)
+
+
+
+class SimulatedRadio:
+  """
+  Replaces BleakScanner and BleakClient of a module, e.g. SimulatedRadio(cubes).patch(controller)
+  """
+  def __init__(self, cubes: list[SimulatedCube]):
+    self.cubes = {cube.address: cube for cube in cubes}
+    self.scanner = SimpleNamespace(find_device_by_filter=self.find_device_by_filter)
+
+
+  def client(self, device, **kwargs) -> SimulatedClient:
+    return SimulatedClient(self, device, **kwargs)
+
+
+  def patch(self, module) -> None:
+    module.BleakScanner = self.scanner
+    module.BleakClient = self.client
+
+
+  async def find_device_by_filter(self, filterfunc, timeout: float = 10.0):
+    for cube in self.cubes.values():
+      if cube.client is not None:  # Connected cubes don't advertise
+        continue
+      device = SimpleNamespace(address=cube.address, name=cube.name)
+      if filterfunc(device, SimpleNamespace(local_name=cube.name, rssi=-50)):
+        return device
+    await asyncio.sleep(timeout)
+    return None
+
+
+
+###########################      Load test      ###########################
+def _percentile(values: list[float], fraction: float) -> float:
+  return sorted(values)[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+async def load_test(protocol: str = 'Gen3', cubes: int = 1, tps: float = 10.0, burst: int = 1,
+                    loss: float = 0.0, duration: float = 10.0, seed: int | None = None) -> None:
+  import controller
+  from device_registry import DeviceRegistry
+
+  simulated = [SimulatedCube(f'AB:12:CD:34:{i >> 8:02X}:{i & 0xFF:02X}', protocol, tps, burst, loss,
+                             None if seed is None else seed + i) for i in range(cubes)]
+  SimulatedRadio(simulated).patch(controller)
+
+  latencies: list[float] = []
+  states = 0
+  def send(moves: list[str], cube_id: str, timestamp: float) -> None:
+    nonlocal states
+    if moves[0].startswith(STATE_PREFIX):
+      states += 1
+      return
+    latencies.extend([time.monotonic() - timestamp] * len(moves))
+
+  manager = controller.CubeSessionManager(send, DeviceRegistry(path=None))
+  try:
+    while len(manager.sessions) < cubes:
+      await manager.connect_new_cubes(timeout=0.1)
+    await asyncio.sleep(duration)
+    for cube in simulated:
+      cube.pause()
+    await asyncio.sleep(0.5)  # Let the pipelines drain
+
+    turns = sum(cube.turns for cube in simulated)
+    print(f'{protocol}, {cubes} cubes at {tps} TPS (bursts of {burst}), loss {loss:.1%}, {duration} s')
+    print(f'turned {turns}, dropped {sum(cube.dropped for cube in simulated)}, sent {len(latencies)} moves, {states} states')
+    print(f'latency p50 {_percentile(latencies, 0.5) * 1e3:.2f} ms, p99 {_percentile(latencies, 0.99) * 1e3:.2f} ms, '
+          f'max {max(latencies, default=0.0) * 1e3:.2f} ms')
+    for cube in simulated:
+      session = manager.sessions[controller.cube_id(cube.address)]
+      in_sync = session.cube.hex() == cube.cube.hex()
+      print(f'{session.cube_id}: pipeline {session.pipeline.stats()}, gaps {session.gap_stats()}, state in sync: {in_sync}')
+  finally:
+    await manager.disconnect_all()
+
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Run the controller against simulated cubes.')
+  parser.add_argument('--protocol', choices=('Gen2', 'Gen3', 'Gen4'), default='Gen3')
+  parser.add_argument('--cubes', type=int, default=1, help='number of simulated cubes (default: 1)')
+  parser.add_argument('--tps', type=float, default=10.0, help='turns per second of every cube (default: 10)')
+  parser.add_argument('--burst', type=int, default=1, help='moves sent back-to-back at once (default: 1)')
+  parser.add_argument('--loss', type=float, default=0.0, help='probability to drop a move notification (default: 0)')
+  parser.add_argument('--duration', type=float, default=10.0, help='seconds of turning (default: 10)')
+  parser.add_argument('--seed', type=int, help='seed of the random moves')
+  args = parser.parse_args()
+
+  logging.basicConfig(level=logging.WARNING, format='%(asctime)s - [%(name)s] - %(levelname)s - %(message)s', datefmt='%H:%M:%S')
+  asyncio.run(load_test(args.protocol, args.cubes, args.tps, args.burst, args.loss, args.duration, args.seed))
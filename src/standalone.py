@@ -0,0 +1,98 @@
+"""
+Controller and key emulator in one process: moves go from the decode pipeline straight
+to the binds, and keys are pressed by timers of the same asyncio loop. No pipe, no second
+process. Run controller.py and key_emulator.py separately to keep them isolated.
+Usage: python src/standalone.py [--cubes 2] [--capture cube.cap] [--output record]
+"""
+import sys
+sys.coinit_flags = 0  # MTA thread mode, before bleak is imported
+
+import argparse
+import asyncio
+import logging
+import time
+
+from bind_compiler import BindWatcher, CompiledBinds, load_binds
+from controller import run_sessions
+from cube_state import RESYNC, STATE_PREFIX
+from key_emulator import BindDispatcher
+from key_output import DEFAULT_OUTPUT, OUTPUTS, make_output
+
+
+
+class InlineKeys:
+  """
+  Runs a BindDispatcher on the event loop. Moves come from the pipeline threads;
+  one timer is re-armed for the next key or idle buffer
+  """
+  def __init__(self, dispatcher: BindDispatcher, loop: asyncio.AbstractEventLoop):
+    self.dispatcher = dispatcher
+    self.loop = loop
+    self.timer: asyncio.TimerHandle | None = None
+
+
+  def send(self, moves: list[str], cube_id: str, timestamp: float) -> None:
+    """
+    The send callback of CubeSessionManager. Called from a pipeline thread
+    """
+    self.loop.call_soon_threadsafe(self._handle, moves, cube_id, timestamp)
+
+
+  def _handle(self, moves: list[str], cube_id: str, timestamp: float) -> None:
+    if moves[0].startswith(STATE_PREFIX):
+      self.dispatcher.handle_state(cube_id, bytes.fromhex(moves[0][len(STATE_PREFIX):]), moves[1:] == [RESYNC])
+    else:
+      self.dispatcher.handle_moves(cube_id, moves, timestamp)
+    self._tick()
+
+
+  def reload(self, binds: CompiledBinds, constants: dict[str, any]) -> None:
+    """
+    The on_reload callback of BindWatcher. Called from its thread
+    """
+    self.loop.call_soon_threadsafe(self._reload, binds, constants)
+
+
+  def _reload(self, binds: CompiledBinds, constants: dict[str, any]) -> None:
+    self.dispatcher.reload(binds, constants)
+    self._tick()  # The idle time may have changed
+
+
+  def _tick(self) -> None:
+    self.dispatcher.press_keys()
+    self.dispatcher.clear_idle()
+
+    if self.timer:
+      self.timer.cancel()
+    deadline = self.dispatcher.next_deadline()
+    self.timer = self.loop.call_later(max(0.0, deadline - time.time()), self._tick) if deadline is not None else None
+
+
+
+async def main(cubes: int = 1, capture_path: str | None = None, output: str = DEFAULT_OUTPUT):
+  # Configuring logging
+  logging.basicConfig(
+      level=logging.INFO,
+      format='%(asctime)s - [%(name)s] - %(levelname)s - %(message)s',
+      datefmt='%H:%M:%S'
+  )
+
+  binds, constants = load_binds()
+  keys = InlineKeys(BindDispatcher(binds, constants, make_output(output)), asyncio.get_running_loop())
+  watcher = BindWatcher('binds.txt', keys.reload)
+  watcher.start()
+  try:
+    await run_sessions(keys.send, cubes, capture_path)
+  finally:
+    watcher.stop()
+    logging.getLogger('KeyScript').info(f'Key timing: {keys.dispatcher.jitter.report()}')
+    keys.dispatcher.output.close()
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description='Presses keys bound to formulas of GAN smart cubes, in one process.')
+  parser.add_argument('--cubes', type=int, default=1, help='number of cubes to connect to (default: 1)')
+  parser.add_argument('--capture', metavar='PATH', help='record raw notifications to a capture file for replay.py')
+  parser.add_argument('--output', choices=OUTPUTS, default=DEFAULT_OUTPUT, help=f'how keys are pressed (default: {DEFAULT_OUTPUT})')
+  args = parser.parse_args()
+  asyncio.run(main(args.cubes, args.capture, args.output))
@@ -0,0 +1,49 @@
+"""
+Move logger: attaches to the broker of controller.py and prints every frame.
+Usage: python src/controller.py --transport broker
+       python src/subscribe.py [--address PATH|host:port] [--delay 0.1]
+"""
+import argparse
+import logging
+import time
+
+from cube_state import CubeState
+from move_buffer import MOVE_NAMES
+from transport import DEFAULT_ADDRESSES, make_reader, parse_address
+
+
+def main(address=None, delay: float = 0.0):
+  """
+  delay: seconds to sleep after every read, to try the slow subscriber policy of the broker
+  """
+  logging.basicConfig(
+      level=logging.INFO,
+      format='%(asctime)s - [%(name)s] - %(levelname)s - %(message)s',
+      datefmt='%H:%M:%S'
+  )
+  logger = logging.getLogger('Subscriber')
+
+  reader = make_reader('broker', address)
+  reader.connect()
+  logger.info(f'Attached to {address or DEFAULT_ADDRESSES["broker"]}.')
+  try:
+    while (frames := reader.read(None)) is not False:
+      for frame in frames or ():
+        if frame.state is not None:
+          solved = CubeState(frame.state).is_solved()
+          logger.info(f'{frame.cube_id or "-"} #{frame.seq}: state {frame.state.hex()}{" (solved)" if solved else ""}')
+        else:
+          logger.info(f'{frame.cube_id or "-"} #{frame.seq}: {" ".join(MOVE_NAMES[code] for code in frame.codes)}')
+      if delay:
+        time.sleep(delay)
+  finally:
+    reader.close()
+  logger.info(f'Broker closed. {reader.decoder.frames} frames, {reader.decoder.dropped} dropped.')
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description='Prints the moves published by controller.py --transport broker.')
+  parser.add_argument('--address', help='socket path or host:port of the broker')
+  parser.add_argument('--delay', type=float, default=0.0, help='seconds to sleep after every read (default: 0)')
+  args = parser.parse_args()
+  main(parse_address('broker', args.address), args.delay)
@@ -0,0 +1,371 @@
+"""
+Move stream between controller.py (sender) and key_emulator.py (reader).
+Every backend has the same contract:
+  sender.connect()  blocks until the reader connects
+  sender.send(moves, cube_id, timestamp)
+  reader.connect()  blocks until the sender is there
+  reader.read(timeout=0.0) -> list of Frame, None if nothing came within `timeout`
+                              (None blocks), False on EOF (the sender is gone)
+Backends: 'pipe' - Windows named pipe (named_pipes.py), 'unix' - Unix domain socket,
+'mp' - multiprocessing connection, 'shm' - shared-memory ring (shm_ring.py),
+'broker' - any number of readers attached at runtime (broker.py), read with SocketReader.
+
+Wire format: frames of a 17-byte little-endian header and a payload
+  magic      uint8    0xC6
+  kind       uint8    0 - moves, 1 - cube state, 2 - cube state after lost moves or a reconnect
+  seq        uint16   frame counter of the sender, reveals dropped frames
+  timestamp  float64  time.monotonic() when the controller received the notification
+  cube_id    4 bytes  ASCII, zero-padded ('' for untagged moves)
+  length     uint8    payload size
+  payload    moves: one byte per move, its code of move_buffer.py (face * 4 + quarter turns),
+             state: 20 bytes of CubeState
+"""
+import logging
+import os
+import select
+import socket
+import struct
+import sys
+import tempfile
+import time
+from multiprocessing.connection import Client, Listener
+from typing import NamedTuple
+
+from cube_state import RESYNC, STATE_PREFIX
+from move_buffer import MOVE_CODES
+
+
+TRANSPORTS = ('pipe', 'unix', 'mp', 'shm', 'broker')
+DEFAULT_TRANSPORT = 'pipe' if sys.platform == 'win32' else 'unix'
+DEFAULT_ADDRESSES = {
+  'pipe': '\\\\.\\pipe\\Turns',
+  'unix': os.path.join(tempfile.gettempdir(), 'cube_turns.sock'),
+  'mp': ('localhost', 6543),
+  'shm': 'cube_turns',
+  'broker': ('localhost', 6544) if sys.platform == 'win32' else os.path.join(tempfile.gettempdir(), 'cube_broker.sock'),
+}
+AUTHKEY = b'cube-turns'
+
+MAGIC = 0xC6
+MOVES_FRAME, STATE_FRAME, RESYNC_FRAME = 0, 1, 2
+HEADER = struct.Struct('<BBHd4sB')
+TURN_CODES = bytes(sorted(set(MOVE_CODES.values())))  # Valid bytes of a moves payload
+
+
+
+class Frame(NamedTuple):
+  cube_id: str
+  seq: int
+  timestamp: float  # time.monotonic() of the notification in the controller
+  codes: bytes  # Move codes of move_buffer.py, empty for a state frame
+  state: bytes | None = None  # CubeState bytes of a state frame
+  resync: bool = False  # The state comes after lost moves or a reconnect
+
+
+
+class FrameEncoder:
+  def __init__(self):
+    self.seq = 0
+
+
+  def encode(self, moves: list[str], cube_id: str = '', timestamp: float | None = None) -> bytes:
+    """
+    moves: face turns, or [STATE_PREFIX + CubeState.hex()] (+ [RESYNC])
+    timestamp: time.monotonic() of the notification with the moves. Defaults to now
+    """
+    if moves and moves[0].startswith(STATE_PREFIX):
+      kind, payload = RESYNC_FRAME if moves[1:] == [RESYNC] else STATE_FRAME, bytes.fromhex(moves[0][len(STATE_PREFIX):])
+    else:
+      kind, payload = MOVES_FRAME, bytes([MOVE_CODES[move] for move in moves])
+    timestamp = time.monotonic() if timestamp is None else timestamp
+    frame = HEADER.pack(MAGIC, kind, self.seq, timestamp, cube_id.encode('ascii'), len(payload)) + payload
+    self.seq = (self.seq + 1) & 0xFFFF
+    return frame
+
+
+
+class FrameDecoder:
+  """
+  Splits incoming bytes into frames. A frame cut at the end of the data waits for the next
+  chunk; data that isn't a frame is thrown away up to the end of the chunk
+  """
+  def __init__(self):
+    self.logger = logging.getLogger('FrameDecoder')
+    self.rest = b''
+    self.next_seq: int | None = None
+    self._ids: dict[bytes, str] = {}
+
+    self.frames = 0
+    self.dropped = 0  # Frames missing from the sequence
+    self.corrupted = 0  # Chunks thrown away
+
+
+  def feed(self, data: bytes) -> list[Frame]:
+    if self.rest:
+      data = self.rest + data
+    view = memoryview(data)
+    size, unpack = HEADER.size, HEADER.unpack_from
+    frames = []
+    offset = 0
+    while len(view) - offset >= size:
+      magic, kind, seq, timestamp, raw_id, length = unpack(view, offset)
+      if magic != MAGIC or kind > RESYNC_FRAME or (kind != MOVES_FRAME and length != 20):
+        self.corrupted += 1
+        self.logger.warning(f'Got {len(view) - offset} bytes that are not a frame. Skipping them')
+        offset = len(view)
+        break
+      end = offset + size + length
+      if end > len(view):  # Partial frame
+        break
+      payload = view[offset + size:end]
+
+      if seq != self.next_seq and self.next_seq is not None:
+        missing = (seq - self.next_seq) & 0xFFFF
+        if missing < 0x8000:
+          self.dropped += missing
+          self.logger.warning(f'{missing} frames were dropped before frame {seq}')
+        else:  # Older than expected: the sender restarted
+          self.logger.warning(f'Frame {seq} is out of sequence (expected {self.next_seq})')
+      self.next_seq = (seq + 1) & 0xFFFF
+
+      if (cube_id := self._ids.get(raw_id)) is None:
+        cube_id = self._ids[raw_id] = raw_id.rstrip(b'\0').decode('ascii', 'replace')
+      if kind == MOVES_FRAME:
+        codes = payload.tobytes()
+        if codes.translate(None, TURN_CODES):  # Some byte is not a turn
+          self.corrupted += 1
+          self.logger.warning(f'Frame {seq} of cube {cube_id or "-"} has invalid moves ({codes.hex()}). Skipping it')
+          offset = end
+          continue
+        frame = (cube_id, seq, timestamp, codes, None, False)
+      else:
+        frame = (cube_id, seq, timestamp, b'', payload.tobytes(), kind == RESYNC_FRAME)
+      frames.append(tuple.__new__(Frame, frame))  # Skips the argument parsing of Frame()
+      offset = end
+
+    self.frames += len(frames)
+    self.rest = view[offset:].tobytes() if offset < len(view) else b''
+    return frames
+
+
+
+class SocketSender:
+  """
+  Listens on a Unix domain socket and streams moves to the first reader that connects
+  """
+  def __init__(self, address: str = DEFAULT_ADDRESSES['unix']):
+    self.address = address
+    self.sock: socket.socket | None = None
+    self.encoder = FrameEncoder()
+    self.logger = logging.getLogger('SocketSender')
+
+
+  def connect(self) -> None:
+    self.logger.debug(f'Waiting for a reader on {self.address}...')
+    if os.path.exists(self.address):  # Left by a previous run
+      os.unlink(self.address)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+      server.bind(self.address)
+      server.listen(1)
+      self.sock, _ = server.accept()
+    os.unlink(self.address)
+    self.logger.debug('Reader connected.')
+
+
+  def send(self, moves: list[str], cube_id: str = '', timestamp: float | None = None) -> None:
+    self.logger.debug(f'Sending moves of cube {cube_id}: {moves}')
+    if not self.sock:
+      self.logger.critical('Cannot send moves, socket is not connected.')
+      return
+    try:
+      self.sock.sendall(self.encoder.encode(moves, cube_id, timestamp))
+    except OSError as e:
+      self.logger.critical(f'Failed to write to socket: {e}')
+      self.sock.close()
+      self.sock = None
+
+
+  def close(self) -> None:
+    if self.sock:
+      self.sock.close()
+      self.sock = None
+
+
+
+class SocketReader:
+  def __init__(self, address=DEFAULT_ADDRESSES['unix']):
+    """
+    address: socket path, or (host, port) for TCP
+    """
+    self.address = address
+    self.sock: socket.socket | None = None
+    self.decoder = FrameDecoder()
+    self.logger = logging.getLogger('SocketReader')
+
+
+  def connect(self) -> None:
+    self.logger.debug(f'Connecting to {self.address}...')
+    while True:
+      sock = socket.socket(socket.AF_INET if isinstance(self.address, tuple) else socket.AF_UNIX, socket.SOCK_STREAM)
+      try:
+        sock.connect(self.address)
+        break
+      except (FileNotFoundError, ConnectionRefusedError):  # The sender isn't listening yet
+        sock.close()
+        time.sleep(0.1)
+    sock.setblocking(False)
+    self.sock = sock
+    self.logger.debug('Connected to sender.')
+
+
+  def read(self, timeout: float | None = 0.0) -> list[Frame] | None:
+    """
+    ret: list of read frames, None if there is nothing to read, False on EOF
+    """
+    try:  # During a solve the next frame is often in already: no select for it
+      data = self.sock.recv(65536)
+    except BlockingIOError:
+      if timeout == 0 or not select.select([self.sock], [], [], timeout)[0]:
+        return None
+      data = self.sock.recv(65536)
+    if not data:
+      self.logger.debug('Recieved EOF')
+      return False
+
+    return self.decoder.feed(data) or None  # The stream has no message boundaries: a cut frame waits for the next read
+
+
+  def close(self) -> None:
+    if self.sock:
+      self.sock.close()
+      self.sock = None
+
+
+
+class ConnectionSender:
+  """
+  multiprocessing.connection listener. Messages keep their boundaries
+  """
+  def __init__(self, address=DEFAULT_ADDRESSES['mp']):
+    self.address = address
+    self.conn = None
+    self.encoder = FrameEncoder()
+    self.logger = logging.getLogger('ConnectionSender')
+
+
+  def connect(self) -> None:
+    self.logger.debug(f'Waiting for a reader on {self.address}...')
+    with Listener(self.address, authkey=AUTHKEY) as listener:
+      self.conn = listener.accept()
+    self.logger.debug('Reader connected.')
+
+
+  def send(self, moves: list[str], cube_id: str = '', timestamp: float | None = None) -> None:
+    self.logger.debug(f'Sending moves of cube {cube_id}: {moves}')
+    if not self.conn:
+      self.logger.critical('Cannot send moves, connection is not established.')
+      return
+    try:
+      self.conn.send_bytes(self.encoder.encode(moves, cube_id, timestamp))
+    except OSError as e:
+      self.logger.critical(f'Failed to write to connection: {e}')
+      self.conn.close()
+      self.conn = None
+
+
+  def close(self) -> None:
+    if self.conn:
+      self.conn.close()
+      self.conn = None
+
+
+
+class ConnectionReader:
+  def __init__(self, address=DEFAULT_ADDRESSES['mp']):
+    self.address = address
+    self.conn = None
+    self.decoder = FrameDecoder()
+    self.logger = logging.getLogger('ConnectionReader')
+
+
+  def connect(self) -> None:
+    self.logger.debug(f'Connecting to {self.address}...')
+    while True:
+      try:
+        self.conn = Client(self.address, authkey=AUTHKEY)
+        break
+      except (FileNotFoundError, ConnectionRefusedError):
+        time.sleep(0.1)
+    self.logger.debug('Connected to sender.')
+
+
+  def read(self, timeout: float | None = 0.0) -> list[Frame] | None:
+    """
+    ret: list of read frames, None if there is nothing to read, False on EOF
+    """
+    try:
+      if not self.conn.poll(timeout):
+        return None
+      return self.decoder.feed(self.conn.recv_bytes()) or None
+    except EOFError:
+      self.logger.debug('Recieved EOF')
+      return False
+
+
+  def close(self) -> None:
+    if self.conn:
+      self.conn.close()
+      self.conn = None
+
+
+
+def make_sender(transport: str = DEFAULT_TRANSPORT, address=None, **options):
+  """
+  address: backend specific, see DEFAULT_ADDRESSES
+  options: extra arguments of the backend (e.g. policy of 'broker')
+  """
+  address = address or DEFAULT_ADDRESSES[transport]
+  if transport == 'pipe':
+    from named_pipes import PipeSender  # Needs pywin32
+    return PipeSender(address, **options)
+  if transport == 'unix':
+    return SocketSender(address, **options)
+  if transport == 'mp':
+    return ConnectionSender(address, **options)
+  if transport == 'shm':
+    from shm_ring import ShmSender
+    return ShmSender(address, **options)
+  if transport == 'broker':
+    from broker import BrokerSender
+    return BrokerSender(address, **options)
+  raise ValueError(f'Unknown transport: {transport}')
+
+
+def make_reader(transport: str = DEFAULT_TRANSPORT, address=None, **options):
+  """
+  options: extra arguments of the backend (e.g. spin of 'shm')
+  """
+  address = address or DEFAULT_ADDRESSES[transport]
+  if transport == 'pipe':
+    from named_pipes import PipeReader
+    return PipeReader(address, **options)
+  if transport == 'unix':
+    return SocketReader(address, **options)
+  if transport == 'mp':
+    return ConnectionReader(address, **options)
+  if transport == 'shm':
+    from shm_ring import ShmReader
+    return ShmReader(address, **options)
+  if transport == 'broker':
+    return SocketReader(address, **options)
+  raise ValueError(f'Unknown transport: {transport}')
+
+
+def parse_address(transport: str, text: str | None):
+  """
+  Address from the command line. For 'mp' and 'broker' it's 'host:port' or a socket path
+  """
+  if text is None or transport not in ('mp', 'broker') or ':' not in text:
+    return text
+  host, _, port = text.rpartition(':')
+  return (host, int(port))
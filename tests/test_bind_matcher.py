@@ -0,0 +1,24 @@
+import random
+
+from benchmark import _linear_match
+from bind_matcher import CompiledTrie, FormulaTrie
+from move_buffer import MOVE_CODES, MOVE_NAMES, TURN_NAMES, MoveBuffer
+
+
+
+def _buffer(moves: list[str]) -> MoveBuffer:
+  ret = MoveBuffer(100)
+  for move in moves:
+    ret.push(MOVE_CODES[move])
+  return ret
+
+
+def test_trie_agrees_with_linear_scan():
+  rnd = random.Random(0)
+  trie = FormulaTrie(tuple(rnd.choices(TURN_NAMES, k=rnd.randint(2, 8))) for _ in range(500))
+  formulas = [tuple(MOVE_NAMES[code] for code in codes) for codes in trie.codes.values()]  # Canonical, without the ones that can't be recognized
+  buffers = [_buffer(rnd.choices(TURN_NAMES, k=20)) for _ in range(500)] + [_buffer(rnd.choices(TURN_NAMES, k=10) + list(formula)) for formula in trie.formulas]
+  compiled = CompiledTrie.from_trie(trie)
+  for turns in buffers:
+    found = _linear_match(formulas, turns.names())
+    assert compiled.match(turns) == (formulas.index(found) if found else -1), turns.names()
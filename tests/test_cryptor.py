@@ -0,0 +1,46 @@
+import os
+
+import pytest
+
+from benchmark import MAC, _installed_backends, _reference_decrypt
+from cryptor import AES, Cryptor, FastAES
+
+
+ROUNDS = 200
+
+
+
+def test_fast_aes_matches_aes():
+  for _ in range(ROUNDS):
+    key, block = os.urandom(16), os.urandom(16)
+    ref, fast = AES(list(key)), FastAES(key)
+    assert fast.encrypt_block(block) == bytes(ref.encrypt(list(block)))
+    assert fast.decrypt_block(block) == bytes(ref.decrypt(list(block)))
+    assert fast.decrypt_block(fast.encrypt_block(block)) == block
+
+
+def test_cryptor_matches_reference():
+  cryptor = Cryptor(MAC)
+  for _ in range(ROUNDS):
+    packet = os.urandom(20)
+    assert cryptor.decrypt(packet) == _reference_decrypt(cryptor._cube, list(packet))
+    assert bytes(cryptor.decrypt(cryptor.encrypt(packet))) == packet
+
+
+@pytest.mark.parametrize('name', _installed_backends())
+def test_backends_agree(name):
+  cryptor, other = Cryptor(MAC), Cryptor(MAC, name)
+  for _ in range(ROUNDS):
+    packet = os.urandom(20)
+    assert other.encrypt(packet) == cryptor.encrypt(packet)
+    assert other.decrypt(packet) == cryptor.decrypt(packet)
+
+
+def test_decrypt_batch_matches_decrypt():
+  cryptor = Cryptor(MAC)
+  stream = os.urandom(20 * 100)
+  try:
+    batch = cryptor.decrypt_batch(stream)
+  except ImportError:
+    pytest.skip('numpy is not installed')
+  assert batch.tolist() == [cryptor.decrypt(stream[i:i + 20]) for i in range(0, len(stream), 20)]
@@ -0,0 +1,57 @@
+from cube_state import SOLVED_FACELETS, CubeState
+
+
+# Facelets after one turn from solved, from a sticker-level model independent of CubeState
+TURN_FACELETS = {
+  'U': 'UUUUUUUUUBBBRRRRRRRRRFFFFFFDDDDDDDDDFFFLLLLLLLLLBBBBBB',
+  'U2': 'UUUUUUUUULLLRRRRRRBBBFFFFFFDDDDDDDDDRRRLLLLLLFFFBBBBBB',
+  'U\'': 'UUUUUUUUUFFFRRRRRRLLLFFFFFFDDDDDDDDDBBBLLLLLLRRRBBBBBB',
+  'R': 'UUFUUFUUFRRRRRRRRRFFDFFDFFDDDBDDBDDBLLLLLLLLLUBBUBBUBB',
+  'R2': 'UUDUUDUUDRRRRRRRRRFFBFFBFFBDDUDDUDDULLLLLLLLLFBBFBBFBB',
+  'R\'': 'UUBUUBUUBRRRRRRRRRFFUFFUFFUDDFDDFDDFLLLLLLLLLDBBDBBDBB',
+  'F': 'UUUUUULLLURRURRURRFFFFFFFFFRRRDDDDDDLLDLLDLLDBBBBBBBBB',
+  'F2': 'UUUUUUDDDLRRLRRLRRFFFFFFFFFUUUDDDDDDLLRLLRLLRBBBBBBBBB',
+  'F\'': 'UUUUUURRRDRRDRRDRRFFFFFFFFFLLLDDDDDDLLULLULLUBBBBBBBBB',
+  'D': 'UUUUUUUUURRRRRRFFFFFFFFFLLLDDDDDDDDDLLLLLLBBBBBBBBBRRR',
+  'D2': 'UUUUUUUUURRRRRRLLLFFFFFFBBBDDDDDDDDDLLLLLLRRRBBBBBBFFF',
+  'D\'': 'UUUUUUUUURRRRRRBBBFFFFFFRRRDDDDDDDDDLLLLLLFFFBBBBBBLLL',
+  'L': 'BUUBUUBUURRRRRRRRRUFFUFFUFFFDDFDDFDDLLLLLLLLLBBDBBDBBD',
+  'L2': 'DUUDUUDUURRRRRRRRRBFFBFFBFFUDDUDDUDDLLLLLLLLLBBFBBFBBF',
+  'L\'': 'FUUFUUFUURRRRRRRRRDFFDFFDFFBDDBDDBDDLLLLLLLLLBBUBBUBBU',
+  'B': 'RRRUUUUUURRDRRDRRDFFFFFFFFFDDDDDDLLLULLULLULLBBBBBBBBB',
+  'B2': 'DDDUUUUUURRLRRLRRLFFFFFFFFFDDDDDDUUURLLRLLRLLBBBBBBBBB',
+  'B\'': 'LLLUUUUUURRURRURRUFFFFFFFFFDDDDDDRRRDLLDLLDLLBBBBBBBBB',
+}
+
+
+
+def test_turns_match_sticker_model():
+  for move, facelets in TURN_FACELETS.items():
+    cube = CubeState()
+    cube.apply(move)
+    assert cube.to_facelets() == facelets, move
+
+
+def test_commutator_returns_to_solved():
+  # Commutes the R L' slice with U and D: a real cube comes back solved
+  cube = CubeState()
+  for move in "R L' F2 B2 R L' U R L' F2 B2 R L' D'".split():
+    cube.apply(move)
+  assert cube.is_solved(), cube.to_facelets()
+
+
+def test_hex_round_trip():
+  cube = CubeState()
+  for move in "R U R' U' F2 D L' B".split():
+    cube.apply(move)
+  assert CubeState.from_hex(cube.hex()).to_facelets() == cube.to_facelets()
+
+
+def test_matches_with_precomputed_facelets():
+  cube = CubeState()
+  cube.apply('R')
+  top = TURN_FACELETS['R'][:9] + '?' * 45
+  assert cube.matches(top)
+  assert cube.matches(top, cube.to_facelets())
+  assert not cube.matches(SOLVED_FACELETS, cube.to_facelets())
+  assert not cube.matches('SOLVED')
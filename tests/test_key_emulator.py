@@ -0,0 +1,78 @@
+import pytest
+
+from bind_compiler import compile_binds
+from key_emulator import BindDispatcher
+from key_output import RecordingOutput
+
+
+# (bind, moves): the last move completes the bind, whichever order of opposite faces was used
+LAST_MOVE_BINDS = [
+  ('U', 'D U'),
+  ('R', 'L R'),
+  ('F2', 'B F2'),
+  ('F R', 'F L R'),
+  ('R L', 'L R'),
+  ('R2', 'R L R'),
+]
+# (bind, moves): the bind fires on its move only, not again on a later move that leaves it at the end
+STALE_BINDS = [
+  ('L', 'L R'),
+  ('L', 'R L R\''),
+  ('U', 'U R R\''),
+  ('F R', 'F R L'),
+]
+
+
+
+def _dispatcher(binds: dict, delete_mode: str, output=None) -> BindDispatcher:
+  return BindDispatcher(compile_binds(binds), {'delete_mode': delete_mode, 'idle_time': 0}, output or RecordingOutput(log=False))
+
+
+@pytest.mark.parametrize('delete_mode', ('flush', 'postfix', 'keep'))
+@pytest.mark.parametrize('formula, moves', LAST_MOVE_BINDS)
+def test_bind_fires_on_its_last_move(delete_mode, formula, moves):
+  output = RecordingOutput(log=False)
+  dispatcher = _dispatcher({tuple(formula.split()): [['a']]}, delete_mode, output)
+  *before, last = moves.split()
+  dispatcher.handle_moves('TEST', before)
+  dispatcher.press_keys()
+  assert not output.events, 'fired too early'
+  dispatcher.handle_moves('TEST', [last])
+  dispatcher.press_keys()
+  assert output.events
+
+
+@pytest.mark.parametrize('formula, moves', STALE_BINDS)
+def test_bind_doesnt_fire_again(formula, moves):
+  dispatcher = _dispatcher({tuple(formula.split()): [['a']]}, 'keep')
+  fired = []
+  for move in moves.split():
+    dispatcher.handle_moves('TEST', [move])
+    fired.append(len(dispatcher.emulators['TEST'].schedule) // 2)
+  assert fired[-1] == fired[-2] == 1, fired
+
+
+def test_postfix_keeps_opposite_face():
+  # Postfix removes the bind and keeps the turn of the opposite face
+  dispatcher = _dispatcher({('F', 'R'): [['a']]}, 'postfix')
+  dispatcher.handle_moves('TEST', ['U', 'F', 'L', 'R'])
+  assert dispatcher.buffers['TEST'].names() == ['U', 'L']
+
+
+def test_combination_is_sent_in_one_batch():
+  output = RecordingOutput(log=False)
+  dispatcher = _dispatcher({('R',): [['ctrl', 'shift', 'S']]}, 'flush', output)
+  dispatcher.handle_moves('TEST', ['R'])
+  dispatcher.press_keys()
+  assert output.batches == 1
+  assert len(output.events) == 3
+  assert all(is_to_press for _, _, is_to_press in output.events)
+
+
+def test_state_bind_fires_when_the_cube_gets_solved():
+  dispatcher = _dispatcher({('@SOLVED',): [['a']]}, 'keep')
+  fired = []
+  for move in ('R', 'U', 'U\'', 'R\'', 'F'):
+    dispatcher.handle_moves('TEST', [move])
+    fired.append(len(dispatcher.emulators['TEST'].schedule) // 2)
+  assert fired == [0, 0, 0, 1, 1]
@@ -0,0 +1,20 @@
+import random
+
+from cube_state import CubeState
+from move_buffer import MOVE_CODES, TURN_NAMES, MoveBuffer
+
+
+
+def test_reduced_buffer_turns_the_cube_the_same():
+  count = 100000
+  moves = random.Random(0).choices(TURN_NAMES, k=count)
+  buffer = MoveBuffer(count)
+  for move in moves:
+    buffer.push(MOVE_CODES[move])
+  cube, buffer_cube = CubeState(), CubeState()
+  for move in moves:
+    cube.apply(move)
+  for move in buffer.names():
+    buffer_cube.apply(move)
+  assert len(buffer) < count
+  assert cube.hex() == buffer_cube.hex()
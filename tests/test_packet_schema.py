@@ -0,0 +1,13 @@
+import os
+
+from benchmark import _bit_string_move_gen4, _bit_string_moves_gen2
+from packet_schema import GEN2, GEN4
+
+
+
+def test_extractors_match_bit_string_parsing():
+  for _ in range(1000):
+    data = os.urandom(20)
+    if GEN4.move(data) is not None:
+      assert GEN4.move(data) == _bit_string_move_gen4(data)
+    assert [move(data) for move in GEN2.moves] == _bit_string_moves_gen2(data)
@@ -0,0 +1,53 @@
+from sequencer import MoveSequencer
+
+
+
+def _sequencer(timeout: float = 1.0):
+  requests, states = [], []
+  return MoveSequencer(lambda serial, count: requests.append((serial, count)), lambda: states.append(True), timeout), requests, states
+
+
+def test_moves_in_order_pass_through():
+  sequencer, requests, _ = _sequencer()
+  assert sequencer.push(254, 'R') == ['R']
+  assert sequencer.push(255, 'U') == ['U']
+  assert sequencer.push(0, 'F') == ['F']
+  assert sequencer.push(0, 'F') == []  # Duplicate
+  assert not requests
+
+
+def test_gap_is_held_back_until_history():
+  sequencer, requests, _ = _sequencer()
+  sequencer.push(1, 'R')
+  assert sequencer.push(3, 'U') == []
+  assert requests == [(2, 1)]
+  assert sequencer.push_history(3, ['U', 'L', 'R']) == ['L', 'U']
+  assert sequencer.stats() == {'gaps': 1, 'lost': 0, 'recovered': 1, 'pending': 0}
+
+
+def test_every_gap_is_requested():
+  sequencer, requests, _ = _sequencer()
+  sequencer.push(1, 'R')
+  sequencer.push(3, 'U')
+  sequencer.push(5, 'F')
+  assert requests == [(2, 1), (4, 1)]
+
+
+def test_skipped_serials_are_requested_again():
+  sequencer, requests, _ = _sequencer()
+  sequencer.push(1, 'R')
+  sequencer.push(4, 'U')
+  assert requests == [(3, 2)]
+  assert sequencer.push_history(3, ['L']) == []  # Serial 2 isn't covered
+  assert requests[-1] == (2, 1)
+  assert sequencer.push_history(2, ['B']) == ['B', 'L', 'U']
+
+
+def test_give_up_asks_for_the_state():
+  sequencer, requests, states = _sequencer(timeout=0.0)
+  sequencer.push(1, 'R')
+  sequencer.push(3, 'U')
+  sequencer.expire()
+  assert states == [True]
+  assert sequencer.stats() == {'gaps': 1, 'lost': 1, 'recovered': 0, 'pending': 0}
+  assert sequencer.push(4, 'F') == ['F']
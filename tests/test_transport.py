@@ -0,0 +1,32 @@
+from cube_state import RESYNC, STATE_PREFIX, CubeState
+from move_buffer import MOVE_CODES
+from transport import HEADER, FrameDecoder, FrameEncoder
+
+
+
+def test_round_trip():
+  encoder, decoder = FrameEncoder(), FrameDecoder()
+  state = CubeState()
+  state.apply('R')
+  data = encoder.encode(['R', 'U\'', 'F2'], 'CB01', 1.5) + encoder.encode([STATE_PREFIX + state.hex(), RESYNC], 'CB01', 2.0)
+  moves, resync = decoder.feed(data)
+  assert moves.cube_id == 'CB01' and moves.timestamp == 1.5
+  assert list(moves.codes) == [MOVE_CODES[move] for move in ('R', 'U\'', 'F2')]
+  assert resync.state.hex() == state.hex() and resync.resync
+  assert decoder.dropped == decoder.corrupted == 0
+
+
+def test_partial_frame_waits_for_the_rest():
+  encoder, decoder = FrameEncoder(), FrameDecoder()
+  data = encoder.encode(['R'], 'CB01')
+  assert decoder.feed(data[:HEADER.size]) == []
+  assert len(decoder.feed(data[HEADER.size:])) == 1
+
+
+def test_invalid_moves_are_dropped():
+  encoder, decoder = FrameEncoder(), FrameDecoder()
+  bad = bytearray(encoder.encode(['R'], 'CB01'))
+  bad[-1] = 0xFF
+  frames = decoder.feed(bytes(bad) + encoder.encode(['U'], 'CB01'))
+  assert [list(frame.codes) for frame in frames] == [[MOVE_CODES['U']]]
+  assert decoder.corrupted == 1